@@ -0,0 +1,122 @@
+"""
+Правила уведомлений о ценах.
+
+Виды правил на маршрут:
+    target   - цена не выше порога (threshold, руб)
+    drop_pct - цена ниже цены при добавлении на threshold процентов
+    low      - новый исторический минимум (правило по умолчанию)
+    median   - цена ниже медианы за 30 дней на threshold процентов
+
+После проверки цен все правила оцениваются разом: target/drop_pct/low -
+одним SQL-запросом, median - векторно в NumPy по дневным ценам.
+"""
+
+import logging
+from typing import List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+RULE_KINDS = ("target", "drop_pct", "low", "median")
+MEDIAN_DAYS = 30
+
+
+class FiredAlert(NamedTuple):
+    rule_id: Optional[int]
+    kind: str
+    threshold: Optional[float]
+    track: dict
+    user_id: int
+    price: float
+    reference: Optional[float]  # с чем сравнивали: порог, цена при добавлении, минимум, медиана
+
+
+def _track(track_id, route, date_from, date_to) -> dict:
+    return {'id': track_id, 'route': route, 'date_from': date_from, 'date_to': date_to}
+
+
+def group_medians(track_ids, prices):
+    """
+    Медиана цен по каждому маршруту за один проход.
+    
+    Returns:
+        (уникальные track_id, медианы) - массивы NumPy одинаковой длины
+    """
+    import numpy as np
+    
+    track_ids = np.asarray(track_ids, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    if track_ids.size == 0:
+        return track_ids, prices
+    
+    # Сортируем по маршруту, внутри маршрута - по цене
+    order = np.lexsort((prices, track_ids))
+    track_ids, prices = track_ids[order], prices[order]
+    
+    unique_ids, starts, counts = np.unique(track_ids, return_index=True, return_counts=True)
+    lower = starts + (counts - 1) // 2
+    upper = starts + counts // 2
+    return unique_ids, (prices[lower] + prices[upper]) / 2
+
+
+def _evaluate_median_rules(rules, daily_prices):
+    """Возвращает (сработавшие FiredAlert, id правил, условие которых больше не выполняется)"""
+    import numpy as np
+    
+    if not rules or not daily_prices:
+        return [], []
+    
+    day_ids, day_prices = zip(*daily_prices)
+    median_ids, medians = group_medians(day_ids, day_prices)
+    
+    rule_track_ids = np.array([rule[3] for rule in rules], dtype=np.int64)
+    thresholds = np.array([rule[1] or 0 for rule in rules], dtype=np.float64)
+    current = np.array([rule[8] for rule in rules], dtype=np.float64)
+    last_fired = np.array(
+        [np.nan if rule[2] is None else rule[2] for rule in rules], dtype=np.float64
+    )
+    
+    # Медиана для каждого правила (у маршрута может не быть дневных цен)
+    positions = np.searchsorted(median_ids, rule_track_ids)
+    positions = np.clip(positions, 0, len(median_ids) - 1)
+    has_median = median_ids[positions] == rule_track_ids
+    rule_medians = np.where(has_median, medians[positions], np.nan)
+    
+    condition = has_median & (current <= rule_medians * (1 - thresholds / 100))
+    fires = condition & (np.isnan(last_fired) | (current < last_fired))
+    released = ~condition & ~np.isnan(last_fired)
+    
+    alerts = []
+    for i in np.flatnonzero(fires):
+        rule = rules[i]
+        alerts.append(FiredAlert(
+            rule[0], "median", rule[1], _track(rule[3], rule[5], rule[6], rule[7]),
+            rule[4], rule[8], float(rule_medians[i])
+        ))
+    released_ids = [rules[i][0] for i in np.flatnonzero(released)]
+    return alerts, released_ids
+
+
+def evaluate_rules(db, track_ids: List[int]) -> List[FiredAlert]:
+    """
+    Оценивает все правила по маршрутам track_ids, только что получившим цену,
+    и отмечает сработавшие, чтобы не присылать одно и то же повторно.
+    """
+    if not track_ids:
+        return []
+    
+    alerts = [
+        FiredAlert(rule_id, kind, threshold, _track(track_id, route, date_from, date_to),
+                   user_id, price, reference)
+        for (rule_id, kind, threshold, track_id, user_id, route,
+             date_from, date_to, price, reference) in db.get_firing_rules(track_ids)
+    ]
+    
+    median_rules, daily_prices = db.get_median_rule_inputs(track_ids, MEDIAN_DAYS)
+    median_alerts, released_median_ids = _evaluate_median_rules(median_rules, daily_prices)
+    alerts.extend(median_alerts)
+    
+    db.mark_rules_fired([(a.rule_id, a.price) for a in alerts if a.rule_id is not None])
+    db.reset_released_rules(track_ids, released_median_ids)
+    
+    logger.info(f"Правила уведомлений: сработало {len(alerts)}")
+    return alerts
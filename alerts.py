@@ -0,0 +1,200 @@
+"""
+Уведомления о падении цен.
+
+Во время проверки уведомления копятся по пользователям и отправляются
+одним сообщением-дайджестом (с разбиением по лимиту Telegram в 4096 символов).
+Если задан ALERT_IMMEDIATE_DROP_PERCENT, падения не меньше этого процента
+отправляются сразу отдельным сообщением.
+"""
+
+import logging
+import os
+from typing import Dict, List, Optional
+
+from alert_rules import evaluate_rules
+from analytics import format_buy_hint
+from keyboards import get_main_keyboard
+from utils.routes import format_track_route
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+def _immediate_threshold() -> Optional[float]:
+    value = os.getenv("ALERT_IMMEDIATE_DROP_PERCENT")
+    return float(value) if value else None
+
+
+def format_drop_alert(track: dict, old_price: float, new_price: float) -> str:
+    """Блок уведомления об одном маршруте"""
+    return (
+        f"📍 {format_track_route(track)}\n"
+        f"📉 Было: {old_price:.2f} руб\n"
+        f"📊 Стало: {new_price:.2f} руб\n"
+        f"💰 Экономия: {old_price - new_price:.2f} руб"
+    )
+
+
+def format_rule_alert(alert) -> str:
+    """Блок уведомления о сработавшем правиле (alert_rules.FiredAlert)"""
+    if alert.kind == "low":
+        return format_drop_alert(alert.track, alert.reference, alert.price)
+    
+    route = f"📍 {format_track_route(alert.track)}\n"
+    if alert.kind == "target":
+        return (
+            route +
+            f"🎯 Цена достигла цели {alert.threshold:.2f} руб\n"
+            f"📊 Сейчас: {alert.price:.2f} руб"
+        )
+    if alert.kind == "drop_pct":
+        drop = (alert.reference - alert.price) / alert.reference * 100
+        return (
+            route +
+            f"📉 Дешевле, чем при добавлении, на {drop:.1f}%\n"
+            f"📊 Было: {alert.reference:.2f} руб, стало: {alert.price:.2f} руб"
+        )
+    drop = (alert.reference - alert.price) / alert.reference * 100
+    return (
+        route +
+        f"📊 На {drop:.1f}% ниже медианы за 30 дней ({alert.reference:.2f} руб)\n"
+        f"💰 Сейчас: {alert.price:.2f} руб"
+    )
+
+
+def split_message(header: str, blocks: List[str], limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """
+    Склеивает блоки в сообщения не длиннее limit.
+    Блок разрезается только если он сам длиннее лимита.
+    """
+    messages = []
+    current = header
+    current_has_blocks = False
+    for block in blocks:
+        separator = "\n\n" if current else ""
+        if len(current) + len(separator) + len(block) <= limit:
+            current += separator + block
+            current_has_blocks = True
+            continue
+        
+        if current_has_blocks:
+            messages.append(current)
+        elif current:
+            # Заголовок не отправляем отдельным сообщением
+            block = current + separator + block
+        while len(block) > limit:
+            messages.append(block[:limit])
+            block = block[limit:]
+        current = block
+        current_has_blocks = True
+    
+    if current:
+        messages.append(current)
+    return messages
+
+
+async def send_alert_message(bot, user_id: int, text: str) -> bool:
+    try:
+        await bot.send_message(
+            chat_id=user_id,
+            text=text,
+            reply_markup=get_main_keyboard()
+        )
+        return True
+    except Exception:
+        logger.warning(f"Не удалось отправить сообщение пользователю {user_id}")
+        return False
+
+
+class AlertDigest:
+    """Копит уведомления за проверку и отправляет их дайджестами по пользователям"""
+    
+    def __init__(self, immediate_drop_percent: Optional[float] = None):
+        if immediate_drop_percent is None:
+            immediate_drop_percent = _immediate_threshold()
+        self.immediate_drop_percent = immediate_drop_percent
+        self._pending: Dict[int, List[str]] = {}
+        self.alerts = 0
+        self.messages_sent = 0
+    
+    def is_immediate(self, old_price: float, new_price: float) -> bool:
+        if self.immediate_drop_percent is None or not old_price:
+            return False
+        return (old_price - new_price) / old_price * 100 >= self.immediate_drop_percent
+    
+    async def add_drop(self, bot, user_id: int, track: dict, old_price: float, new_price: float):
+        """Добавляет падение цены в дайджест или отправляет сразу, если оно крупное"""
+        await self.add_block(bot, user_id, format_drop_alert(track, old_price, new_price),
+                             old_price, new_price)
+    
+    async def add_rule_alert(self, bot, alert, hint: str = ""):
+        """Добавляет сработавшее правило (alert_rules.FiredAlert) с подсказкой аналитики"""
+        block = format_rule_alert(alert)
+        if hint:
+            block += f"\n{hint}"
+        await self.add_block(bot, alert.user_id, block, alert.reference, alert.price)
+    
+    async def add_block(self, bot, user_id: int, block: str,
+                        old_price: Optional[float], new_price: float):
+        self.alerts += 1
+        
+        if self.is_immediate(old_price, new_price):
+            if await send_alert_message(bot, user_id, f"🎉 Цена упала!\n\n{block}"):
+                self.messages_sent += 1
+            return
+        
+        self._pending.setdefault(user_id, []).append(block)
+    
+    async def flush_user(self, bot, user_id: int):
+        """Отправляет накопленный дайджест пользователя"""
+        blocks = self._pending.pop(user_id, None)
+        if not blocks:
+            return
+        
+        if len(blocks) == 1:
+            header = "🎉 Цена упала!"
+        else:
+            header = f"🎉 Цены упали на {len(blocks)} маршрутах!"
+        
+        for text in split_message(header, blocks):
+            if await send_alert_message(bot, user_id, text):
+                self.messages_sent += 1
+    
+    async def flush_all(self, bot):
+        for user_id in list(self._pending):
+            await self.flush_user(bot, user_id)
+
+
+async def publish_prices(bot, store, observations: List[tuple],
+                         digest: Optional[AlertDigest] = None) -> List[tuple]:
+    """
+    Публикует свежие цены всем подписчикам маршрутов (store.publish_prices)
+    и рассылает сработавшие правила уведомлений обычным путем - через дайджест.
+    observations - [(route_key, date_from, date_to, цена, источник), ...].
+    Если digest передан, отправлять его должен вызывающий код.
+    
+    Returns:
+        [(track_id, цена), ...] - обновленные маршруты всех пользователей
+    """
+    if not observations:
+        return []
+    
+    own_digest = digest is None
+    if own_digest:
+        digest = AlertDigest()
+    
+    updated = store.publish_prices(observations)
+    try:
+        # Правила оцениваем по маршрутам этой публикации, а не по времени:
+        # у времени базы секундная точность, и публикации в одну секунду
+        # видели бы цены друг друга и присылали одно падение дважды
+        alerts = evaluate_rules(store, [track_id for track_id, _ in updated])
+        analytics = store.get_route_analytics(list({alert.track['id'] for alert in alerts}))
+        for alert in alerts:
+            hint = format_buy_hint(analytics.get(alert.track['id']))
+            await digest.add_rule_alert(bot, alert, hint)
+    finally:
+        if own_digest:
+            await digest.flush_all(bot)
+    return updated
@@ -0,0 +1,178 @@
+"""
+Ночная аналитика цен по маршрутам.
+
+Для каждого маршрута история за последние ANALYTICS_WINDOW_DAYS дней
+читается пачками и обрабатывается NumPy с накоплением итогов, поэтому
+память не зависит от размера истории:
+    - волатильность: стандартное отклонение лог-доходностей цены, %
+    - сезонность по дням недели: отклонение средней цены дня от общей средней
+    - перцентиль текущей цены среди наблюдений окна
+Старые наблюдения в окно не входят: цены полугодовой давности ничего
+не говорят о том, дешево ли сейчас. Маршруты с одним ключом и датами
+у разных пользователей получают одни и те же цены, поэтому итоги
+считаются один раз на группу и записываются каждому маршруту.
+Итоги пишутся в таблицу route_analytics и используются как подсказки
+"хорошее время для покупки" в /list и уведомлениях.
+
+NumPy импортируется внутри функций, чтобы подсказки можно было
+показывать без загрузки NumPy в процесс бота.
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+from database import Database, shard_paths
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.getenv("ANALYTICS_CHUNK_SIZE", "10000"))
+WINDOW_DAYS = int(os.getenv("ANALYTICS_WINDOW_DAYS", "60"))
+WRITE_BATCH = 500
+MIN_SAMPLES = 10       # меньше наблюдений - сигнал не выдаем
+BUY_PERCENTILE = 20.0  # цена дешевле 80% наблюдений - хорошее время для покупки
+MIN_WEEKDAYS = 3
+
+WEEKDAY_NAMES = ["вс", "пн", "вт", "ср", "чт", "пт", "сб"]
+
+
+class RouteAccumulator:
+    """Потоковые итоги по истории одного маршрута"""
+    
+    __slots__ = ("current_price", "count", "below", "equal", "last_price",
+                 "returns_count", "returns_sum", "returns_sq_sum",
+                 "weekday_sums", "weekday_counts")
+    
+    def __init__(self, current_price: float):
+        import numpy as np
+        
+        self.current_price = current_price
+        self.count = 0
+        self.below = 0
+        self.equal = 0
+        self.last_price: Optional[float] = None
+        self.returns_count = 0
+        self.returns_sum = 0.0
+        self.returns_sq_sum = 0.0
+        self.weekday_sums = np.zeros(7)
+        self.weekday_counts = np.zeros(7, dtype=np.int64)
+    
+    def add_chunk(self, weekdays, prices):
+        """weekdays, prices - массивы NumPy одной пачки истории"""
+        import numpy as np
+        
+        valid = prices > 0
+        weekdays, prices = weekdays[valid], prices[valid]
+        if prices.size == 0:
+            return
+        
+        self.count += prices.size
+        self.below += int(np.count_nonzero(prices < self.current_price))
+        self.equal += int(np.count_nonzero(prices == self.current_price))
+        
+        # Лог-доходности, включая переход с прошлой пачки
+        log_prices = np.log(prices)
+        if self.last_price is not None:
+            log_prices = np.concatenate(([np.log(self.last_price)], log_prices))
+        returns = np.diff(log_prices)
+        self.returns_count += returns.size
+        self.returns_sum += float(returns.sum())
+        self.returns_sq_sum += float(np.dot(returns, returns))
+        self.last_price = float(prices[-1])
+        
+        self.weekday_sums += np.bincount(weekdays, weights=prices, minlength=7)
+        self.weekday_counts += np.bincount(weekdays, minlength=7)
+    
+    def result(self, track_id: int) -> Optional[tuple]:
+        """Строка для Database.save_route_analytics"""
+        import numpy as np
+        
+        if not self.count:
+            return None
+        
+        volatility = None
+        if self.returns_count > 1:
+            mean = self.returns_sum / self.returns_count
+            variance = (self.returns_sq_sum - self.returns_count * mean * mean) / (self.returns_count - 1)
+            volatility = float(np.sqrt(max(variance, 0.0)) * 100)
+        
+        percentile = (self.below + 0.5 * self.equal) / self.count * 100
+        
+        overall_mean = self.weekday_sums.sum() / self.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weekday_means = self.weekday_sums / self.weekday_counts
+        profile = [
+            round(float(m / overall_mean - 1) * 100, 2) if c else None
+            for m, c in zip(weekday_means, self.weekday_counts)
+        ]
+        # Лучший день недели имеет смысл, только если наблюдения есть в разные дни
+        best_weekday = None
+        if np.count_nonzero(self.weekday_counts) >= MIN_WEEKDAYS:
+            best_weekday = int(np.nanargmin(weekday_means))
+        
+        buy_signal = self.count >= MIN_SAMPLES and percentile <= BUY_PERCENTILE
+        return (track_id, self.count, volatility, percentile,
+                json.dumps(profile), best_weekday, int(buy_signal))
+
+
+def run_analytics(db_name: str, chunk_size: int = CHUNK_SIZE,
+                  window_days: int = WINDOW_DAYS) -> int:
+    """
+    Пересчитывает аналитику всех активных маршрутов (во всех шардах базы)
+    по наблюдениям за последние window_days дней.
+    Работает в своем соединении, чтобы его можно было запускать в потоке.
+    
+    Returns:
+        Число обработанных маршрутов
+    """
+    started = time.perf_counter()
+    processed = sum(_run_file(path, chunk_size, window_days) for path in shard_paths(db_name))
+    
+    logger.info(f"📈 Аналитика пересчитана: маршрутов {processed} "
+                f"за {time.perf_counter() - started:.1f} с")
+    return processed
+
+
+def _run_file(db_name: str, chunk_size: int, window_days: int) -> int:
+    store = Database(db_name)
+    processed = 0
+    pending = []
+    
+    try:
+        for batch in store.iter_active_routes_with_price():
+            for history_id, current_price, track_ids in batch:
+                accumulator = RouteAccumulator(current_price)
+                for weekdays, prices in store.iter_price_arrays(history_id, chunk_size,
+                                                                window_days):
+                    accumulator.add_chunk(weekdays, prices)
+                
+                # Итоги группы - каждому маршруту с тем же ключом и датами
+                row = accumulator.result(history_id)
+                for track_id in track_ids.split(','):
+                    if row:
+                        pending.append((int(track_id),) + row[1:])
+                    processed += 1
+                
+                if len(pending) >= WRITE_BATCH:
+                    store.save_route_analytics(pending)
+                    pending = []
+        
+        if pending:
+            store.save_route_analytics(pending)
+    finally:
+        store.close()
+    
+    return processed
+
+
+def format_buy_hint(analytics: Optional[dict]) -> str:
+    """Подсказка для /list и уведомлений (пустая строка, если сказать нечего)"""
+    if not analytics or not analytics['buy_signal']:
+        return ""
+    
+    hint = f"🔥 Хорошее время для покупки: дешевле {int(100 - analytics['percentile'])}% наблюдений"
+    if analytics['best_weekday'] is not None:
+        hint += f", обычно дешевле всего в {WEEKDAY_NAMES[analytics['best_weekday']]}"
+    return hint
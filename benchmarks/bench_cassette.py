@@ -0,0 +1,88 @@
+"""
+Проверка кассеты под параллельной нагрузкой: запись, затем воспроизведение.
+
+Несколько потоков одновременно пишут ответы в кассету через
+RecordingTransport (как PriceFanout и parser.leg_pool), затем кассета
+читается заново и воспроизводится тоже из нескольких потоков.
+Проверяется, что файл не поврежден, все ответы на месте и при
+воспроизведении каждый записанный ответ отдан ровно один раз.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_cassette
+"""
+
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from providers.cassette import Cassette, RecordingTransport, ReplayTransport
+
+THREADS = 16
+KEYS = 20
+REQUESTS_PER_KEY = 50
+URL = "https://api.example/prices"
+
+
+class CountingTransport:
+    """Поддельный API: каждый ответ со своим номером"""
+
+    def __init__(self):
+        self.numbers = itertools.count(1)
+
+    def get_json(self, url: str, params: dict, timeout: float = 15) -> dict:
+        return {"route": params["route"], "n": next(self.numbers), "padding": "x" * 200}
+
+
+def requests_plan():
+    return [{"route": f"R{key}", "token": "secret"}
+            for _ in range(REQUESTS_PER_KEY) for key in range(KEYS)]
+
+
+def main() -> int:
+    workdir = tempfile.mkdtemp(prefix="bench_cassette_")
+    path = os.path.join(workdir, "prices.jsonl.gz")
+    plan = requests_plan()
+    try:
+        cassette = Cassette(path)
+        recorder = RecordingTransport(CountingTransport(), cassette)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(THREADS) as pool:
+            recorded = list(pool.map(lambda params: recorder.get_json(URL, params), plan))
+        cassette.close()
+        record_time = time.perf_counter() - started
+
+        loaded = Cassette(path).load()
+        problems = []
+        if len(loaded) != len(plan):
+            problems.append(f"в файле {len(loaded)} записей из {len(plan)}")
+
+        replayer = ReplayTransport(loaded)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(THREADS) as pool:
+            replayed = list(pool.map(lambda params: replayer.get_json(URL, params), plan))
+        replay_time = time.perf_counter() - started
+
+        # Каждая запись кассеты должна вернуться ровно один раз
+        as_key = lambda response: (response["route"], response["n"])
+        if Counter(map(as_key, replayed)) != Counter(map(as_key, recorded)):
+            problems.append("воспроизведение отдало ответы не по одному разу")
+
+        print(f"Кассета: {len(plan)} ответов, {THREADS} потоков, "
+              f"{os.path.getsize(path) / 1024:.0f} КБ")
+        print(f"  запись {record_time * 1000:.0f} мс, воспроизведение {replay_time * 1000:.0f} мс")
+        for problem in problems:
+            print(f"❌ {problem}")
+        if not problems:
+            print("✅ Кассета цела, каждый ответ воспроизведен один раз")
+        return 1 if problems else 0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
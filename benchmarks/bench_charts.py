@@ -0,0 +1,67 @@
+"""
+Бенчмарк графиков: время рендера и доля попаданий в кеш.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_charts
+"""
+
+import asyncio
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+from charts import ChartCache
+
+ROUTES = 20
+REQUESTS = 500
+HISTORY_DAYS = 180
+NEW_PRICE_PROBABILITY = 0.05
+
+
+def make_points(days: int):
+    start = date.today() - timedelta(days=days)
+    price = 10000.0
+    points = []
+    for i in range(days):
+        price = max(1000.0, price + random.uniform(-500, 500))
+        points.append(((start + timedelta(days=i)).isoformat(), price))
+    return points
+
+
+async def run():
+    random.seed(42)
+    histories = {f"route-{i}": make_points(HISTORY_DAYS) for i in range(ROUTES)}
+    versions = {key: 1 for key in histories}
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ChartCache(cache_dir=cache_dir)
+        render_times = []
+        started = time.perf_counter()
+        
+        for _ in range(REQUESTS):
+            # Популярные маршруты запрашивают чаще (как у многих пользователей)
+            key = f"route-{min(int(random.expovariate(0.3)), ROUTES - 1)}"
+            if random.random() < NEW_PRICE_PROBABILITY:
+                versions[key] += 1
+            
+            misses_before = cache.misses
+            request_started = time.perf_counter()
+            await cache.get_chart(key, key, versions[key], lambda: histories[key])
+            if cache.misses > misses_before:
+                render_times.append(time.perf_counter() - request_started)
+        
+        total = time.perf_counter() - started
+        cache.shutdown()
+    
+    render_times.sort()
+    print(f"Запросов: {REQUESTS}, маршрутов: {ROUTES}, точек на график: {HISTORY_DAYS}")
+    print(f"Рендеров: {len(render_times)}, попаданий: {cache.hits}, hit rate: {cache.hit_rate:.1%}")
+    if render_times:
+        print(f"Рендер: медиана {render_times[len(render_times) // 2] * 1000:.1f} мс, "
+              f"максимум {render_times[-1] * 1000:.1f} мс")
+    print(f"Всего: {total:.2f} с, в среднем {total / REQUESTS * 1000:.2f} мс на запрос")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,120 @@
+"""
+Бенчмарк обработки апдейтов под смешанной нагрузкой.
+
+Сравнивает последовательную обработку (как раньше) с PerUserUpdateProcessor:
+часть апдейтов - медленная проверка цен, остальные - быстрые команды.
+Также проверяет, что апдейты одного пользователя выполнились по порядку
+и что очередь одного пользователя, часто жмущего кнопку проверки,
+не занимает общий лимит одновременных апдейтов.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_concurrency
+"""
+
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+from utils.concurrency import PerUserUpdateProcessor
+
+USERS = 50
+UPDATES_PER_USER = 10
+SLOW_SHARE = 0.2
+SLOW_SECONDS = 0.2   # "💰 Проверить цены": запросы к API
+FAST_SECONDS = 0.002  # /start, /list и т.п.
+NOISY_UPDATES = 40    # нажатий "Проверить цены" подряд от одного пользователя
+NOISY_LIMIT = 8       # общий лимит одновременных апдейтов в этом сценарии
+
+
+def make_updates():
+    random.seed(1)
+    updates = []
+    for seq in range(UPDATES_PER_USER):
+        for user_id in range(USERS):
+            slow = random.random() < SLOW_SHARE
+            updates.append(SimpleNamespace(
+                effective_user=SimpleNamespace(id=user_id),
+                effective_chat=SimpleNamespace(id=user_id),
+                seq=seq,
+                duration=SLOW_SECONDS if slow else FAST_SECONDS,
+            ))
+    return updates
+
+
+async def handle(update, log, latencies, received_at):
+    await asyncio.sleep(update.duration)
+    log.setdefault(update.effective_user.id, []).append(update.seq)
+    latencies.append(time.perf_counter() - received_at)
+
+
+async def run_sequential(updates):
+    log, latencies = {}, []
+    started = time.perf_counter()
+    for update in updates:
+        await handle(update, log, latencies, started)
+    return time.perf_counter() - started, log, latencies
+
+
+async def run_concurrent(updates):
+    processor = PerUserUpdateProcessor(256)
+    log, latencies = {}, []
+    started = time.perf_counter()
+    # Как Application: на каждый апдейт - отдельная задача в порядке поступления
+    tasks = [
+        asyncio.create_task(
+            processor.process_update(update, handle(update, log, latencies, started))
+        )
+        for update in updates
+    ]
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - started, log, latencies
+
+
+async def run_noisy_user():
+    """Быстрые команды остальных пользователей после очереди медленных апдейтов одного"""
+    processor = PerUserUpdateProcessor(NOISY_LIMIT)
+    log, latencies, others = {}, [], []
+
+    def make(user_id, seq, duration):
+        return SimpleNamespace(effective_user=SimpleNamespace(id=user_id),
+                               effective_chat=SimpleNamespace(id=user_id),
+                               seq=seq, duration=duration)
+
+    noisy = [make(0, seq, SLOW_SECONDS) for seq in range(NOISY_UPDATES)]
+    fast = [make(user_id, 0, FAST_SECONDS) for user_id in range(1, USERS + 1)]
+    started = time.perf_counter()
+    submit = lambda update, sink: asyncio.create_task(
+        processor.process_update(update, handle(update, log, sink, started))
+    )
+    tasks = [submit(update, latencies) for update in noisy]
+    await asyncio.sleep(0)
+    tasks += [submit(update, others) for update in fast]
+    await asyncio.gather(*tasks)
+    others.sort()
+    return others[-1]
+
+
+def report(name, elapsed, log, latencies, total):
+    latencies.sort()
+    ordered = all(seqs == sorted(seqs) for seqs in log.values())
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name}: {elapsed:.2f} с, {total / elapsed:.1f} апд/с, "
+          f"задержка p50 {p50 * 1000:.0f} мс, p99 {p99 * 1000:.0f} мс, "
+          f"порядок по пользователю: {'✅' if ordered else '❌'}")
+
+
+async def main():
+    updates = make_updates()
+    print(f"Пользователей: {USERS}, апдейтов: {len(updates)}, медленных: {SLOW_SHARE:.0%}")
+    report("Последовательно", *await run_sequential(updates), len(updates))
+    report("Параллельно   ", *await run_concurrent(updates), len(updates))
+    worst = await run_noisy_user()
+    print(f"Один пользователь поставил в очередь {NOISY_UPDATES} медленных апдейтов "
+          f"(лимит {NOISY_LIMIT}): остальные ждали не больше {worst * 1000:.0f} мс "
+          f"{'✅' if worst < SLOW_SECONDS else '❌'}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
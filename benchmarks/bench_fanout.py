@@ -0,0 +1,49 @@
+"""
+Проверка PriceFanout с зависшим источником.
+
+Быстрый источник опрашивается вместе с источником, который отвечает
+дольше дедлайна. Все ответы должны приходить от быстрого источника
+не позже дедлайна - даже когда потоки медленного источника уже заняты
+зависшими запросами.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_fanout
+"""
+
+import logging
+import sys
+import time
+
+from providers.base import StubProvider
+from providers.fanout import PriceFanout
+
+CALLS = 20
+DEADLINE = 0.5
+SLOW_SECONDS = 5
+WORKERS = 4
+
+
+def main() -> int:
+    logging.disable(logging.WARNING)  # предупреждения о пропущенном источнике ожидаемы
+    fanout = PriceFanout(
+        [StubProvider("fast", lambda route: 1000.0),
+         StubProvider("slow", lambda route: 500.0, delay=SLOW_SECONDS)],
+        deadline=DEADLINE, max_workers=WORKERS
+    )
+    answered, worst = 0, 0.0
+    for _ in range(CALLS):
+        started = time.perf_counter()
+        quote = fanout.get_best_price("Москва-Сочи")
+        worst = max(worst, time.perf_counter() - started)
+        answered += quote is not None and quote.provider == "fast"
+    fanout.shutdown()
+    logging.disable(logging.NOTSET)
+
+    ok = answered == CALLS and worst < DEADLINE * 1.5
+    print(f"{'✅' if ok else '❌'} Быстрый источник ответил {answered} из {CALLS} раз, "
+          f"самый долгий запрос {worst * 1000:.0f} мс (дедлайн {DEADLINE * 1000:.0f} мс)")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
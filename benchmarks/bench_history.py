@@ -0,0 +1,89 @@
+"""
+Бенчмарк хранения истории цен: таблица price_history против сегментов.
+
+Создает две временные базы с одинаковой историей (TRACKS маршрутов по
+OBSERVATIONS наблюдений - примерно год проверок по адаптивному расписанию),
+сравнивает место на диске и время полного чтения истории в NumPy,
+как это делает ночная аналитика.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_history
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from database import Database
+from history_store import SegmentStore, history_dir
+
+TRACKS = 200
+OBSERVATIONS = 2000
+CHUNK_SIZE = 10000
+
+
+def disk_usage(path: str) -> int:
+    if os.path.isdir(path):
+        return SegmentStore(path, readonly=True).disk_usage()
+    total = 0
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            total += os.stat(path + suffix).st_blocks * 512
+    return total
+
+
+def fill(store: Database):
+    random.seed(1)
+    track_ids = [store.add_track(user_id, f"Москва-Город{user_id}")
+                 for user_id in range(1, TRACKS + 1)]
+    # Каждый проход - одна проверка всех маршрутов, как в scheduled_check
+    for _ in range(OBSERVATIONS):
+        store.update_prices([(track_id, random.uniform(3000, 20000), "bench")
+                             for track_id in track_ids])
+    store.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return track_ids
+
+
+def scan(store: Database, track_ids) -> float:
+    started = time.perf_counter()
+    total = 0.0
+    for track_id in track_ids:
+        for _, prices in store.iter_price_arrays(track_id, CHUNK_SIZE):
+            total += float(prices.sum())
+    return time.perf_counter() - started
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix="bench_history_")
+    try:
+        results = {}
+        for backend in ("sqlite", "segments"):
+            db_name = os.path.join(workdir, f"{backend}.db")
+            store = Database(db_name, history_backend=backend)
+            track_ids = fill(store)
+            elapsed = scan(store, track_ids)
+            store.close()
+            results[backend] = (disk_usage(db_name), disk_usage(history_dir(db_name)), elapsed)
+
+        observations = TRACKS * OBSERVATIONS
+        base_size = results["segments"][0]  # та же база без строк price_history
+        history_sqlite = results["sqlite"][0] - base_size
+        history_segments = results["segments"][1]
+
+        print(f"История: {TRACKS} маршрутов x {OBSERVATIONS} наблюдений")
+        print(f"  price_history: {history_sqlite / 1024:8.0f} КБ "
+              f"({history_sqlite / observations:.1f} байт/наблюдение), "
+              f"чтение {results['sqlite'][2] * 1000:.0f} мс")
+        print(f"  сегменты:      {history_segments / 1024:8.0f} КБ "
+              f"({history_segments / observations:.1f} байт/наблюдение), "
+              f"чтение {results['segments'][2] * 1000:.0f} мс")
+        print(f"  меньше на диске в {history_sqlite / history_segments:.1f} раза, "
+              f"чтение быстрее в {results['sqlite'][2] / results['segments'][2]:.1f} раза")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
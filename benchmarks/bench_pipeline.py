@@ -0,0 +1,48 @@
+"""
+Прогон полного цикла проверки цен (get_price + update_price) по списку маршрутов.
+
+Детерминированный офлайн-прогон по кассете:
+    PRICE_PROVIDER_MODE=replay PRICE_CASSETTE=cassettes/prices.jsonl.gz \
+        python -m benchmarks.bench_pipeline
+
+Запись кассеты с реального API (нужен AVIASALES_API_KEY):
+    PRICE_PROVIDER_MODE=record python -m benchmarks.bench_pipeline
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from database import Database
+from parser import get_available_routes, get_price, get_provider_mode
+
+USERS = 50
+
+
+def run(routes):
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_db = Database(os.path.join(tmp, "bench.db"))
+        tracks = [
+            (bench_db.add_track(user_id, route), route)
+            for user_id in range(USERS)
+            for route in routes
+        ]
+        
+        started = time.perf_counter()
+        prices = {}
+        for track_id, route in tracks:
+            price = get_price(route)
+            prices[route] = price
+            bench_db.update_price(track_id, price)
+        elapsed = time.perf_counter() - started
+        bench_db.conn.close()
+    
+    print(f"Режим: {get_provider_mode()}, маршрутов: {len(routes)}, проверок: {len(tracks)}")
+    print(f"Время: {elapsed:.3f} с, {elapsed / len(tracks) * 1000:.2f} мс на проверку")
+    for route in routes:
+        print(f"  {route}: {prices[route]}")
+
+
+if __name__ == "__main__":
+    run(sys.argv[1:] or get_available_routes())
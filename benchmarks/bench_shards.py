@@ -0,0 +1,64 @@
+"""
+Бенчмарк пропускной способности записи цен в зависимости от числа шардов.
+
+Для каждого числа шардов создается временная база с USERS пользователями
+по одному маршруту, затем ROUNDS раз прогоняется проверка всех маршрутов:
+цены пишутся пачками по BATCH (как приходят ответы API), каждая пачка -
+update_prices, то есть по одной транзакции в каждом затронутом шарде,
+шарды пишутся параллельно.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_shards
+    BENCH_DB_DIR=/var/tmp python -m benchmarks.bench_shards  # диск вместо tmpfs
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from database import open_database
+
+USERS = 400
+ROUNDS = 5
+BATCH = int(os.getenv("BENCH_BATCH", "20"))
+SHARD_COUNTS = (1, 2, 4, 8)
+
+
+def run(shards: int, workdir: str) -> float:
+    db_name = os.path.join(workdir, f"bench_{shards}.db")
+    store = open_database(db_name, shards)
+    try:
+        track_ids = [store.add_track(user_id, f"Москва-Город{user_id % 50}")
+                     for user_id in range(1, USERS + 1)]
+
+        random.seed(1)
+        updates = [(track_id, random.uniform(3000, 20000), "bench")
+                   for _ in range(ROUNDS) for track_id in track_ids]
+
+        started = time.perf_counter()
+        for i in range(0, len(updates), BATCH):
+            store.update_prices(updates[i:i + BATCH])
+        elapsed = time.perf_counter() - started
+    finally:
+        store.close()
+
+    return len(updates) / elapsed
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix="bench_shards_", dir=os.getenv("BENCH_DB_DIR"))
+    try:
+        print(f"Запись {USERS * ROUNDS} цен пачками по {BATCH} ({workdir})")
+        baseline = None
+        for shards in SHARD_COUNTS:
+            throughput = run(shards, workdir)
+            baseline = baseline or throughput
+            print(f"  шардов {shards}: {throughput:8.0f} цен/с  (x{throughput / baseline:.2f})")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
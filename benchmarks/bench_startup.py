@@ -0,0 +1,99 @@
+"""
+Бенчмарк времени запуска: импорт модулей через python -X importtime.
+
+Каждый модуль импортируется в отдельном процессе из пустой временной папки.
+Проверяется бюджет времени импорта и отсутствие побочных эффектов:
+файл базы не создается, тяжелые зависимости не загружаются.
+Код возврата 1, если хоть одна проверка не прошла.
+Входит в общий прогон проверок python -m benchmarks.check.
+
+Бюджеты заданы для обычной машины разработчика; на медленной машине CI
+их можно умножить: STARTUP_BUDGET_SCALE=2.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_startup
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модуль -> бюджет на импорт в миллисекундах
+BUDGETS_MS = {
+    "database": 30,
+    "parser": 50,
+    "charts": 30,
+    "bot": 600,  # включает импорт python-telegram-bot
+}
+
+# Модули, которые не должны загружаться при импорте
+FORBIDDEN_IMPORTS = ["requests", "dotenv", "matplotlib", "numpy"]
+
+RUNS = 5
+BUDGET_SCALE = float(os.getenv("STARTUP_BUDGET_SCALE", "1"))
+
+
+def measure_import(module: str, cwd: str):
+    """Возвращает (время импорта в мс, загруженные запрещенные модули)"""
+    code = (
+        f"import {module}, sys; "
+        f"print(','.join(m for m in {FORBIDDEN_IMPORTS!r} if m in sys.modules))"
+    )
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    
+    cumulative_us = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = [part.strip() for part in line[len("import time:"):].split("|")]
+        if parts[2] == module:
+            cumulative_us = int(parts[1])
+    
+    loaded = [name for name in result.stdout.strip().split(",") if name]
+    return (cumulative_us or 0) / 1000, loaded
+
+
+def run() -> bool:
+    ok = True
+    for module, budget in BUDGETS_MS.items():
+        budget *= BUDGET_SCALE
+        with tempfile.TemporaryDirectory() as cwd:
+            try:
+                timings = []
+                for _ in range(RUNS):
+                    elapsed, loaded = measure_import(module, cwd)
+                    timings.append(elapsed)
+            except RuntimeError as e:
+                # Модуль, который не импортируется, - провал, а не пропуск
+                print(f"❌ {module}: не импортируется ({e})")
+                ok = False
+                continue
+            
+            created = os.listdir(cwd)
+        
+        best = min(timings)
+        problems = []
+        if best > budget:
+            problems.append(f"бюджет {budget:g} мс превышен")
+        if loaded:
+            problems.append(f"загружены {', '.join(loaded)}")
+        if created:
+            problems.append(f"созданы файлы {', '.join(created)}")
+        
+        status = "❌" if problems else "✅"
+        print(f"{status} {module}: {best:.1f} мс (бюджет {budget:g} мс) {'; '.join(problems)}")
+        ok = ok and not problems
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run() else 1)
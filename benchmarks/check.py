@@ -0,0 +1,42 @@
+"""
+Все проверки с результатом "прошла / не прошла" одним запуском - для CI
+и перед слиянием. Код возврата 1, если хоть одна проверка не прошла.
+
+    - bench_startup: время импорта модулей и отсутствие побочных эффектов
+    - bench_cassette: запись и воспроизведение кассеты из нескольких потоков
+    - bench_fanout: зависший источник цен не мешает остальным
+
+Остальные бенчмарки только печатают замеры, soak идет часами - их
+запускают отдельно.
+
+Запуск из корня проекта:
+    python -m benchmarks.check
+"""
+
+import sys
+
+from benchmarks import bench_cassette, bench_fanout, bench_startup
+
+CHECKS = [
+    ("Время запуска", bench_startup.run),
+    ("Кассета", lambda: bench_cassette.main() == 0),
+    ("Зависший источник цен", lambda: bench_fanout.main() == 0),
+]
+
+
+def main() -> int:
+    failed = []
+    for name, check in CHECKS:
+        print(f"== {name}")
+        if not check():
+            failed.append(name)
+    print()
+    if failed:
+        print(f"❌ Не прошли: {', '.join(failed)}")
+        return 1
+    print("✅ Все проверки прошли")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,364 @@
+"""
+Долгий прогон бота (soak-тест): утечки памяти и рост задержки апдейтов.
+
+Бот собирается как в bot.py (register_handlers, PerUserUpdateProcessor),
+но без сети: Telegram Bot API заменен локальной заглушкой (SoakRequest),
+цены - заглушками (PRICE_PROVIDER_MODE=mock) или кассетой (replay).
+Синтетические пользователи шлют команды и нажимают кнопки, а проверка
+цен (scheduled_check) идет ускоренно: каждые --sweep секунд - "новый день",
+все маршруты к проверке.
+
+Каждые --interval секунд снимаются tracemalloc и перцентили задержки
+апдейтов за интервал. Первый интервал - прогрев (кэши, пулы потоков,
+импорт matplotlib). Прогон проваливается (код выхода 1), если к концу
+память выросла относительно прогрева больше --max-growth-mb или задержка
+выросла больше чем в --max-p99-ratio раз. Задержка сравнивается
+устойчиво: медиана p99 последних --compare-windows интервалов против
+медианы p99 первых стольких же интервалов после прогрева - хвост одного
+интервала шумит (очереди апдейтов одного пользователя, очередь рендера
+графиков). Задержка проверяется, если с каждой стороны набирается хотя бы
+MIN_COMPARE_WINDOWS интервалов, иначе - только память. Любая ошибка
+в логе (обработчики перехватывают исключения сами) тоже проваливает прогон.
+
+Запуск из корня проекта:
+    python -m benchmarks.soak --duration 240               # 4 часа
+    python -m benchmarks.soak --duration 3 --interval 20   # быстрый прогон
+    PRICE_PROVIDER_MODE=replay PRICE_CASSETTE=cassettes/prices.jsonl.gz \\
+        python -m benchmarks.soak
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+# До импорта модулей бота: локальные заглушки, тихие логи, бюджет без ограничений
+os.environ.setdefault("PRICE_PROVIDER_MODE", "mock")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("CHECK_BUDGET_PER_DAY", "1000000")
+if os.getenv("PRICE_CASSETTE"):
+    os.environ["PRICE_CASSETTE"] = os.path.abspath(os.environ["PRICE_CASSETTE"])
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+ROUTES = [
+    "Москва-Сочи", "Москва-Казань", "Москва-Санкт-Петербург", "Москва-Краснодар",
+    "Москва-Пекин", "Москва-Париж", "Санкт-Петербург-Казань", "Москва-Екатеринбург",
+    "Москва-Сочи-Москва", "Москва-Казань-Сочи",
+]
+DATES = ["", " 2026-12-20", " 2026-12-20..2026-12-27", " 2027-01"]
+
+# Действие пользователя -> вес
+ACTIONS = {
+    "start": 5, "list": 20, "check": 20, "stats": 10, "track": 15,
+    "stop": 5, "chart": 3, "alert": 2, "help": 5,
+}
+
+# Сколько интервалов минимум в начале и в конце для сравнения задержки
+MIN_COMPARE_WINDOWS = 3
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "SoakBot", "username": "soak_bot"}
+
+
+class SoakRequest(BaseRequest):
+    """Bot API без сети: на любой метод - успешный ответ"""
+
+    def __init__(self):
+        self.calls = 0
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        self.calls += 1
+        endpoint = url.rsplit("/", 1)[-1]
+        if endpoint == "getMe":
+            result = BOT_USER
+        elif endpoint.startswith(("send", "edit")):
+            self._message_id += 1
+            params = request_data.parameters if request_data else {}
+            chat_id = int(params.get("chat_id", 0))
+            result = {"message_id": self._message_id, "date": int(time.time()),
+                      "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class SyntheticUsers:
+    """Поток апдейтов от USERS пользователей со случайными действиями"""
+
+    def __init__(self, bot, store, users: int, seed: int = 1):
+        self.bot = bot
+        self.store = store
+        self.users = users
+        self.random = random.Random(seed)
+        self.update_id = 0
+        self._actions = list(ACTIONS)
+        self._weights = list(ACTIONS.values())
+
+    def _text(self, user_id: int, action: str) -> str:
+        if action == "list":
+            return "📋 Мои маршруты"
+        if action == "check":
+            return "💰 Проверить цены"
+        if action == "stats":
+            return "📊 Статистика"
+        if action == "help":
+            return "❓ Помощь"
+        if action == "track":
+            return f"/track {self.random.choice(ROUTES)}{self.random.choice(DATES)}"
+        if action in ("stop", "chart", "alert"):
+            tracks = self.store.get_user_tracks(user_id)
+            track_id = self.random.choice(tracks)['id'] if tracks else 1
+            if action == "alert":
+                return f"/alert {track_id} падение {self.random.choice((5, 10, 20))}"
+            return f"/{action} {track_id}"
+        return "/start"
+
+    def next_update(self) -> tuple:
+        """(апдейт, действие)"""
+        self.update_id += 1
+        user_id = 1000 + self.random.randrange(self.users)
+        action = self.random.choices(self._actions, self._weights)[0]
+        text = self._text(user_id, action)
+        message = {
+            "message_id": self.update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0,
+                                    "length": len(text.split()[0])}]
+        return Update.de_json({"update_id": self.update_id, "message": message}, self.bot), action
+
+
+class ErrorLog(logging.Handler):
+    """
+    Ошибки из логов. Application и сами обработчики перехватывают исключения
+    и только пишут их в лог - до run_soak они не доходят.
+    """
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord):
+        self.messages.append(f"{record.name}: {record.getMessage()}")
+
+
+def percentile(values, share: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+async def run_soak(args) -> int:
+    from telegram.ext import Application
+
+    import bot as bot_module
+    from charts import chart_cache, render_chart_png
+    from database import db
+    from utils.concurrency import PerUserUpdateProcessor
+
+    request = SoakRequest()
+    application = (
+        Application.builder()
+        .token("1:SOAK")
+        .request(request)
+        .get_updates_request(SoakRequest())
+        .concurrent_updates(PerUserUpdateProcessor(256))
+        .build()
+    )
+    bot_module.register_handlers(application)
+    await application.initialize()
+
+    users = SyntheticUsers(application.bot, db, args.users)
+    context = SimpleNamespace(bot=application.bot)
+    # У шардированной базы shards - список баз, у обычной - число шардов
+    stores = db.shards if isinstance(db.shards, list) else [db]
+
+    latencies = []
+    by_action = {}
+    error_log = ErrorLog()
+    errors = error_log.messages
+    logging.getLogger().addHandler(error_log)
+    windows = []
+    tasks = set()
+
+    async def handle(update: Update, action: str):
+        started = time.perf_counter()
+        try:
+            await application.update_processor.process_update(
+                update, application.process_update(update)
+            )
+        except Exception as e:  # обработчик упал - это тоже результат прогона
+            errors.append(f"{action}: {e!r}")
+        latency = time.perf_counter() - started
+        latencies.append(latency)
+        by_action.setdefault(action, []).append(latency)
+
+    async def sweeps():
+        days = 0
+        while True:
+            await asyncio.sleep(args.sweep)
+            # Новый день: все маршруты пора проверять
+            for store in stores:
+                store.conn.execute("UPDATE tracks SET next_check_at = CURRENT_TIMESTAMP")
+                store.conn.commit()
+            await bot_module.scheduled_check(context)
+            days += 1
+            if days % 7 == 0:
+                await bot_module.nightly_analytics(context)
+
+    # Процессы рендера графиков запускаются до tracemalloc: при fork они
+    # унаследовали бы трассировку и рисовали бы в разы медленнее, чем в боте
+    loop = asyncio.get_running_loop()
+    chart_pool = chart_cache._executor_or_create()
+    await asyncio.gather(*(
+        loop.run_in_executor(chart_pool, render_chart_png, "warmup",
+                             [("2026-01-01", 1.0), ("2026-01-02", 2.0)])
+        for _ in range(chart_cache.workers)
+    ))
+
+    tracemalloc.start(args.frames)
+    baseline = None
+    sweeper = asyncio.create_task(sweeps())
+    started = time.monotonic()
+    deadline = started + args.duration * 60
+    next_report = started + args.interval
+    gap = 1.0 / args.rate
+
+    print(f"Soak: {args.duration:g} мин, {args.users} пользователей, {args.rate:g} апд/с, "
+          f"день = {args.sweep:g} с, источник цен: {os.environ['PRICE_PROVIDER_MODE']}")
+    print(f"{'мин':>6} {'апдейтов':>9} {'p50 мс':>8} {'p99 мс':>8} {'память МБ':>10} "
+          f"{'маршрутов':>10} {'user_data':>10} {'ошибок':>7}")
+
+    try:
+        while time.monotonic() < deadline:
+            task = asyncio.create_task(handle(*users.next_update()))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            await asyncio.sleep(gap)
+
+            if time.monotonic() >= next_report:
+                next_report += args.interval
+                window, latencies = latencies, []
+                current, _ = tracemalloc.get_traced_memory()
+                tracks = sum(store.conn.execute(
+                    "SELECT COUNT(*) FROM tracks WHERE active = 1").fetchone()[0]
+                    for store in stores)
+                windows.append({
+                    'minutes': (time.monotonic() - started) / 60,
+                    'updates': len(window),
+                    'p50': percentile(window, 0.50),
+                    'p99': percentile(window, 0.99),
+                    'memory': current / 1024 / 1024,
+                })
+                if baseline is None:
+                    baseline = tracemalloc.take_snapshot()
+                w = windows[-1]
+                print(f"{w['minutes']:6.1f} {w['updates']:9d} {w['p50'] * 1000:8.1f} "
+                      f"{w['p99'] * 1000:8.1f} {w['memory']:10.1f} {tracks:10d} "
+                      f"{len(application.user_data):10d} {len(errors):7d}")
+    finally:
+        sweeper.cancel()
+        await asyncio.gather(sweeper, *tasks, return_exceptions=True)
+        final = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        await application.shutdown()
+        logging.getLogger().removeHandler(error_log)
+
+    if len(windows) < 3:
+        print("❌ Слишком короткий прогон: нужно хотя бы 3 интервала (прогрев, база, итог)")
+        return 1
+
+    # windows[0] - прогрев; первые и последние интервалы после него не пересекаются
+    measured = windows[1:]
+    count = max(1, min(args.compare_windows, len(measured) // 2))
+    reference = statistics.median(w['p99'] for w in measured[:count])
+    current = statistics.median(w['p99'] for w in measured[-count:])
+    growth = windows[-1]['memory'] - windows[0]['memory']
+    p99_ratio = current / reference if reference else 1.0
+    check_latency = count >= MIN_COMPARE_WINDOWS
+
+    print("\nЗадержка по действиям за весь прогон (с ожиданием очереди пользователя):")
+    for action, values in sorted(by_action.items()):
+        print(f"  {action:>6}: p50 {percentile(values, 0.5) * 1000:8.1f} мс, "
+              f"p99 {percentile(values, 0.99) * 1000:8.1f} мс ({len(values)})")
+
+    print("\nРост памяти по местам выделения (после прогрева):")
+    for stat in final.compare_to(baseline, 'lineno')[:args.top]:
+        print(f"  {stat.size_diff / 1024:+9.1f} КБ  {stat.traceback[0]}")
+
+    failures = []
+    if growth > args.max_growth_mb:
+        failures.append(f"память выросла на {growth:.1f} МБ (порог {args.max_growth_mb:g} МБ)")
+    if check_latency and p99_ratio > args.max_p99_ratio:
+        failures.append(f"p99 вырос в {p99_ratio:.2f} раза (порог {args.max_p99_ratio:g})")
+    if errors:
+        failures.append(f"ошибок в логе и обработчиках: {len(errors)}, первая: {errors[0]}")
+
+    print(f"\nПамять: {growth:+.1f} МБ, медиана p99 по {count} интервал(ам): "
+          f"{reference * 1000:.1f} -> {current * 1000:.1f} мс (x{p99_ratio:.2f}), "
+          f"вызовов Bot API: {request.calls}")
+    if not check_latency:
+        print(f"⚠️ Задержка не проверялась: нужно хотя бы {2 * MIN_COMPARE_WINDOWS + 1} "
+              f"интервалов (прогрев и по {MIN_COMPARE_WINDOWS} в начале и в конце)")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ Дрейфа памяти и задержки нет")
+    return 1 if failures else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Soak-тест бота: утечки памяти и задержки")
+    parser.add_argument("--duration", type=float, default=60, help="минут (по умолчанию 60)")
+    parser.add_argument("--interval", type=float, default=60, help="секунд между снимками")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=50, help="апдейтов в секунду")
+    parser.add_argument("--sweep", type=float, default=10, help="секунд на один день проверок")
+    parser.add_argument("--max-growth-mb", type=float, default=20)
+    parser.add_argument("--max-p99-ratio", type=float, default=1.5)
+    parser.add_argument("--compare-windows", type=int, default=5,
+                        help="сколько интервалов в начале и в конце сравнивать по медиане p99")
+    parser.add_argument("--frames", type=int, default=1, help="глубина стека tracemalloc")
+    parser.add_argument("--top", type=int, default=10, help="сколько мест роста памяти показать")
+    args = parser.parse_args(argv)
+
+    # База бота (ticket_bot.db в текущем каталоге) - во временном каталоге
+    workdir = tempfile.mkdtemp(prefix="soak_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        from utils.logger import setup_logger
+        setup_logger()
+        return asyncio.run(run_soak(args))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
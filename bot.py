@@ -4,22 +4,32 @@
 Модульная структура проекта
 """
 
+import asyncio
 import logging
+import os
 from datetime import datetime
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
+from telegram.ext import Application, CommandHandler
 
 # Импорты из наших модулей
 from database import db
-from parser import get_price, get_available_routes, format_price_message, parser
-from keyboards import get_main_keyboard
+from parser import get_price_quote, quote_cache
+from alerts import AlertDigest, publish_prices
+from analytics import run_analytics
+from prefetch import PREFETCH_STARTUP_DELAY, prefetch_job, prefetch_times
+from scheduler import (CHECK_TICK_SECONDS, MAX_INTERVAL, VOLATILITY_WINDOW_DAYS,
+                       BudgetScale, plan_intervals, tick_limit)
 from utils.logger import setup_logger, setup_cleanup
+from utils.concurrency import PerUserUpdateProcessor
 
 # Импорты обработчиков команд
 from handlers.start import start, help_command
 from handlers.track import track_command, stop_track, get_track_conversation_handler
 from handlers.list import list_tracks_command
-from handlers.check import check_prices_command
+from handlers.check import check_prices_command, check_quota
 from handlers.stats import stats_command
+from handlers.chart import chart_command
+from handlers.admin import set_limit_command, export_command
+from handlers.rules import alert_command
 from handlers.common import (
     get_help_button_handler,
     get_delete_button_handler,
@@ -31,66 +41,78 @@ from handlers.list import get_list_button_handler
 from handlers.check import get_check_button_handler
 from handlers.stats import get_stats_button_handler
 
-# Обработчики кнопок (общие)
-from handlers.common import help_message, delete_route_message, cancel_message
+# Растяжение интервалов под дневной бюджет (по всем маршрутам, пересчитывается редко)
+budget_scale = BudgetScale()
 
-async def daily_check(context):
-    """Автоматическая проверка цен раз в день"""
+async def scheduled_check(context):
+    """Проверка цен маршрутов, которым подошло время (см. scheduler.py)"""
     logger = logging.getLogger(__name__)
-    logger.info("🔍 Запуск ежедневной проверки цен...")
+    
+    digest = AlertDigest()
     
     try:
-        cursor = db.conn.cursor()
-        cursor.execute('SELECT DISTINCT user_id FROM tracks WHERE active = 1')
-        users = cursor.fetchall()
+        due_routes = db.get_due_routes(tick_limit())
+        if not due_routes:
+            return
         
-        checked_users = 0
+        logger.info(f"🔍 Проверка цен: маршрутов к проверке {len(due_routes)}")
+        if budget_scale.is_stale():
+            # История всех маршрутов - в отдельном потоке, чтобы не держать цикл событий
+            budget_scale.update(await asyncio.to_thread(
+                db.get_schedule_inputs, VOLATILITY_WINDOW_DAYS))
+        # Интервалы нужны только проверяемым сейчас маршрутам
+        intervals = plan_intervals(
+            db.get_schedule_inputs(VOLATILITY_WINDOW_DAYS,
+                                   [route['route_key'] for route in due_routes]),
+            scale=budget_scale.value
+        )
         
-        for (user_id,) in users:
+        observations = []
+        next_checks = []
+        
+        for route in due_routes:
+            key = (route['route_key'], route['date_from'], route['date_to'])
             try:
-                tracks = db.get_user_tracks(user_id)
+                # Запрос к API - в отдельном потоке, чтобы не блокировать других пользователей.
+                # Один запрос на маршрут, цена публикуется всем подписчикам
+                quote = await asyncio.to_thread(
+                    get_price_quote, route['route'], route['date_from'], route['date_to']
+                )
                 
-                for track in tracks:
-                    try:
-                        # ИСПРАВЛЕННАЯ СТРОКА: используем get_price вместо parser.check_route
-                        price = get_price(track['route'])
-                        result = {'success': True, 'price': price}
+                if quote.price:
+                    observations.append(key + (quote.price, quote.provider))
                         
-                        if result['success'] and result['price']:
-                            old_price = track['min_price']
-                            new_price = result['price']
-                            db.update_price(track['id'], new_price)
-                            
-                            if old_price and new_price < old_price:
-                                message = (
-                                    f"🎉 Цена упала!\n\n"
-                                    f"📍 {track['route']}\n"
-                                    f"📉 Было: {old_price:.2f} руб\n"
-                                    f"📊 Стало: {new_price:.2f} руб\n"
-                                    f"💰 Экономия: {old_price - new_price:.2f} руб"
-                                )
-                                
-                                try:
-                                    await context.bot.send_message(
-                                        chat_id=user_id,
-                                        text=message,
-                                        reply_markup=get_main_keyboard()
-                                    )
-                                except:
-                                    logger.warning(f"Не удалось отправить сообщение пользователю {user_id}")
-                                    
-                    except Exception as e:
-                        logger.error(f"Ошибка при проверке {track['route']}: {e}")
-                
-                checked_users += 1
-                    
             except Exception as e:
-                logger.error(f"Ошибка для пользователя {user_id}: {e}")
+                logger.error(f"Ошибка при проверке {route['route']}: {e}")
+            
+            next_checks.append((intervals.get(key, MAX_INTERVAL),) + key)
         
-        logger.info(f"✅ Ежедневная проверка завершена. Проверено пользователей: {checked_users}")
+        # Все цены прохода - одной пачкой запросов (в шардах - параллельно),
+        # правила всех обновленных маршрутов - одним проходом после записи
+        updated = await publish_prices(context.bot, db, observations, digest)
+        db.set_next_checks(next_checks)
+        
+        # Одно сообщение на пользователя вместо одного на каждый маршрут
+        await digest.flush_all(context.bot)
+        
+        logger.info(
+            f"✅ Проверка завершена. Маршрутов: {len(due_routes)}, подписок: {len(updated)}, "
+            f"уведомлений: {digest.alerts}, отправлено сообщений: {digest.messages_sent}"
+        )
         
     except Exception as e:
-        logger.error(f"Ошибка в daily_check: {e}")
+        logger.error(f"Ошибка в scheduled_check: {e}")
+    finally:
+        # Отправляем то, что успели собрать, даже если проверка прервалась
+        await digest.flush_all(context.bot)
+
+async def nightly_analytics(context):
+    """Ночной пересчет аналитики цен (в отдельном потоке и соединении с базой)"""
+    logger = logging.getLogger(__name__)
+    try:
+        await asyncio.to_thread(run_analytics, db.db_name)
+    except Exception as e:
+        logger.error(f"Ошибка в nightly_analytics: {e}")
 
 def register_handlers(application):
     """Регистрация всех обработчиков команд и кнопок"""
@@ -106,6 +128,10 @@ def register_handlers(application):
     application.add_handler(CommandHandler("stop", stop_track))
     application.add_handler(CommandHandler("stats", stats_command))
     application.add_handler(CommandHandler("check", check_prices_command))
+    application.add_handler(CommandHandler("chart", chart_command))
+    application.add_handler(CommandHandler("alert", alert_command))
+    application.add_handler(CommandHandler("setlimit", set_limit_command))
+    application.add_handler(CommandHandler("export", export_command))
     
     # ConversationHandler для добавления маршрута через кнопку
     application.add_handler(get_track_conversation_handler())
@@ -130,24 +156,46 @@ def main():
             print("❌ ОШИБКА: Замените TELEGRAM_TOKEN в config.py!")
             return
         
+        setup_logger()
+        setup_cleanup(db)
+        
         print("✅ База данных инициализирована")
         print("🤖 Создаю приложение...")
         
-        # Создаем приложение
-        application = Application.builder().token(TELEGRAM_TOKEN).build()
+        # Создаем приложение: апдейты разных пользователей обрабатываются
+        # параллельно, апдейты одного пользователя - строго по очереди
+        max_concurrent = int(os.getenv("MAX_CONCURRENT_UPDATES", "256"))
+        application = (
+            Application.builder()
+            .token(TELEGRAM_TOKEN)
+            .concurrent_updates(PerUserUpdateProcessor(max_concurrent))
+            .build()
+        )
         
         # Регистрируем все обработчики
         register_handlers(application)
         
-        # Добавляем ежедневную проверку
+        # Добавляем автопроверку: маршруты проверяются по своему расписанию
         job_queue = application.job_queue
         if job_queue:
+            job_queue.run_repeating(scheduled_check, interval=CHECK_TICK_SECONDS, first=60)
+            print(f"✅ Автопроверка настроена (каждые {CHECK_TICK_SECONDS // 60} мин, "
+                  f"по маршрутам, которым пора)")
+            
             job_queue.run_daily(
-                daily_check,
-                time=datetime.strptime("10:00", "%H:%M").time(),
+                nightly_analytics,
+                time=datetime.strptime("03:00", "%H:%M").time(),
                 days=(0, 1, 2, 3, 4, 5, 6)
             )
-            print("✅ Автопроверка настроена (каждый день в 10:00)")
+            print("✅ Аналитика цен настроена (каждую ночь в 03:00)")
+            
+            # Цены популярных маршрутов - в кэш сразу после запуска и перед пиками
+            job_queue.run_once(prefetch_job, when=PREFETCH_STARTUP_DELAY)
+            times = prefetch_times()
+            for prefetch_time in times:
+                job_queue.run_daily(prefetch_job, time=prefetch_time)
+            print("✅ Предзагрузка популярных маршрутов настроена ("
+                  + ", ".join(t.strftime("%H:%M") for t in times) + ")")
         
         print("✅ Все обработчики зарегистрированы")
         print("=" * 50)
@@ -158,6 +206,15 @@ def main():
         # Запускаем бота
         application.run_polling()
         
+        # Сохраняем квоты проверок, чтобы перезапуск их не обнулял
+        check_quota.save_state()
+        
+        cache = db.track_cache
+        print(f"📦 Кэш маршрутов: попаданий {cache.hit_rate:.0%} "
+              f"({cache.hits} из {cache.hits + cache.misses})")
+        print(f"💾 Кэш цен: попаданий {quote_cache.hit_rate:.0%} "
+              f"({quote_cache.hits} из {quote_cache.hits + quote_cache.misses})")
+        
     except ImportError as e:
         print(f"❌ ОШИБКА ИМПОРТА: {e}")
         print("Проверьте, что все файлы созданы правильно")
@@ -0,0 +1,149 @@
+"""
+Графики истории цен.
+PNG кешируются на диске по ключу маршрута и версии истории,
+рендер выполняется в пуле процессов, чтобы не блокировать бота.
+"""
+
+import hashlib
+import logging
+import os
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR", "chart_cache")
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+
+
+def render_chart_png(route: str, points: List[Tuple[str, float]]) -> bytes:
+    """
+    Рисует график цен. Выполняется в отдельном процессе.
+    
+    Args:
+        route: название маршрута для заголовка
+        points: [(день "YYYY-MM-DD", цена), ...]
+    
+    Returns:
+        PNG в байтах
+    """
+    import io
+    from datetime import datetime
+    
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    
+    days = [datetime.strptime(day, "%Y-%m-%d") for day, _ in points]
+    prices = [price for _, price in points]
+    
+    fig, ax = plt.subplots(figsize=(8, 4), dpi=100)
+    try:
+        ax.plot(days, prices, marker="o", markersize=3, linewidth=1.5)
+        ax.set_title(route)
+        ax.set_ylabel("руб")
+        ax.grid(True, alpha=0.3)
+        fig.autofmt_xdate()
+        
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", bbox_inches="tight")
+        return buffer.getvalue()
+    finally:
+        plt.close(fig)
+
+
+class ChartCache:
+    """Дисковый кеш графиков: один файл на маршрут и версию истории"""
+    
+    def __init__(self, cache_dir: str = CHART_CACHE_DIR, workers: int = CHART_WORKERS):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self._executor = None
+        self._in_flight: Dict[str, "asyncio.Future"] = {}
+        self.hits = 0
+        self.misses = 0
+    
+    def _executor_or_create(self):
+        if self._executor is None:
+            # Пул процессов поднимается только при первом рендере
+            from concurrent.futures import ProcessPoolExecutor
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+    
+    def _prefix(self, route_key: str) -> str:
+        return hashlib.sha1(route_key.encode("utf-8")).hexdigest()[:16]
+    
+    def path_for(self, route_key: str, version: int) -> str:
+        return os.path.join(self.cache_dir, f"{self._prefix(route_key)}_{version}.png")
+    
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+    
+    async def get_chart(self, route_key: str, route: str, version: int, load_points) -> str:
+        """
+        Возвращает путь к PNG, рендерит только при промахе кеша.
+        
+        Args:
+            route_key: канонический ключ маршрута
+            route: название маршрута для заголовка
+            version: версия истории (последний ID в price_history)
+            load_points: функция без аргументов, возвращающая точки графика
+        """
+        import asyncio
+        
+        path = self.path_for(route_key, version)
+        if os.path.exists(path):
+            self.hits += 1
+            return path
+        
+        # Одинаковые запросы во время рендера ждут один и тот же результат
+        pending = self._in_flight.get(path)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+        
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._in_flight[path] = future
+        try:
+            png = await loop.run_in_executor(
+                self._executor_or_create(), render_chart_png, route, load_points()
+            )
+            self._store(route_key, path, png)
+            future.set_result(path)
+            return path
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже передано ожидающим, здесь его не нужно логировать повторно
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[path]
+    
+    def _store(self, route_key: str, path: str, png: bytes):
+        """Атомарно сохраняет PNG и удаляет устаревшие версии графика"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(png)
+        os.replace(tmp_path, path)
+        
+        prefix = self._prefix(route_key) + "_"
+        for name in os.listdir(self.cache_dir):
+            old_path = os.path.join(self.cache_dir, name)
+            if name.startswith(prefix) and name.endswith(".png") and old_path != path:
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+    
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# Глобальный кеш графиков
+chart_cache = ChartCache()
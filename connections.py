@@ -0,0 +1,130 @@
+"""
+Поиск самой дешевой стыковки по графу известных цен.
+
+Вершины графа - IATA коды городов (real_parser.CITY_TO_IATA), ребра -
+последние цены перелетов от провайдеров. Граф пополняется при каждой
+новой цене (parser._fetch_shared), поэтому поиск не делает запросов к API.
+В граф попадают только цены авиа-провайдеров (CONNECTION_PROVIDERS):
+лучшая цена маршрута может оказаться ж/д билетом, а стыковку из поезда
+и перелета нельзя выдавать за перелет с пересадкой.
+
+Если у прямого маршрута нет данных, вместо заглушки ищется путь с одной
+или двумя пересадками (CONNECTION_MAX_STOPS) через хабы (CONNECTION_HUBS):
+кратчайший путь по цене с ограничением на число перелетов.
+Цены старше CONNECTION_TTL_SECONDS не используются.
+Выключается PRICE_CONNECTIONS=0.
+"""
+
+import heapq
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from real_parser import get_iata_code
+from utils.routes import split_route
+
+PRICE_CONNECTIONS = os.getenv("PRICE_CONNECTIONS", "1") == "1"
+CONNECTION_MAX_STOPS = int(os.getenv("CONNECTION_MAX_STOPS", "2"))
+CONNECTION_HUBS = os.getenv("CONNECTION_HUBS", "MOW,LED,SVX,OVB,KZN,DXB")
+CONNECTION_TTL_SECONDS = float(os.getenv("CONNECTION_TTL_SECONDS", str(6 * 60 * 60)))
+CONNECTION_PROVIDERS = os.getenv("CONNECTION_PROVIDERS", "aviasales")
+
+DateKey = Tuple[Optional[str], Optional[str]]
+
+
+class Connection(NamedTuple):
+    """Стыковка: суммарная цена, IATA коды по пути, цены перелетов"""
+    price: float
+    path: List[str]
+    leg_prices: List[float]
+
+    @property
+    def stops(self) -> int:
+        return len(self.path) - 2
+
+
+class PriceGraph:
+    """
+    Цены перелетов между IATA кодами, отдельно по датам вылета
+    (стыковка собирается из перелетов с теми же датами, что и запрос).
+    """
+
+    def __init__(self, hubs: str = CONNECTION_HUBS, ttl: float = CONNECTION_TTL_SECONDS,
+                 max_stops: int = CONNECTION_MAX_STOPS, providers: str = CONNECTION_PROVIDERS):
+        self.hubs = {code.strip().upper() for code in hubs.split(",") if code.strip()}
+        self.providers = {name.strip() for name in providers.split(",") if name.strip()}
+        self.ttl = ttl
+        self.max_stops = max_stops
+        # даты -> откуда -> куда -> (цена, время получения)
+        self._edges: Dict[DateKey, Dict[str, Dict[str, Tuple[float, float]]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def resolve(route: str) -> Optional[Tuple[str, str]]:
+        """IATA коды маршрута "Город-Город" или None"""
+        parts = split_route(route)
+        if not parts:
+            return None
+        origin, destination = get_iata_code(parts[0]), get_iata_code(parts[1])
+        if not origin or not destination or origin == destination:
+            return None
+        return origin, destination
+
+    def observe(self, route: str, date_from: Optional[str], date_to: Optional[str],
+                price: float, provider: str, now: Optional[float] = None):
+        """Добавляет или обновляет ребро по новой цене перелета (цены не авиа пропускаются)"""
+        if provider not in self.providers or not price:
+            return
+        codes = self.resolve(route)
+        if codes is None:
+            return
+        origin, destination = codes
+        with self._lock:
+            edges = self._edges.setdefault((date_from, date_to), {})
+            edges.setdefault(origin, {})[destination] = (
+                float(price), time.monotonic() if now is None else now
+            )
+
+    def cheapest(self, route: str, date_from: Optional[str] = None,
+                 date_to: Optional[str] = None, now: Optional[float] = None) -> Optional[Connection]:
+        """
+        Самая дешевая стыковка с 1..max_stops пересадками через хабы.
+        Дейкстра по состояниям (город, число перелетов): граф - десятки
+        вершин, поиск занимает доли миллисекунды.
+        """
+        codes = self.resolve(route)
+        if codes is None:
+            return None
+        origin, destination = codes
+        now = time.monotonic() if now is None else now
+        max_legs = self.max_stops + 1
+
+        with self._lock:
+            edges = self._edges.get((date_from, date_to), {})
+            heap = [(0.0, origin, [origin], [])]
+            settled = set()
+            while heap:
+                price, node, path, leg_prices = heapq.heappop(heap)
+                if node == destination:
+                    return Connection(price, path, leg_prices)
+                state = (node, len(path))
+                if state in settled:
+                    continue
+                settled.add(state)
+                legs = len(path) - 1
+                for target, (leg_price, observed_at) in edges.get(node, {}).items():
+                    if now - observed_at > self.ttl or target in path:
+                        continue
+                    if target == destination:
+                        # Прямой перелет стыковкой не считается
+                        if legs == 0:
+                            continue
+                    elif target not in self.hubs or legs + 1 >= max_legs:
+                        continue
+                    heapq.heappush(heap, (price + leg_price, target, path + [target],
+                                          leg_prices + [leg_price]))
+        return None
+
+
+price_graph = PriceGraph()
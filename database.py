@@ -1,10 +1,62 @@
 from typing import List, Dict, Optional
+import os
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timezone
+from utils.routes import canonical_route
+from utils.lazy import LazyProxy
+from utils.track_cache import TrackCache, TrackRecord
+
+# Число файлов базы (шардов), по которым распределяются пользователи
+DB_SHARDS = int(os.getenv("DB_SHARDS", "1"))
+
+# Где хранится история цен: sqlite - таблица price_history,
+# segments - колоночные файлы рядом с базой (см. history_store.py)
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite")
+
+# Источник-заглушка (parser.MOCK_PROVIDER): такие "цены" не записываются никуда
+FALLBACK_SOURCE = "mock"
+
+def shard_paths(db_name: str, shards: int = DB_SHARDS) -> List[str]:
+    """Файлы шардов: ticket_bot.db -> ticket_bot.shard0.db, ticket_bot.shard1.db, ..."""
+    if shards <= 1:
+        return [db_name]
+    base, ext = os.path.splitext(db_name)
+    return [f"{base}.shard{i}{ext}" for i in range(shards)]
+
+# Сколько значений подставлять в один IN (...): старые сборки SQLite
+# ограничивают число параметров запроса 999
+PARAM_CHUNK = 500
+
+def param_chunks(values: list, size: int = PARAM_CHUNK):
+    """Список значений частями для запросов вида WHERE id IN (?, ?, ...)"""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
 
 class Database:
-    def __init__(self, db_name: str = "ticket_bot.db"):
+    def __init__(self, db_name: str = "ticket_bot.db", readonly: bool = False,
+                 shard: int = 0, shards: int = 1, track_cache: Optional[TrackCache] = None,
+                 history_backend: str = HISTORY_BACKEND):
+        self.db_name = db_name
+        # ID маршрутов и правил в шарде дают остаток shard по модулю shards,
+        # поэтому по ID сразу видно, в каком файле лежит запись
+        self.shard = shard
+        self.shards = shards
+        self.history = None
+        if history_backend == "segments":
+            from history_store import SegmentStore, history_dir
+            self.history = SegmentStore(history_dir(db_name), readonly=readonly)
+        
+        if readonly:
+            # Только чтение (выгрузки): схему не трогаем, писателю не мешаем
+            self.conn = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True,
+                                        check_same_thread=False)
+            return
+        
         self.conn = sqlite3.connect(db_name, check_same_thread=False)
+        self.track_cache = track_cache or TrackCache()
+        # WAL: читатели (выгрузки, аналитика) не блокируют запись и наоборот
+        self.conn.execute('PRAGMA journal_mode=WAL')
         self.create_tables()
     
     def create_tables(self):
@@ -28,12 +80,16 @@ class Database:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER,
                 route TEXT,
+                route_key TEXT,
                 origin TEXT,
                 destination TEXT,
+                date_from TEXT DEFAULT NULL,
+                date_to TEXT DEFAULT NULL,
                 min_price REAL DEFAULT NULL,
                 last_check TIMESTAMP DEFAULT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 active INTEGER DEFAULT 1,
+                next_check_at TIMESTAMP DEFAULT NULL,
                 FOREIGN KEY (user_id) REFERENCES users (user_id)
             )
         ''')
@@ -44,13 +100,182 @@ class Database:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 track_id INTEGER,
                 price REAL,
+                source TEXT DEFAULT NULL,
                 found_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (track_id) REFERENCES tracks (id)
             )
         ''')
         
+        # Сводка по ценам маршрута (обновляется инкрементально в update_price)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS track_stats (
+                track_id INTEGER PRIMARY KEY,
+                first_price REAL,
+                last_price REAL,
+                min_price REAL,
+                max_price REAL,
+                prev_min_price REAL,
+                price_sum REAL DEFAULT 0,
+                price_count INTEGER DEFAULT 0,
+                first_at TIMESTAMP,
+                last_at TIMESTAMP,
+                FOREIGN KEY (track_id) REFERENCES tracks (id)
+            )
+        ''')
+        
+        # Последняя цена за каждый день - для трендов за 7/30 дней
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS price_daily (
+                track_id INTEGER,
+                day TEXT,
+                price REAL,
+                PRIMARY KEY (track_id, day),
+                FOREIGN KEY (track_id) REFERENCES tracks (id)
+            )
+        ''')
+        
+        # Правила уведомлений по маршрутам (см. alert_rules.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS alert_rules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                track_id INTEGER,
+                kind TEXT,
+                threshold REAL DEFAULT NULL,
+                active INTEGER DEFAULT 1,
+                last_fired_price REAL DEFAULT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (track_id) REFERENCES tracks (id)
+            )
+        ''')
+        
+        # Результаты ночной аналитики по маршрутам (см. analytics.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS route_analytics (
+                track_id INTEGER PRIMARY KEY,
+                samples INTEGER,
+                volatility REAL,
+                percentile REAL,
+                weekday_profile TEXT,
+                best_weekday INTEGER,
+                buy_signal INTEGER DEFAULT 0,
+                computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (track_id) REFERENCES tracks (id)
+            )
+        ''')
+        
+        # Квоты пользователей на ручную проверку цен
+        # (capacity/refill_seconds = NULL - лимит по умолчанию)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_quotas (
+                user_id INTEGER PRIMARY KEY,
+                capacity INTEGER DEFAULT NULL,
+                refill_seconds REAL DEFAULT NULL,
+                tokens REAL DEFAULT NULL,
+                updated_at REAL DEFAULT NULL
+            )
+        ''')
+        
+        self._migrate_route_keys(cursor)
+        self._add_missing_columns(cursor, 'tracks', {
+            'date_from': 'TEXT DEFAULT NULL',
+            'date_to': 'TEXT DEFAULT NULL',
+            'next_check_at': 'TIMESTAMP DEFAULT NULL'
+        })
+        # Маршруты без расписания проверяются при ближайшем проходе планировщика
+        cursor.execute('''
+            UPDATE tracks SET next_check_at = CURRENT_TIMESTAMP
+            WHERE next_check_at IS NULL AND active = 1
+        ''')
+        self._add_missing_columns(cursor, 'price_history', {
+            'source': 'TEXT DEFAULT NULL'
+        })
+        self._add_missing_columns(cursor, 'track_stats', {
+            'prev_min_price': 'REAL'
+        })
+        self._backfill_stats(cursor)
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_price_history_track
+            ON price_history (track_id, id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_track_stats_last_at
+            ON track_stats (last_at)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_tracks_next_check
+            ON tracks (active, next_check_at)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_alert_rules_track
+            ON alert_rules (track_id, active)
+        ''')
+        
         self.conn.commit()
     
+    def _migrate_route_keys(self, cursor):
+        """Добавляем канонический ключ маршрута (общий для всех пользователей)"""
+        cursor.execute('PRAGMA table_info(tracks)')
+        columns = [row[1] for row in cursor.fetchall()]
+        if 'route_key' not in columns:
+            cursor.execute('ALTER TABLE tracks ADD COLUMN route_key TEXT')
+            cursor.execute('SELECT id, route FROM tracks')
+            cursor.executemany(
+                'UPDATE tracks SET route_key = ? WHERE id = ?',
+                [(canonical_route(route or ''), track_id)
+                 for track_id, route in cursor.fetchall()]
+            )
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_tracks_route_key
+            ON tracks (route_key, active)
+        ''')
+    
+    def _add_missing_columns(self, cursor, table: str, columns: Dict[str, str]):
+        """Добавляем колонки, которых нет в базах, созданных старой версией"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        existing = {row[1] for row in cursor.fetchall()}
+        for name, definition in columns.items():
+            if name not in existing:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+    
+    def _next_id(self, cursor, table: str) -> int:
+        """Следующий ID записи с остатком shard по модулю shards"""
+        cursor.execute(f'SELECT MAX(id) FROM {table}')
+        max_id = cursor.fetchone()[0] or 0
+        return (max_id // self.shards + 1) * self.shards + self.shard
+    
+    def close(self):
+        self.conn.close()
+    
+    def _backfill_stats(self, cursor):
+        """Заполняем сводки из price_history для баз, созданных до появления track_stats"""
+        cursor.execute('SELECT 1 FROM track_stats LIMIT 1')
+        if cursor.fetchone():
+            return
+        
+        cursor.execute('''
+            INSERT INTO track_stats
+            (track_id, first_price, last_price, min_price, max_price,
+             price_sum, price_count, first_at, last_at)
+            SELECT h.track_id,
+                   (SELECT price FROM price_history f
+                    WHERE f.track_id = h.track_id ORDER BY f.id LIMIT 1),
+                   (SELECT price FROM price_history l
+                    WHERE l.track_id = h.track_id ORDER BY l.id DESC LIMIT 1),
+                   MIN(h.price), MAX(h.price), SUM(h.price), COUNT(*),
+                   MIN(h.found_at), MAX(h.found_at)
+            FROM price_history h
+            GROUP BY h.track_id
+        ''')
+        
+        cursor.execute('''
+            INSERT OR REPLACE INTO price_daily (track_id, day, price)
+            SELECT h.track_id, date(h.found_at), h.price
+            FROM price_history h
+            ORDER BY h.id
+        ''')
+    
     def add_user(self, user_id: int, username: Optional[str] = None, 
                  first_name: Optional[str] = None, last_name: Optional[str] = None):
         """Добавляем или обновляем пользователя"""
@@ -63,7 +288,8 @@ class Database:
         self.conn.commit()
     
     def add_track(self, user_id: int, route: str, 
-                  origin: Optional[str] = None, destination: Optional[str] = None) -> int:
+                  origin: Optional[str] = None, destination: Optional[str] = None,
+                  date_from: Optional[str] = None, date_to: Optional[str] = None) -> int:
         """Добавляем маршрут для отслеживания (с проверкой дубликатов)"""
         cursor = self.conn.cursor()
         
@@ -71,7 +297,8 @@ class Database:
         cursor.execute('''
             SELECT id FROM tracks 
             WHERE user_id = ? AND route = ? AND active = 1
-        ''', (user_id, route))
+              AND date_from IS ? AND date_to IS ?
+        ''', (user_id, route, date_from, date_to))
         
         existing = cursor.fetchone()
         if existing:
@@ -79,43 +306,289 @@ class Database:
         
         # Если дубликата нет - добавляем новый
         cursor.execute('''
-            INSERT INTO tracks (user_id, route, origin, destination)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, route, origin, destination))
+            INSERT INTO tracks
+            (id, user_id, route, route_key, origin, destination, date_from, date_to, next_check_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (self._next_id(cursor, 'tracks'), user_id, route, canonical_route(route),
+              origin, destination, date_from, date_to))
         
         self.conn.commit()
+        self.track_cache.invalidate(user_id)
         return cursor.lastrowid
     
-    def get_user_tracks(self, user_id: int) -> List[Dict]:
-        """Получаем все активные маршруты пользователя"""
+    def add_tracks(self, user_id: int, tracks: List[tuple]) -> tuple:
+        """
+        Добавляем несколько маршрутов одной транзакцией.
+        tracks - [(маршрут, дата с, дата по), ...]; уже отслеживаемые
+        (по ключу маршрута и датам) находятся одним запросом и не добавляются.
+        
+        Returns:
+            ([добавленные маршруты], [уже отслеживаемые]) - словари
+            id, route, route_key, date_from, date_to
+        """
+        existing_ids = {(t.route_key, t.date_from, t.date_to): t.id
+                        for t in self.get_user_tracks(user_id)}
+        
+        cursor = self.conn.cursor()
+        
+        added, existing = [], []
+        for route, date_from, date_to in tracks:
+            route_key = canonical_route(route)
+            track = {'route': route, 'route_key': route_key,
+                     'date_from': date_from, 'date_to': date_to}
+            
+            track_id = existing_ids.get((route_key, date_from, date_to))
+            if track_id is not None:
+                existing.append(dict(track, id=track_id))
+                continue
+            
+            cursor.execute('''
+                INSERT INTO tracks (id, user_id, route, route_key, date_from, date_to, next_check_at)
+                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (self._next_id(cursor, 'tracks'), user_id, route, route_key, date_from, date_to))
+            existing_ids[(route_key, date_from, date_to)] = cursor.lastrowid
+            added.append(dict(track, id=cursor.lastrowid))
+        
+        self.conn.commit()
+        if added:
+            self.track_cache.invalidate(user_id)
+        return added, existing
+    
+    def get_user_tracks(self, user_id: int) -> List[TrackRecord]:
+        """Получаем все активные маршруты пользователя (через кэш)"""
+        tracks = self.track_cache.get(user_id)
+        if tracks is not None:
+            return tracks
+        
         cursor = self.conn.cursor()
         cursor.execute('''
-            SELECT id, route, min_price, last_check, created_at
+            SELECT id, route, route_key, min_price, last_check, created_at, date_from, date_to
             FROM tracks 
             WHERE user_id = ? AND active = 1
-            ORDER BY created_at DESC
+            ORDER BY created_at DESC, id DESC
         ''', (user_id,))
         
-        tracks = []
-        for row in cursor.fetchall():
-            tracks.append({
-                'id': row[0],
-                'route': row[1],
-                'min_price': row[2],
-                'last_check': row[3],
-                'created_at': row[4]
-            })
+        tracks = [TrackRecord(*row) for row in cursor.fetchall()]
+        self.track_cache.put(user_id, tracks)
         return tracks
     
-    def update_price(self, track_id: int, price: float):
-        """Обновляем минимальную цену для маршрута"""
+    def get_track(self, track_id: int, user_id: int) -> Optional[Dict]:
+        """Получаем активный маршрут пользователя по ID"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT id, route, route_key, min_price, last_check, created_at,
+                   date_from, date_to
+            FROM tracks
+            WHERE id = ? AND user_id = ? AND active = 1
+        ''', (track_id, user_id))
+        
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return {
+            'id': row[0],
+            'route': row[1],
+            'route_key': row[2],
+            'min_price': row[3],
+            'last_check': row[4],
+            'created_at': row[5],
+            'date_from': row[6],
+            'date_to': row[7]
+        }
+    
+    def get_route_history_version(self, route_key: str) -> int:
+        """Последний ID в истории цен маршрута - меняется при каждой новой цене"""
         cursor = self.conn.cursor()
+        if self.history is not None:
+            # ID истории нет - считаем наблюдения по сводкам
+            cursor.execute('''
+                SELECT SUM(s.price_count)
+                FROM tracks t
+                JOIN track_stats s ON s.track_id = t.id
+                WHERE t.route_key = ?
+            ''', (route_key,))
+            return cursor.fetchone()[0] or 0
         
-        # Добавляем запись в историю
         cursor.execute('''
-            INSERT INTO price_history (track_id, price)
-            VALUES (?, ?)
-        ''', (track_id, price))
+            SELECT MAX(h.id)
+            FROM tracks t
+            JOIN price_history h ON h.track_id = t.id
+            WHERE t.route_key = ?
+        ''', (route_key,))
+        return cursor.fetchone()[0] or 0
+    
+    def get_route_daily_prices(self, route_key: str) -> List[tuple]:
+        """Минимальная цена маршрута по дням: [(день, цена), ...]"""
+        cursor = self.conn.cursor()
+        if self.history is not None:
+            from history_store import series_name
+            cursor.execute('''
+                SELECT DISTINCT route_key, date_from, date_to FROM tracks WHERE route_key = ?
+            ''', (route_key,))
+            return self.history.daily_min([series_name(*row) for row in cursor.fetchall()])
+        
+        cursor.execute('''
+            SELECT date(h.found_at) AS day, MIN(h.price)
+            FROM tracks t
+            JOIN price_history h ON h.track_id = t.id
+            WHERE t.route_key = ?
+            GROUP BY day
+            ORDER BY day
+        ''', (route_key,))
+        return cursor.fetchall()
+    
+    def update_price(self, track_id: int, price: float, source: Optional[str] = None):
+        """Обновляем минимальную цену для маршрута (source - источник цены)"""
+        self.update_prices([(track_id, price, source)])
+    
+    def update_prices(self, updates: List[tuple]):
+        """
+        Записываем несколько цен одной транзакцией: [(track_id, цена, источник), ...].
+        Заглушки (FALLBACK_SOURCE) пропускаются.
+        """
+        updates = [row for row in updates if row[2] != FALLBACK_SOURCE]
+        cursor = self.conn.cursor()
+        for track_id, price, source in updates:
+            self._write_price(cursor, track_id, price, source)
+        self.conn.commit()
+        
+        if self.history is not None:
+            series = self._history_series([track_id for track_id, _, _ in updates])
+            self.history.append_many([(series[track_id][0], price, None, source)
+                                      for track_id, price, source in updates
+                                      if track_id in series])
+        
+        checked_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        for track_id, price, _ in updates:
+            self.track_cache.update_price(track_id, price, checked_at)
+    
+    def publish_prices(self, observations: List[tuple]) -> List[tuple]:
+        """
+        Публикует цены маршрутов всем подписчикам:
+        [(route_key, date_from, date_to, цена, источник), ...].
+        Цена записывается всем активным маршрутам с тем же ключом и датами
+        набором запросов на всю пачку, а не по одному маршруту.
+        Заглушки (FALLBACK_SOURCE) пропускаются.
+        
+        Returns:
+            [(track_id, цена), ...] - обновленные маршруты
+        """
+        # Одна цена на маршрут: из повторов берем последнюю
+        latest = {}
+        for route_key, date_from, date_to, price, source in observations:
+            if price and source != FALLBACK_SOURCE:
+                latest[(route_key, date_from, date_to)] = (price, source)
+        if not latest:
+            return []
+        
+        cursor = self.conn.cursor()
+        if not self.conn.in_transaction:
+            # Блокировку записи берем сразу: иначе после чтения tracks первая запись
+            # падает с "database is locked" (SQLITE_BUSY_SNAPSHOT), если другое
+            # соединение (ночная аналитика) успело закоммитить между ними
+            cursor.execute('BEGIN IMMEDIATE')
+        try:
+            published = self._publish_rows(cursor, latest)
+            self.conn.commit()
+        except Exception:
+            # Не оставляем открытую транзакцию со старым снимком базы:
+            # с ней падали бы и все следующие записи этого соединения
+            self.conn.rollback()
+            raise
+        updated = [(track_id, price) for track_id, price, _, _ in published]
+        
+        if self.history is not None:
+            # Одна запись на маршрут с датами, сколько бы у него ни было подписчиков
+            from history_store import series_name
+            observed = {series_name(*key): (price, source)
+                        for _, price, source, key in published}
+            self.history.append_many([(series, price, None, source)
+                                      for series, (price, source) in observed.items()])
+        
+        checked_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        for track_id, price in updated:
+            self.track_cache.update_price(track_id, price, checked_at)
+        return updated
+    
+    def _publish_rows(self, cursor, latest: Dict[tuple, tuple]) -> List[tuple]:
+        """
+        Запросы publish_prices в открытой транзакции:
+        [(track_id, цена, источник, (route_key, date_from, date_to)), ...]
+        """
+        cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS published_prices
+            (route_key TEXT, date_from TEXT, date_to TEXT, price REAL, source TEXT)
+        ''')
+        cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS published_tracks
+            (track_id INTEGER PRIMARY KEY, price REAL, source TEXT)
+        ''')
+        cursor.execute('DELETE FROM published_prices')
+        cursor.execute('DELETE FROM published_tracks')
+        cursor.executemany(
+            'INSERT INTO published_prices VALUES (?, ?, ?, ?, ?)',
+            [key + value for key, value in latest.items()]
+        )
+        cursor.execute('''
+            INSERT INTO published_tracks (track_id, price, source)
+            SELECT t.id, p.price, p.source
+            FROM published_prices p
+            JOIN tracks t ON t.route_key = p.route_key AND t.active = 1
+             AND t.date_from IS p.date_from AND t.date_to IS p.date_to
+        ''')
+        
+        if self.history is None:
+            cursor.execute('''
+                INSERT INTO price_history (track_id, price, source)
+                SELECT track_id, price, source FROM published_tracks
+            ''')
+        
+        cursor.execute('''
+            UPDATE tracks
+            SET min_price = MIN(COALESCE(min_price, 1e308),
+                                (SELECT p.price FROM published_tracks p WHERE p.track_id = tracks.id)),
+            last_check = CURRENT_TIMESTAMP
+            WHERE id IN (SELECT track_id FROM published_tracks)
+        ''')
+        
+        # WHERE true - чтобы SQLite не принял ON CONFLICT за часть JOIN
+        cursor.execute('''
+            INSERT INTO track_stats
+            (track_id, first_price, last_price, min_price, max_price,
+             price_sum, price_count, first_at, last_at)
+            SELECT track_id, price, price, price, price, price, 1,
+                   CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+            FROM published_tracks WHERE true
+            ON CONFLICT(track_id) DO UPDATE SET
+                last_price = excluded.last_price,
+                prev_min_price = min_price,
+                min_price = MIN(min_price, excluded.min_price),
+                max_price = MAX(max_price, excluded.max_price),
+                price_sum = price_sum + excluded.price_sum,
+                price_count = price_count + 1,
+                last_at = excluded.last_at
+        ''')
+        
+        cursor.execute('''
+            INSERT INTO price_daily (track_id, day, price)
+            SELECT track_id, date('now'), price FROM published_tracks WHERE true
+            ON CONFLICT(track_id, day) DO UPDATE SET price = excluded.price
+        ''')
+        
+        cursor.execute('''
+            SELECT p.track_id, p.price, p.source, t.route_key, t.date_from, t.date_to
+            FROM published_tracks p
+            JOIN tracks t ON t.id = p.track_id
+        ''')
+        return [row[:3] + (row[3:],) for row in cursor.fetchall()]
+    
+    def _write_price(self, cursor, track_id: int, price: float, source: Optional[str]):
+        # Добавляем запись в историю (в режиме segments - после коммита, в файлы)
+        if self.history is None:
+            cursor.execute('''
+                INSERT INTO price_history (track_id, price, source)
+                VALUES (?, ?, ?)
+            ''', (track_id, price, source))
         
         # Обновляем минимальную цену в tracks
         cursor.execute('''
@@ -128,8 +601,641 @@ class Database:
             WHERE id = ?
         ''', (price, price, track_id))
         
+        # Инкрементально обновляем сводку, чтобы /stats не сканировал историю
+        cursor.execute('''
+            INSERT INTO track_stats
+            (track_id, first_price, last_price, min_price, max_price,
+             price_sum, price_count, first_at, last_at)
+            VALUES (?, ?, ?, ?, ?, ?, 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+            ON CONFLICT(track_id) DO UPDATE SET
+                last_price = excluded.last_price,
+                prev_min_price = min_price,
+                min_price = MIN(min_price, excluded.min_price),
+                max_price = MAX(max_price, excluded.max_price),
+                price_sum = price_sum + excluded.price_sum,
+                price_count = price_count + 1,
+                last_at = excluded.last_at
+        ''', (track_id, price, price, price, price, price))
+        
+        cursor.execute('''
+            INSERT INTO price_daily (track_id, day, price)
+            VALUES (?, date('now'), ?)
+            ON CONFLICT(track_id, day) DO UPDATE SET price = excluded.price
+        ''', (track_id, price))
+    
+    def get_user_stats(self, user_id: int) -> List[Dict]:
+        """Сводка цен по активным маршрутам пользователя (без сканирования истории)"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT t.id, t.route, t.created_at, t.date_from, t.date_to,
+                   s.first_price, s.last_price, s.min_price, s.max_price,
+                   s.price_sum, s.price_count, s.last_at,
+                   (SELECT d.price FROM price_daily d
+                    WHERE d.track_id = t.id AND d.day <= date('now', '-7 days')
+                    ORDER BY d.day DESC LIMIT 1),
+                   (SELECT d.price FROM price_daily d
+                    WHERE d.track_id = t.id AND d.day <= date('now', '-30 days')
+                    ORDER BY d.day DESC LIMIT 1)
+            FROM tracks t
+            LEFT JOIN track_stats s ON s.track_id = t.id
+            WHERE t.user_id = ? AND t.active = 1
+            ORDER BY t.created_at DESC
+        ''', (user_id,))
+        
+        stats = []
+        for row in cursor.fetchall():
+            count = row[10] or 0
+            stats.append({
+                'id': row[0],
+                'route': row[1],
+                'created_at': row[2],
+                'date_from': row[3],
+                'date_to': row[4],
+                'first_price': row[5],
+                'current_price': row[6],
+                'min_price': row[7],
+                'max_price': row[8],
+                'avg_price': row[9] / count if count else None,
+                'price_count': count,
+                'last_at': row[11],
+                'price_7d_ago': row[12],
+                'price_30d_ago': row[13]
+            })
+        return stats
+    
+    def get_user_quota(self, user_id: int) -> Optional[Dict]:
+        """Сохраненная квота пользователя на ручные проверки"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT capacity, refill_seconds, tokens, updated_at
+            FROM user_quotas WHERE user_id = ?
+        ''', (user_id,))
+        
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return {
+            'capacity': row[0],
+            'refill_seconds': row[1],
+            'tokens': row[2],
+            'updated_at': row[3]
+        }
+    
+    def set_user_quota(self, user_id: int, capacity: int, refill_seconds: float):
+        """Персональный лимит пользователя (ведро заполняется заново)"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO user_quotas
+            (user_id, capacity, refill_seconds, tokens, updated_at)
+            VALUES (?, ?, ?, NULL, NULL)
+        ''', (user_id, capacity, refill_seconds))
+        self.conn.commit()
+    
+    def delete_user_quota(self, user_id: int):
+        """Возвращаем пользователю лимит по умолчанию"""
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM user_quotas WHERE user_id = ?', (user_id,))
+        self.conn.commit()
+    
+    def save_quota_states(self, states: List[tuple]):
+        """Сохраняем уровни ведер: [(user_id, tokens, updated_at), ...]"""
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+            INSERT INTO user_quotas (user_id, tokens, updated_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                tokens = excluded.tokens,
+                updated_at = excluded.updated_at
+        ''', states)
+        self.conn.commit()
+    
+    def add_alert_rule(self, track_id: int, user_id: int, kind: str,
+                       threshold: Optional[float] = None) -> Optional[int]:
+        """Добавляем правило уведомления (None, если маршрут не принадлежит пользователю)"""
+        if not self.get_track(track_id, user_id):
+            return None
+        
+        cursor = self.conn.cursor()
+        # Одно правило каждого вида на маршрут: новое заменяет старое
+        cursor.execute('''
+            UPDATE alert_rules SET active = 0
+            WHERE track_id = ? AND kind = ? AND active = 1
+        ''', (track_id, kind))
+        cursor.execute('''
+            INSERT INTO alert_rules (id, track_id, kind, threshold)
+            VALUES (?, ?, ?, ?)
+        ''', (self._next_id(cursor, 'alert_rules'), track_id, kind, threshold))
+        self.conn.commit()
+        return cursor.lastrowid
+    
+    def get_track_rules(self, track_id: int) -> List[Dict]:
+        """Активные правила уведомлений маршрута"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT id, kind, threshold, last_fired_price
+            FROM alert_rules
+            WHERE track_id = ? AND active = 1
+            ORDER BY id
+        ''', (track_id,))
+        return [
+            {'id': row[0], 'kind': row[1], 'threshold': row[2], 'last_fired_price': row[3]}
+            for row in cursor.fetchall()
+        ]
+    
+    def clear_track_rules(self, track_id: int, user_id: int) -> int:
+        """Отключаем все правила маршрута (остается правило по умолчанию)"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE alert_rules SET active = 0
+            WHERE active = 1 AND track_id IN (
+                SELECT id FROM tracks WHERE id = ? AND user_id = ?
+            )
+        ''', (track_id, user_id))
+        self.conn.commit()
+        return cursor.rowcount
+    
+    def get_firing_rules(self, track_ids: List[int]) -> List[tuple]:
+        """
+        Одним запросом находим сработавшие правила (кроме медианы) по маршрутам
+        track_ids, только что получившим цену (Database.publish_prices).
+        
+        Маршруты без правил получают правило по умолчанию - новый минимум
+        (rule_id = NULL), как раньше работало уведомление "Цена упала".
+        
+        Returns:
+            [(rule_id, kind, threshold, track_id, user_id, route, date_from, date_to,
+              цена, опорная цена), ...]
+        """
+        rows = []
+        cursor = self.conn.cursor()
+        for chunk in param_chunks(track_ids):
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f'''
+            SELECT r.id, r.kind, r.threshold, t.id, t.user_id, t.route,
+                   t.date_from, t.date_to, s.last_price,
+                   CASE r.kind
+                       WHEN 'target' THEN r.threshold
+                       WHEN 'drop_pct' THEN s.first_price
+                       ELSE s.prev_min_price
+                   END
+            FROM track_stats s
+            JOIN alert_rules r ON r.track_id = s.track_id AND r.active = 1
+            JOIN tracks t ON t.id = s.track_id AND t.active = 1
+            WHERE s.track_id IN ({placeholders})
+              AND (r.last_fired_price IS NULL OR s.last_price < r.last_fired_price)
+              AND (
+                  (r.kind = 'target' AND s.last_price <= r.threshold)
+                  OR (r.kind = 'drop_pct'
+                      AND s.last_price <= s.first_price * (1 - r.threshold / 100.0))
+                  OR (r.kind = 'low' AND s.last_price < s.prev_min_price)
+              )
+            
+            UNION ALL
+            
+            SELECT NULL, 'low', NULL, t.id, t.user_id, t.route,
+                   t.date_from, t.date_to, s.last_price, s.prev_min_price
+            FROM track_stats s
+            JOIN tracks t ON t.id = s.track_id AND t.active = 1
+            WHERE s.track_id IN ({placeholders})
+              AND s.last_price < s.prev_min_price
+              AND NOT EXISTS (
+                  SELECT 1 FROM alert_rules r
+                  WHERE r.track_id = s.track_id AND r.active = 1
+              )
+            ''', chunk + chunk)
+            rows.extend(cursor.fetchall())
+        return rows
+    
+    def get_median_rule_inputs(self, track_ids: List[int], days: int = 30) -> tuple:
+        """
+        Данные для правил "ниже медианы" маршрутов track_ids: правила
+        с текущей ценой и дневные цены их маршрутов за days дней.
+        
+        Returns:
+            (правила [(rule_id, threshold, last_fired_price, track_id, user_id,
+                       route, date_from, date_to, цена), ...],
+             дневные цены [(track_id, цена), ...])
+        """
+        rules = []
+        cursor = self.conn.cursor()
+        for chunk in param_chunks(track_ids):
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f'''
+                SELECT r.id, r.threshold, r.last_fired_price, t.id, t.user_id,
+                       t.route, t.date_from, t.date_to, s.last_price
+                FROM track_stats s
+                JOIN alert_rules r ON r.track_id = s.track_id
+                    AND r.active = 1 AND r.kind = 'median'
+                JOIN tracks t ON t.id = s.track_id AND t.active = 1
+                WHERE s.track_id IN ({placeholders})
+            ''', chunk)
+            rules.extend(cursor.fetchall())
+        if not rules:
+            return rules, []
+        
+        daily = []
+        median_track_ids = sorted({rule[3] for rule in rules})
+        for chunk in param_chunks(median_track_ids):
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f'''
+                SELECT d.track_id, d.price
+                FROM price_daily d
+                WHERE d.day >= date('now', ?) AND d.track_id IN ({placeholders})
+            ''', [f'-{days} days', *chunk])
+            daily.extend(cursor.fetchall())
+        return rules, daily
+    
+    def mark_rules_fired(self, fired: List[tuple]):
+        """Запоминаем цену срабатывания: [(rule_id, цена), ...]"""
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+            UPDATE alert_rules SET last_fired_price = ? WHERE id = ?
+        ''', [(price, rule_id) for rule_id, price in fired])
+        self.conn.commit()
+    
+    def reset_released_rules(self, track_ids: List[int], released_median_ids: List[int]):
+        """
+        Сбрасываем срабатывание правил маршрутов track_ids, условие которых
+        больше не выполняется, чтобы при следующем пересечении порога
+        уведомление пришло снова
+        """
+        cursor = self.conn.cursor()
+        for chunk in param_chunks(track_ids):
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f'''
+                UPDATE alert_rules SET last_fired_price = NULL
+                WHERE active = 1 AND last_fired_price IS NOT NULL
+                  AND kind IN ('target', 'drop_pct')
+                  AND track_id IN ({placeholders})
+                  AND NOT EXISTS (
+                      SELECT 1 FROM track_stats s
+                      WHERE s.track_id = alert_rules.track_id
+                        AND ((alert_rules.kind = 'target' AND s.last_price <= alert_rules.threshold)
+                             OR (alert_rules.kind = 'drop_pct' AND s.last_price
+                                 <= s.first_price * (1 - alert_rules.threshold / 100.0)))
+                  )
+            ''', chunk)
+        cursor.executemany('''
+            UPDATE alert_rules SET last_fired_price = NULL WHERE id = ?
+        ''', [(rule_id,) for rule_id in released_median_ids])
+        self.conn.commit()
+    
+    def get_due_routes(self, limit: int) -> List[Dict]:
+        """
+        Маршруты, которым пора проверять цену, самые просроченные первыми.
+        Одинаковые маршруты с одинаковыми датами у разных пользователей
+        объединяются: цена запрашивается один раз для всех.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT route_key, date_from, date_to, MIN(route), GROUP_CONCAT(id),
+                   MIN(next_check_at) AS due_at
+            FROM tracks
+            WHERE active = 1 AND next_check_at <= CURRENT_TIMESTAMP
+            GROUP BY route_key, date_from, date_to
+            ORDER BY due_at
+            LIMIT ?
+        ''', (limit,))
+        return [
+            {
+                'route_key': row[0],
+                'date_from': row[1],
+                'date_to': row[2],
+                'route': row[3],
+                'track_ids': [int(track_id) for track_id in row[4].split(',')],
+                'due_at': row[5]
+            }
+            for row in cursor.fetchall()
+        ]
+    
+    def get_route_subscribers(self) -> List[tuple]:
+        """Подписчики каждого маршрута: [(route_key, date_from, date_to, route, подписчиков), ...]"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT route_key, date_from, date_to, MIN(route), COUNT(DISTINCT user_id)
+            FROM tracks
+            WHERE active = 1
+            GROUP BY route_key, date_from, date_to
+        ''')
+        return cursor.fetchall()
+    
+    def get_schedule_inputs(self, days: int = 14,
+                            route_keys: Optional[List[str]] = None) -> List[tuple]:
+        """
+        Данные для расписания проверок по каждому маршруту
+        (только с ключами route_keys, если они переданы):
+        [(route_key, date_from, date_to, подписчиков, наблюдений за days дней,
+          средняя цена, средний квадрат цены), ...]
+        """
+        if route_keys is None:
+            return self._get_schedule_inputs(days, '')
+        
+        inputs = []
+        for chunk in param_chunks(sorted(set(route_keys))):
+            placeholders = ",".join("?" * len(chunk))
+            inputs.extend(self._get_schedule_inputs(
+                days, f"AND t.route_key IN ({placeholders})", chunk))
+        return inputs
+    
+    def _get_schedule_inputs(self, days: int, route_filter: str, params=()) -> List[tuple]:
+        cursor = self.conn.cursor()
+        if self.history is not None:
+            return self._get_segment_schedule_inputs(cursor, days, route_filter, params)
+        
+        cursor.execute(f'''
+            SELECT t.route_key, t.date_from, t.date_to, COUNT(DISTINCT t.user_id),
+                   COUNT(h.price), AVG(h.price), AVG(h.price * h.price)
+            FROM tracks t
+            LEFT JOIN price_history h
+              ON h.track_id = t.id AND h.found_at >= datetime('now', ?)
+            WHERE t.active = 1 {route_filter}
+            GROUP BY t.route_key, t.date_from, t.date_to
+        ''', (f'-{days} days', *params))
+        return cursor.fetchall()
+    
+    def _get_segment_schedule_inputs(self, cursor, days: int, route_filter: str,
+                                     params) -> List[tuple]:
+        from history_store import series_name
+        
+        cursor.execute(f'''
+            SELECT t.route_key, t.date_from, t.date_to, COUNT(DISTINCT t.user_id)
+            FROM tracks t
+            WHERE t.active = 1 {route_filter}
+            GROUP BY t.route_key, t.date_from, t.date_to
+        ''', params)
+        since = int(datetime.now(timezone.utc).timestamp()) - days * 86400
+        
+        inputs = []
+        for route_key, date_from, date_to, subscribers in cursor.fetchall():
+            samples, price_sum, sq_sum = 0, 0.0, 0.0
+            for part in self.history.read_range(series_name(route_key, date_from, date_to), since):
+                prices = part['price']
+                samples += len(prices)
+                price_sum += float(prices.sum())
+                sq_sum += float((prices * prices).sum())
+            inputs.append((route_key, date_from, date_to, subscribers, samples,
+                           price_sum / samples if samples else None,
+                           sq_sum / samples if samples else None))
+        return inputs
+    
+    def set_next_checks(self, rows: List[tuple]):
+        """Следующая проверка маршрутов: [(секунд от текущего момента, route_key, date_from, date_to), ...]"""
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+            UPDATE tracks SET next_check_at = datetime('now', ?)
+            WHERE active = 1 AND route_key = ? AND date_from IS ? AND date_to IS ?
+        ''', [(f'+{int(seconds)} seconds', route_key, date_from, date_to)
+              for seconds, route_key, date_from, date_to in rows])
         self.conn.commit()
     
+    def iter_active_routes_with_price(self, batch_size: int = 1000):
+        """
+        Активные маршруты с ценой, сгруппированные по ключу и датам, пачками:
+        [(ID самого старого маршрута группы, цена, "ID,ID,..." всех маршрутов), ...].
+        publish_prices пишет одну цену всем маршрутам группы, поэтому история
+        самого старого из них покрывает истории остальных.
+        """
+        cursor = self.conn.cursor()
+        # Голый столбец s.last_price при MIN(t.id) SQLite берет из той же строки
+        cursor.execute('''
+            SELECT MIN(t.id), s.last_price, GROUP_CONCAT(t.id)
+            FROM tracks t
+            JOIN track_stats s ON s.track_id = t.id
+            WHERE t.active = 1
+            GROUP BY t.route_key, t.date_from, t.date_to
+            ORDER BY MIN(t.id)
+        ''')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    
+    def _history_series(self, track_ids: List[int]) -> Dict[int, tuple]:
+        """
+        Где в сегментах история маршрутов: {track_id: (серия, время добавления unix)}.
+        История маршрута - серия его ключа и дат с момента добавления.
+        """
+        from history_store import series_name
+        
+        result = {}
+        cursor = self.conn.cursor()
+        for chunk in param_chunks(track_ids):
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f'''
+                SELECT id, route_key, date_from, date_to,
+                       CAST(strftime('%s', created_at) AS INTEGER)
+                FROM tracks WHERE id IN ({placeholders})
+            ''', chunk)
+            for track_id, route_key, date_from, date_to, added_ts in cursor.fetchall():
+                result[track_id] = (series_name(route_key, date_from, date_to), added_ts or 0)
+        return result
+    
+    def iter_price_history(self, track_id: int, chunk_size: int = 10000,
+                           days: Optional[int] = None):
+        """
+        История цен маршрута (за последние days дней, если заданы)
+        по порядку пачками [(день недели 0=вс, цена), ...]
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT CAST(strftime('%w', found_at) AS INTEGER), price
+            FROM price_history
+            WHERE track_id = ? AND (? IS NULL OR found_at >= datetime('now', ?))
+            ORDER BY id
+        ''', (track_id, days, f'-{days} days'))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    
+    def iter_price_arrays(self, track_id: int, chunk_size: int = 10000,
+                          days: Optional[int] = None):
+        """
+        История цен маршрута (за последние days дней, если заданы) по порядку
+        пачками массивов NumPy (дни недели 0=вс, цены). В режиме segments
+        цены - срезы отображенных в память сегментов, без копирования.
+        """
+        import numpy as np
+        
+        if self.history is None:
+            for rows in self.iter_price_history(track_id, chunk_size, days):
+                chunk = np.array(rows, dtype=np.float64)
+                yield chunk[:, 0].astype(np.int64), chunk[:, 1]
+            return
+        
+        series = self._history_series([track_id]).get(track_id)
+        if series is None:
+            return
+        series, since = series
+        if days is not None:
+            since = max(since, int(datetime.now(timezone.utc).timestamp()) - days * 86400)
+        for part in self.history.read_range(series, since):
+            for start in range(0, len(part), chunk_size):
+                records = part[start:start + chunk_size]
+                # 1970-01-01 - четверг (4), как strftime('%w') в SQLite - по UTC
+                weekdays = (records['ts'].astype(np.int64) // 86400 + 4) % 7
+                yield weekdays, records['price']
+    
+    def iter_history_rows(self, chunk_size: int = 10000):
+        """
+        Вся таблица price_history по маршрутам с датами пачками
+        [(route_key, date_from, date_to, цена, время unix, источник), ...].
+        Одна цена, записанная всем подписчикам маршрута, возвращается один раз.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT DISTINCT t.route_key, t.date_from, t.date_to, h.price,
+                   CAST(strftime('%s', h.found_at) AS INTEGER) AS ts, h.source
+            FROM price_history h
+            JOIN tracks t ON t.id = h.track_id
+            ORDER BY t.route_key, t.date_from, t.date_to, ts
+        ''')
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    
+    def save_route_analytics(self, rows: List[tuple]):
+        """
+        Сохраняем аналитику: [(track_id, samples, volatility, percentile,
+                               weekday_profile, best_weekday, buy_signal), ...]
+        """
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+            INSERT OR REPLACE INTO route_analytics
+            (track_id, samples, volatility, percentile, weekday_profile,
+             best_weekday, buy_signal, computed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', rows)
+        self.conn.commit()
+    
+    def get_route_analytics(self, track_ids: List[int]) -> Dict[int, Dict]:
+        """Аналитика по маршрутам: {track_id: {...}}"""
+        if not track_ids:
+            return {}
+        
+        cursor = self.conn.cursor()
+        placeholders = ",".join("?" * len(track_ids))
+        cursor.execute(f'''
+            SELECT track_id, samples, volatility, percentile, best_weekday, buy_signal
+            FROM route_analytics
+            WHERE track_id IN ({placeholders})
+        ''', list(track_ids))
+        return {
+            row[0]: {
+                'samples': row[1],
+                'volatility': row[2],
+                'percentile': row[3],
+                'best_weekday': row[4],
+                'buy_signal': bool(row[5])
+            }
+            for row in cursor.fetchall()
+        }
+    
+    def iter_export_tracks(self, date_from: Optional[str] = None,
+                           date_to: Optional[str] = None,
+                           route_key: Optional[str] = None,
+                           chunk_size: int = 10000):
+        """
+        Маршруты для выгрузки пачками (фильтр по дате добавления).
+        Каждая пачка - отдельный короткий запрос по id, чтобы долгая выгрузка
+        не держала снимок базы открытым.
+        """
+        last_id = 0
+        while True:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, route, route_key, origin, destination,
+                       date_from, date_to, min_price, last_check, created_at, active
+                FROM tracks
+                WHERE id > ?
+                  AND (? IS NULL OR created_at >= ?)
+                  AND (? IS NULL OR created_at < date(?, '+1 day'))
+                  AND (? IS NULL OR route_key = ?)
+                ORDER BY id
+                LIMIT ?
+            ''', (last_id, date_from, date_from, date_to, date_to,
+                  route_key, route_key, chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            yield rows
+            last_id = rows[-1][0]
+    
+    def iter_export_history(self, date_from: Optional[str] = None,
+                            date_to: Optional[str] = None,
+                            route_key: Optional[str] = None,
+                            chunk_size: int = 10000):
+        """
+        История цен для выгрузки пачками [(id, track_id, route_key, price,
+        source, found_at), ...]. Даты - 'YYYY-MM-DD', date_to включительно.
+        """
+        if self.history is not None:
+            yield from self._iter_export_segments(date_from, date_to, route_key, chunk_size)
+            return
+        
+        last_id = 0
+        while True:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT h.id, h.track_id, t.route_key, h.price, h.source, h.found_at
+                FROM price_history h
+                JOIN tracks t ON t.id = h.track_id
+                WHERE h.id > ?
+                  AND (? IS NULL OR h.found_at >= ?)
+                  AND (? IS NULL OR h.found_at < date(?, '+1 day'))
+                  AND (? IS NULL OR t.route_key = ?)
+                ORDER BY h.id
+                LIMIT ?
+            ''', (last_id, date_from, date_from, date_to, date_to,
+                  route_key, route_key, chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            yield rows
+            last_id = rows[-1][0]
+    
+    def _iter_export_segments(self, date_from, date_to, route_key, chunk_size):
+        """Выгрузка истории из сегментов: id - номер наблюдения в истории маршрута"""
+        from history_store import format_ts
+        
+        def to_ts(day: Optional[str], shift_days: int = 0) -> Optional[int]:
+            if not day:
+                return None
+            start = datetime.fromisoformat(day).replace(tzinfo=timezone.utc)
+            return int(start.timestamp()) + shift_days * 86400
+        
+        start_ts, end_ts = to_ts(date_from), to_ts(date_to, 1)
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT id, route_key FROM tracks
+            WHERE ? IS NULL OR route_key = ?
+            ORDER BY id
+        ''', (route_key, route_key))
+        tracks = cursor.fetchall()
+        series = self._history_series([track_id for track_id, _ in tracks])
+        
+        chunk = []
+        for track_id, track_route_key in tracks:
+            track_series, added_ts = series[track_id]
+            number = 0
+            # Как в price_history: только цены с момента добавления маршрута
+            start = added_ts if start_ts is None else max(start_ts, added_ts)
+            for part in self.history.read_range(track_series, start, end_ts):
+                for ts, price, code in zip(part['ts'].tolist(), part['price'].tolist(),
+                                           part['source'].tolist()):
+                    number += 1
+                    chunk.append((number, track_id, track_route_key, price,
+                                  self.history.source_name(code), format_ts(ts)))
+                    if len(chunk) >= chunk_size:
+                        yield chunk
+                        chunk = []
+        if chunk:
+            yield chunk
+    
     def deactivate_track(self, track_id: int, user_id: int):
         """Деактивируем маршрут"""
         cursor = self.conn.cursor()
@@ -139,7 +1245,215 @@ class Database:
             WHERE id = ? AND user_id = ?
         ''', (track_id, user_id))
         self.conn.commit()
+        if cursor.rowcount > 0:
+            self.track_cache.remove_track(track_id)
         return cursor.rowcount > 0
 
-# Глобальный экземпляр базы данных
-db = Database()
\ No newline at end of file
+class ShardedDatabase:
+    """
+    Та же база, разложенная по нескольким файлам SQLite.
+    
+    Пользователь и все его данные (маршруты, история, правила, квоты) лежат
+    в шарде user_id % shards, ID маршрутов и правил кодируют номер шарда.
+    Методы и их сигнатуры совпадают с Database: запросы одного пользователя
+    идут в его шард, общие запросы - во все шарды параллельно, по одному
+    потоку на шард, поэтому запись в разные файлы не ждет друг друга.
+    """
+    
+    def __init__(self, db_name: str = "ticket_bot.db", shards: int = DB_SHARDS):
+        self.db_name = db_name
+        self.track_cache = TrackCache()
+        self.shards = [
+            Database(path, shard=i, shards=shards, track_cache=self.track_cache)
+            for i, path in enumerate(shard_paths(db_name, shards))
+        ]
+        self._executor = None
+    
+    def _for_user(self, user_id: int) -> Database:
+        return self.shards[user_id % len(self.shards)]
+    
+    def _for_id(self, record_id: int) -> Database:
+        return self.shards[record_id % len(self.shards)]
+    
+    def _map(self, fn, items=None) -> list:
+        """
+        fn(шард) или fn(шард, элементы шарда) во всех шардах параллельно.
+        items - {номер шарда: [...]}: шарды без элементов пропускаются.
+        """
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=len(self.shards),
+                                                thread_name_prefix="db-shard")
+        if items is None:
+            futures = [self._executor.submit(fn, shard) for shard in self.shards]
+        else:
+            futures = [self._executor.submit(fn, self.shards[i], shard_items)
+                       for i, shard_items in items.items() if shard_items]
+        return [future.result() for future in futures]
+    
+    def _group_by_id(self, rows: List[tuple], key=lambda row: row[0]) -> Dict[int, list]:
+        groups = {}
+        for row in rows:
+            groups.setdefault(key(row) % len(self.shards), []).append(row)
+        return groups
+    
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+    
+    # --- Данные одного пользователя: в его шарде
+    
+    def add_user(self, user_id: int, *args, **kwargs):
+        return self._for_user(user_id).add_user(user_id, *args, **kwargs)
+    
+    def add_track(self, user_id: int, *args, **kwargs) -> int:
+        return self._for_user(user_id).add_track(user_id, *args, **kwargs)
+    
+    def add_tracks(self, user_id: int, tracks: List[tuple]) -> tuple:
+        return self._for_user(user_id).add_tracks(user_id, tracks)
+    
+    def get_user_tracks(self, user_id: int) -> List[TrackRecord]:
+        return self._for_user(user_id).get_user_tracks(user_id)
+    
+    def get_track(self, track_id: int, user_id: int) -> Optional[Dict]:
+        return self._for_user(user_id).get_track(track_id, user_id)
+    
+    def get_user_stats(self, user_id: int) -> List[Dict]:
+        return self._for_user(user_id).get_user_stats(user_id)
+    
+    def get_user_quota(self, user_id: int) -> Optional[Dict]:
+        return self._for_user(user_id).get_user_quota(user_id)
+    
+    def set_user_quota(self, user_id: int, capacity: int, refill_seconds: float):
+        return self._for_user(user_id).set_user_quota(user_id, capacity, refill_seconds)
+    
+    def delete_user_quota(self, user_id: int):
+        return self._for_user(user_id).delete_user_quota(user_id)
+    
+    def add_alert_rule(self, track_id: int, user_id: int, kind: str,
+                       threshold: Optional[float] = None) -> Optional[int]:
+        return self._for_user(user_id).add_alert_rule(track_id, user_id, kind, threshold)
+    
+    def get_track_rules(self, track_id: int) -> List[Dict]:
+        return self._for_id(track_id).get_track_rules(track_id)
+    
+    def clear_track_rules(self, track_id: int, user_id: int) -> int:
+        return self._for_user(user_id).clear_track_rules(track_id, user_id)
+    
+    def deactivate_track(self, track_id: int, user_id: int):
+        return self._for_user(user_id).deactivate_track(track_id, user_id)
+    
+    def update_price(self, track_id: int, price: float, source: Optional[str] = None):
+        return self._for_id(track_id).update_price(track_id, price, source)
+    
+    # --- Пакетные и общие запросы: во всех шардах параллельно
+    
+    def update_prices(self, updates: List[tuple]):
+        self._map(Database.update_prices, self._group_by_id(updates))
+    
+    def publish_prices(self, observations: List[tuple]) -> List[tuple]:
+        # Подписчики маршрута могут быть в любом шарде - публикуем во все параллельно
+        return [row for rows in self._map(lambda shard: shard.publish_prices(observations))
+                for row in rows]
+    
+    def save_quota_states(self, states: List[tuple]):
+        self._map(Database.save_quota_states, self._group_by_id(states))
+    
+    def mark_rules_fired(self, fired: List[tuple]):
+        self._map(Database.mark_rules_fired, self._group_by_id(fired))
+    
+    def reset_released_rules(self, track_ids: List[int], released_median_ids: List[int]):
+        tracks = self._group_by_id(track_ids, key=lambda track_id: track_id)
+        rules = self._group_by_id(released_median_ids, key=lambda rule_id: rule_id)
+        self._map(lambda shard: shard.reset_released_rules(
+            tracks.get(shard.shard, []), rules.get(shard.shard, [])))
+    
+    def get_route_history_version(self, route_key: str) -> int:
+        # ID истории в каждом шарде свои: сумма растет при новой цене в любом из них
+        return sum(self._map(lambda shard: shard.get_route_history_version(route_key)))
+    
+    def get_route_daily_prices(self, route_key: str) -> List[tuple]:
+        daily = {}
+        for rows in self._map(lambda shard: shard.get_route_daily_prices(route_key)):
+            for day, price in rows:
+                daily[day] = min(price, daily.get(day, price))
+        return sorted(daily.items())
+    
+    def get_firing_rules(self, track_ids: List[int]) -> List[tuple]:
+        groups = self._group_by_id(track_ids, key=lambda track_id: track_id)
+        return [row for rows in self._map(Database.get_firing_rules, groups)
+                for row in rows]
+    
+    def get_median_rule_inputs(self, track_ids: List[int], days: int = 30) -> tuple:
+        groups = self._group_by_id(track_ids, key=lambda track_id: track_id)
+        rules, daily = [], []
+        for shard_rules, shard_daily in self._map(
+                lambda shard, ids: shard.get_median_rule_inputs(ids, days), groups):
+            rules.extend(shard_rules)
+            daily.extend(shard_daily)
+        return rules, daily
+    
+    def get_route_analytics(self, track_ids: List[int]) -> Dict[int, Dict]:
+        groups = self._group_by_id(track_ids, key=lambda track_id: track_id)
+        result = {}
+        for shard_result in self._map(Database.get_route_analytics, groups):
+            result.update(shard_result)
+        return result
+    
+    def get_due_routes(self, limit: int) -> List[Dict]:
+        # Один маршрут может быть у пользователей из разных шардов
+        routes = {}
+        for shard_routes in self._map(lambda shard: shard.get_due_routes(limit)):
+            for route in shard_routes:
+                key = (route['route_key'], route['date_from'], route['date_to'])
+                if key in routes:
+                    routes[key]['track_ids'] += route['track_ids']
+                    routes[key]['due_at'] = min(routes[key]['due_at'], route['due_at'])
+                else:
+                    routes[key] = route
+        return sorted(routes.values(), key=lambda route: route['due_at'])[:limit]
+    
+    def get_route_subscribers(self) -> List[tuple]:
+        merged = {}
+        for rows in self._map(lambda shard: shard.get_route_subscribers()):
+            for route_key, date_from, date_to, route, subscribers in rows:
+                key = (route_key, date_from, date_to)
+                if key in merged:
+                    merged[key][1] += subscribers
+                else:
+                    merged[key] = [route, subscribers]
+        return [key + (route, subscribers) for key, (route, subscribers) in merged.items()]
+    
+    def get_schedule_inputs(self, days: int = 14,
+                            route_keys: Optional[List[str]] = None) -> List[tuple]:
+        # Пользователи шардов не пересекаются: подписчики и наблюдения складываются,
+        # средние пересчитываются с весами по числу наблюдений
+        merged = {}
+        for rows in self._map(lambda shard: shard.get_schedule_inputs(days, route_keys)):
+            for route_key, date_from, date_to, subscribers, samples, mean, mean_sq in rows:
+                key = (route_key, date_from, date_to)
+                total = merged.setdefault(key, [0, 0, 0.0, 0.0])
+                total[0] += subscribers
+                total[1] += samples
+                total[2] += (mean or 0.0) * samples
+                total[3] += (mean_sq or 0.0) * samples
+        return [
+            key + (subscribers, samples,
+                   price_sum / samples if samples else None,
+                   sq_sum / samples if samples else None)
+            for key, (subscribers, samples, price_sum, sq_sum) in merged.items()
+        ]
+    
+    def set_next_checks(self, rows: List[tuple]):
+        self._map(lambda shard: shard.set_next_checks(rows))
+
+def open_database(db_name: str = "ticket_bot.db", shards: int = DB_SHARDS):
+    """Одна база или шардированная - в зависимости от DB_SHARDS"""
+    if shards > 1:
+        return ShardedDatabase(db_name, shards)
+    return Database(db_name)
+
+# Глобальный экземпляр базы данных (файл открывается при первом обращении)
+db = LazyProxy(open_database)
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""
+Потоковая выгрузка маршрутов и истории цен в CSV или Parquet.
+
+Данные читаются пачками через отдельное соединение только для чтения
+и сразу пишутся в файл, поэтому память не зависит от размера базы,
+а бот (база в режиме WAL) продолжает писать во время выгрузки.
+
+Запуск из командной строки:
+    python export.py history --format parquet --from 2026-01-01 --to 2026-01-31 \\
+        --route "Москва-Сочи" -o history.parquet
+
+Parquet требует pyarrow (pip install pyarrow), он импортируется только
+при выгрузке в этот формат.
+"""
+
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+from datetime import date
+from typing import Optional
+
+from database import Database, shard_paths
+from utils.routes import canonical_route
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "10000"))
+EXPORT_FORMATS = ("csv", "parquet")
+
+# Колонки выгрузки и их типы в Parquet (время в SQLite хранится строкой)
+EXPORT_TABLES = {
+    'tracks': [
+        ('id', 'int64'), ('user_id', 'int64'), ('route', 'string'),
+        ('route_key', 'string'), ('origin', 'string'), ('destination', 'string'),
+        ('date_from', 'string'), ('date_to', 'string'), ('min_price', 'float64'),
+        ('last_check', 'string'), ('created_at', 'string'), ('active', 'int64'),
+    ],
+    'history': [
+        ('id', 'int64'), ('track_id', 'int64'), ('route_key', 'string'),
+        ('price', 'float64'), ('source', 'string'), ('found_at', 'string'),
+    ],
+}
+
+
+def _iter_chunks(db_name: str, table: str, date_from: Optional[str],
+                 date_to: Optional[str], route: Optional[str], chunk_size: int):
+    """Пачки строк из всех шардов базы по очереди"""
+    route_key = canonical_route(route) if route else None
+    for path in shard_paths(db_name):
+        store = Database(path, readonly=True)
+        try:
+            if table == 'tracks':
+                yield from store.iter_export_tracks(date_from, date_to, route_key, chunk_size)
+            else:
+                yield from store.iter_export_history(date_from, date_to, route_key, chunk_size)
+        finally:
+            store.close()
+
+
+def _write_csv(chunks, columns, path: str) -> int:
+    rows_written = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for rows in chunks:
+            writer.writerows(rows)
+            rows_written += len(rows)
+    return rows_written
+
+
+def _write_parquet(chunks, columns, types, path: str) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Для выгрузки в Parquet установите pyarrow: pip install pyarrow")
+
+    schema = pa.schema([(name, getattr(pa, type_name)()) for name, type_name in zip(columns, types)])
+    rows_written = 0
+    # Каждая пачка - отдельная группа строк, в памяти держим только ее
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in chunks:
+            arrays = [pa.array(values, type=field.type)
+                      for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows_written += len(rows)
+        if not rows_written:
+            writer.write_table(schema.empty_table())
+    return rows_written
+
+
+def export_table(db_name: str, table: str, path: str, fmt: str = "csv",
+                 date_from: Optional[str] = None, date_to: Optional[str] = None,
+                 route: Optional[str] = None, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Выгружает таблицу ('tracks' или 'history') в файл.
+    Даты - 'YYYY-MM-DD' включительно, route - маршрут в любом написании.
+
+    Returns:
+        Число выгруженных строк
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Неизвестная таблица: {table}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    for value in (date_from, date_to):
+        if value:
+            date.fromisoformat(value)  # ValueError для неверной даты
+
+    started = time.perf_counter()
+    columns = [name for name, _ in EXPORT_TABLES[table]]
+    types = [type_name for _, type_name in EXPORT_TABLES[table]]
+    chunks = _iter_chunks(db_name, table, date_from, date_to, route, chunk_size)
+    if fmt == "parquet":
+        rows_written = _write_parquet(chunks, columns, types, path)
+    else:
+        rows_written = _write_csv(chunks, columns, path)
+
+    logger.info(f"📤 Выгрузка {table} ({fmt}): строк {rows_written} "
+                f"за {time.perf_counter() - started:.1f} с -> {path}")
+    return rows_written
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Выгрузка маршрутов и истории цен")
+    parser.add_argument("table", choices=sorted(EXPORT_TABLES))
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--from", dest="date_from", help="с даты YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="по дату YYYY-MM-DD включительно")
+    parser.add_argument("--route", help="только этот маршрут, например Москва-Сочи")
+    parser.add_argument("--db", default="ticket_bot.db", help="файл базы данных")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("-o", "--output", help="файл результата (по умолчанию <таблица>.<формат>)")
+    args = parser.parse_args(argv)
+
+    missing = [path for path in shard_paths(args.db) if not os.path.exists(path)]
+    if missing:
+        parser.error(f"файл базы не найден: {missing[0]}")
+
+    output = args.output or f"{args.table}.{args.format}"
+    try:
+        rows_written = export_table(args.db, args.table, output, args.format,
+                                    args.date_from, args.date_to, args.route,
+                                    args.chunk_size)
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    print(f"✅ {output}: строк {rows_written}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import tempfile
+from datetime import date
+from telegram import Update
+from telegram.ext import ContextTypes
+from keyboards import get_main_keyboard
+from handlers.check import check_quota
+from database import db
+from export import EXPORT_FORMATS, EXPORT_TABLES, export_table
+
+def get_admin_ids() -> set:
+    """ID администраторов из переменной окружения ADMIN_IDS (через запятую)"""
+    return {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x.isdigit()}
+
+def is_admin(user_id: int) -> bool:
+    return user_id in get_admin_ids()
+
+async def set_limit_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /setlimit (только для админов)"""
+    if not is_admin(update.effective_user.id):
+        return
+    
+    args = context.args or []
+    if len(args) == 2 and args[0].isdigit() and args[1] == "default":
+        check_quota.reset_limit(int(args[0]))
+        await update.message.reply_text(
+            f"✅ Пользователю {args[0]} возвращен лимит по умолчанию",
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    if (len(args) != 3 or not all(arg.isdigit() for arg in args)
+            or int(args[1]) < 1 or int(args[2]) < 1):
+        await update.message.reply_text(
+            "Формат:\n"
+            "<code>/setlimit ID_пользователя проверок минут</code> - "
+            "не больше N проверок подряд, одна новая каждые M минут (N и M от 1)\n"
+            "<code>/setlimit ID_пользователя default</code> - лимит по умолчанию\n\n"
+            "Например: <code>/setlimit 123456 5 10</code>",
+            parse_mode='HTML',
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    user_id, capacity, minutes = (int(arg) for arg in args)
+    check_quota.set_limit(user_id, capacity, minutes * 60)
+    await update.message.reply_text(
+        f"✅ Лимит пользователя {user_id}: {capacity} проверок, "
+        f"одна новая каждые {minutes} мин",
+        reply_markup=get_main_keyboard()
+    )
+
+# Telegram не принимает от ботов файлы больше 50 МБ
+TELEGRAM_FILE_LIMIT = 50 * 1024 * 1024
+
+def parse_export_args(args: list) -> dict:
+    """
+    /export tracks|history [csv|parquet] [ГГГГ-ММ-ДД [ГГГГ-ММ-ДД]] [маршрут]
+    Первая дата - начало периода, вторая - конец, остальное - маршрут.
+    """
+    if not args or args[0] not in EXPORT_TABLES:
+        raise ValueError("не указана таблица")
+    
+    options = {'table': args[0], 'fmt': 'csv', 'date_from': None, 'date_to': None, 'route': None}
+    route_words = []
+    for arg in args[1:]:
+        if arg in EXPORT_FORMATS:
+            options['fmt'] = arg
+        elif len(arg) == 10 and arg[4] == '-' and arg[7] == '-' and not route_words:
+            date.fromisoformat(arg)
+            options['date_to' if options['date_from'] else 'date_from'] = arg
+        else:
+            route_words.append(arg)
+    if route_words:
+        options['route'] = " ".join(route_words)
+    return options
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /export (только для админов)"""
+    if not is_admin(update.effective_user.id):
+        return
+    
+    try:
+        options = parse_export_args(context.args or [])
+    except ValueError:
+        await update.message.reply_text(
+            "Формат:\n"
+            "<code>/export tracks|history [csv|parquet] [с ГГГГ-ММ-ДД] [по ГГГГ-ММ-ДД] [маршрут]</code>\n\n"
+            "Например: <code>/export history parquet 2026-01-01 2026-01-31 Москва-Сочи</code>",
+            parse_mode='HTML',
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    await update.message.reply_text("⏳ Готовлю выгрузку...")
+    
+    fd, path = tempfile.mkstemp(suffix=f".{options['fmt']}")
+    os.close(fd)
+    try:
+        # Выгрузка читает базу своим соединением в отдельном потоке
+        rows_written = await asyncio.to_thread(export_table, db.db_name, path=path, **options)
+        
+        if os.path.getsize(path) > TELEGRAM_FILE_LIMIT:
+            await update.message.reply_text(
+                "❌ Файл больше 50 МБ - сузьте период или используйте "
+                "<code>python export.py</code> на сервере",
+                parse_mode='HTML',
+                reply_markup=get_main_keyboard()
+            )
+            return
+        
+        with open(path, 'rb') as f:
+            await update.message.reply_document(
+                document=f,
+                filename=f"{options['table']}.{options['fmt']}",
+                caption=f"📤 Строк: {rows_written}",
+                reply_markup=get_main_keyboard()
+            )
+    except RuntimeError as e:
+        await update.message.reply_text(f"❌ {e}", reply_markup=get_main_keyboard())
+    finally:
+        os.remove(path)
@@ -0,0 +1,61 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+from database import db
+from charts import chart_cache
+from keyboards import get_main_keyboard
+import logging
+
+logger = logging.getLogger(__name__)
+
+async def chart_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /chart - график истории цен маршрута"""
+    user_id = update.effective_user.id
+    
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text(
+            "Укажите ID маршрута:\n"
+            "<code>/chart 1</code>\n\n"
+            "ID можно узнать через кнопку 📋 Мои маршруты",
+            parse_mode='HTML',
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    track = db.get_track(int(context.args[0]), user_id)
+    if not track:
+        await update.message.reply_text(
+            f"❌ Не удалось найти маршрут #{context.args[0]}",
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    version = db.get_route_history_version(track['route_key'])
+    if not version:
+        await update.message.reply_text(
+            f"📭 По маршруту {track['route']} ещё нет истории цен.\n"
+            "Проверьте цены через кнопку 💰 Проверить цены",
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    try:
+        path = await chart_cache.get_chart(
+            track['route_key'],
+            track['route'],
+            version,
+            lambda: db.get_route_daily_prices(track['route_key'])
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при построении графика {track['route']}: {e}")
+        await update.message.reply_text(
+            "❌ Не удалось построить график",
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    with open(path, 'rb') as photo:
+        await update.message.reply_photo(
+            photo=photo,
+            caption=f"📈 История цен: {track['route']}",
+            reply_markup=get_main_keyboard()
+        )
@@ -1,12 +1,61 @@
 from telegram import Update
 from telegram.ext import ContextTypes, MessageHandler, filters
+from alerts import publish_prices
 from database import db
 from parser import parser
+from prefetch import prefetcher
 from keyboards import get_main_keyboard
+from utils.routes import format_track_route
+from utils.rate_limit import QuotaManager
+from datetime import datetime
+import asyncio
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# Квоты на ручную проверку цен (лимиты от админов хранятся в базе)
+check_quota = QuotaManager(store=db if os.getenv("CHECK_QUOTA_PERSIST", "1") == "1" else None)
+
+def format_age(timestamp: str) -> str:
+    """Сколько прошло с момента проверки (timestamp в UTC из SQLite)"""
+    checked_at = datetime.strptime(timestamp[:19], "%Y-%m-%d %H:%M:%S")
+    minutes = max(0, int((datetime.utcnow() - checked_at).total_seconds() // 60))
+    if minutes < 1:
+        return "только что"
+    if minutes < 60:
+        return f"{minutes} мин назад"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f"{hours} ч {minutes} мин назад"
+    return f"{hours // 24} дн назад"
+
+def format_wait(seconds: float) -> str:
+    minutes = max(1, int(seconds // 60 + (1 if seconds % 60 else 0)))
+    if minutes < 60:
+        return f"{minutes} мин"
+    return f"{minutes // 60} ч {minutes % 60} мин"
+
+async def reply_last_known_prices(update: Update, retry_after: float):
+    """Ответ в период ожидания: последние известные цены без запросов к API"""
+    lines = []
+    for item in db.get_user_stats(update.effective_user.id):
+        if item['current_price'] is None:
+            lines.append(f"• {format_track_route(item)}: цена ещё неизвестна")
+        else:
+            lines.append(
+                f"• {format_track_route(item)}: {item['current_price']:.2f} руб "
+                f"({format_age(item['last_at'])})"
+            )
+    
+    await update.message.reply_text(
+        "⏳ <b>Слишком частые проверки.</b>\n"
+        f"Следующая проверка будет доступна через {format_wait(retry_after)}.\n\n"
+        "📋 <b>Последние известные цены:</b>\n\n" + "\n".join(lines),
+        parse_mode='HTML',
+        reply_markup=get_main_keyboard()
+    )
+
 async def check_prices_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /check"""
     return await check_prices_message(update, context)
@@ -24,27 +73,50 @@ async def check_prices_message(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         return
     
+    # Спрос на маршруты - для предзагрузки цен перед пиками (см. prefetch.py)
+    for track in tracks:
+        prefetcher.record_check(track['route'], track['date_from'], track['date_to'])
+    
+    allowed, retry_after = check_quota.try_acquire(user_id)
+    if not allowed:
+        await reply_last_known_prices(update, retry_after)
+        return
+    
     await update.message.reply_text(
         "🔍 Начинаю проверку цен...",
         reply_markup=get_main_keyboard()
     )
     
     found_prices = []
+    observations = []
     
     for track in tracks:
         try:
-            result = parser.check_route(track['route'])
+            # Запрос к API - в отдельном потоке, чтобы не блокировать других пользователей
+            result = await asyncio.to_thread(
+                parser.check_route, track['route'], track['date_from'], track['date_to']
+            )
             
             if result['success'] and result['price']:
-                db.update_price(track['id'], result['price'])
+                observations.append((track['route_key'], track['date_from'], track['date_to'],
+                                     result['price'], result['provider']))
                 found_prices.append(
-                    f"• {track['route']}: {result['price']:.2f} руб"
+                    f"• {format_track_route(track)}: {result['price']:.2f} руб ({result['provider']})"
                 )
+            else:
+                found_prices.append(f"• {format_track_route(track)}: нет данных")
                 
         except Exception as e:
             logger.error(f"Ошибка при проверке {track['route']}: {e}")
     
-    if found_prices:
+    # Цена нужна не только этому пользователю: она записывается всем,
+    # кто следит за теми же маршрутами, и проходит через их правила уведомлений
+    try:
+        await publish_prices(context.bot, db, observations)
+    except Exception as e:
+        logger.error(f"Ошибка при публикации цен: {e}")
+    
+    if observations:
         response = "✅ <b>Цены обновлены:</b>\n\n" + "\n".join(found_prices)
     else:
         response = "😔 Не удалось получить цены"
@@ -9,10 +9,12 @@ async def help_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "✅ <b>Как пользоваться:</b>\n"
         "1. Нажмите <b>✈️ Добавить маршрут</b>\n"
         "2. Введите маршрут: <i>Город-Город</i>\n"
+        "   или из нескольких перелетов: <i>Город-Город-Город</i>\n"
         "3. Нажмите <b>💰 Проверить цены</b>\n"
         "4. Бот покажет текущие цены\n\n"
         "⏰ <b>Автопроверка:</b>\n"
-        "Бот проверяет цены каждый день в 10:00\n"
+        "Бот проверяет цены хотя бы раз в день, а если цена\n"
+        "быстро меняется или вылет скоро - чаще\n"
         "При падении цены - уведомление!\n\n"
         "📋 <b>Просмотр маршрутов:</b>\n"
         "Используйте кнопку <b>📋 Мои маршруты</b>\n\n"
@@ -2,6 +2,8 @@ from telegram import Update
 from telegram.ext import ContextTypes, MessageHandler, filters
 from database import db
 from keyboards import get_main_keyboard
+from utils.routes import format_track_route
+from analytics import format_buy_hint
 
 async def list_tracks_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /list"""
@@ -21,6 +23,7 @@ async def list_tracks_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     response = "📋 <b>Ваши маршруты:</b>\n\n"
+    analytics = db.get_route_analytics([track['id'] for track in tracks])
     
     for i, track in enumerate(tracks, 1):
         created_date = track['created_at'][:10] if track['created_at'] else "ещё нет"
@@ -31,10 +34,13 @@ async def list_tracks_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         else:
             price_info = "💰 цена неизвестна"
         
+        hint = format_buy_hint(analytics.get(track['id']))
         response += (
-            f"{i}. <b>{track['route']}</b>\n"
+            f"{i}. <b>{format_track_route(track)}</b>\n"
             f"   🆔 ID: {track['id']} | 📅 Добавлен: {created_date}\n"
-            f"   {price_info} | 🔍 Проверка: {last_check}\n\n"
+            f"   {price_info} | 🔍 Проверка: {last_check}\n"
+            + (f"   {hint}\n" if hint else "")
+            + "\n"
         )
     
     response += f"Всего маршрутов: {len(tracks)}\n"
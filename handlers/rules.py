@@ -0,0 +1,95 @@
+import math
+from telegram import Update
+from telegram.ext import ContextTypes
+from database import db
+from keyboards import get_main_keyboard
+from utils.routes import format_track_route
+
+# Слово в команде -> вид правила (см. alert_rules.py)
+RULE_ALIASES = {
+    "цель": "target",
+    "падение": "drop_pct",
+    "минимум": "low",
+    "медиана": "median",
+}
+
+RULES_HELP = (
+    "Правила уведомлений для маршрута:\n"
+    "<code>/alert ID цель 10000</code> - цена не выше 10000 руб\n"
+    "<code>/alert ID падение 15</code> - на 15% дешевле, чем при добавлении\n"
+    "<code>/alert ID минимум</code> - новый исторический минимум\n"
+    "<code>/alert ID медиана 10</code> - на 10% ниже медианы за 30 дней\n"
+    "<code>/alert ID сброс</code> - вернуть правило по умолчанию\n\n"
+    "По умолчанию уведомление приходит при новом минимуме цены."
+)
+
+def describe_rule(rule: dict) -> str:
+    kind, threshold = rule['kind'], rule['threshold']
+    if kind == "target":
+        return f"🎯 цена не выше {threshold:.0f} руб"
+    if kind == "drop_pct":
+        return f"📉 на {threshold:g}% дешевле, чем при добавлении"
+    if kind == "median":
+        return f"📊 на {threshold:g}% ниже медианы за 30 дней"
+    return "⬇️ новый исторический минимум"
+
+async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /alert - правила уведомлений маршрута"""
+    user_id = update.effective_user.id
+    args = context.args or []
+    
+    if not args or not args[0].isdigit():
+        await update.message.reply_html(RULES_HELP, reply_markup=get_main_keyboard())
+        return
+    
+    track = db.get_track(int(args[0]), user_id)
+    if not track:
+        await update.message.reply_text(
+            f"❌ Не удалось найти маршрут #{args[0]}",
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    if len(args) == 1:
+        rules = db.get_track_rules(track['id'])
+        if rules:
+            lines = "\n".join(f"• {describe_rule(rule)}" for rule in rules)
+        else:
+            lines = "• ⬇️ новый исторический минимум (по умолчанию)"
+        await update.message.reply_html(
+            f"🔔 <b>Уведомления: {format_track_route(track)}</b>\n\n{lines}",
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    action = args[1].lower()
+    if action == "сброс":
+        db.clear_track_rules(track['id'], user_id)
+        await update.message.reply_text(
+            "✅ Правила сброшены: уведомление придет при новом минимуме цены",
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    kind = RULE_ALIASES.get(action)
+    threshold = None
+    if kind and kind != "low":
+        try:
+            threshold = float(args[2].replace(",", "."))
+        except (IndexError, ValueError):
+            kind = None
+        # float() принимает и "nan"/"inf": такое правило не сработало бы никогда
+        if threshold is not None and (not math.isfinite(threshold) or threshold <= 0
+                                      or (kind != "target" and threshold >= 100)):
+            kind = None
+    
+    if not kind:
+        await update.message.reply_html(RULES_HELP, reply_markup=get_main_keyboard())
+        return
+    
+    rule = {'kind': kind, 'threshold': threshold}
+    db.add_alert_rule(track['id'], user_id, kind, threshold)
+    await update.message.reply_html(
+        f"✅ Правило добавлено для <b>{format_track_route(track)}</b>:\n{describe_rule(rule)}",
+        reply_markup=get_main_keyboard()
+    )
@@ -31,6 +31,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "💰 Проверить цены - проверить цены сейчас\n"
         "📊 Статистика - ваша статистика\n"
         "❌ Удалить маршрут - удалить маршрут\n"
+        "/chart ID - график истории цен маршрута\n"
+        "/alert ID - правила уведомлений маршрута\n"
         "❓ Помощь - эта справка",
         reply_markup=get_main_keyboard()
     )
\ No newline at end of file
@@ -1,32 +1,78 @@
 from telegram import Update
 from telegram.ext import ContextTypes, MessageHandler, filters
 from database import db
+from alerts import split_message
 from keyboards import get_main_keyboard
+from utils.routes import format_track_route
 
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /stats"""
     return await stats_message(update, context)
 
+def format_trend(current, past) -> str:
+    """Изменение цены в процентах со стрелкой"""
+    if not current or not past:
+        return "нет данных"
+    
+    change = (current - past) / past * 100
+    if abs(change) < 0.05:
+        return "→ 0.0%"
+    arrow = "↓" if change < 0 else "↑"
+    return f"{arrow} {abs(change):.1f}%"
+
+def format_route_stats(item: dict) -> str:
+    """Блок статистики по одному маршруту"""
+    if not item['price_count']:
+        return (
+            f"📍 <b>{format_track_route(item)}</b>\n"
+            f"   💰 цены ещё не проверялись\n"
+        )
+    
+    savings = item['first_price'] - item['current_price']
+    if savings > 0:
+        savings_info = f"💸 Экономия с момента добавления: {savings:.2f} руб"
+    elif savings < 0:
+        savings_info = f"💸 Дороже, чем при добавлении: {-savings:.2f} руб"
+    else:
+        savings_info = "💸 Цена не изменилась с момента добавления"
+    
+    return (
+        f"📍 <b>{format_track_route(item)}</b>\n"
+        f"   💰 Сейчас: {item['current_price']:.2f} руб\n"
+        f"   📉 Мин: {item['min_price']:.2f} | 📈 Макс: {item['max_price']:.2f} | "
+        f"⌀ {item['avg_price']:.2f}\n"
+        f"   📊 7 дней: {format_trend(item['current_price'], item['price_7d_ago'])} | "
+        f"30 дней: {format_trend(item['current_price'], item['price_30d_ago'])}\n"
+        f"   {savings_info}\n"
+    )
+
 async def stats_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик кнопки 'Статистика'"""
     user_id = update.effective_user.id
-    tracks = db.get_user_tracks(user_id)
-    active_count = len(tracks)
+    route_stats = db.get_user_stats(user_id)
+    active_count = len(route_stats)
     
-    response = (
+    header = (
         f"📊 <b>Ваша статистика</b>\n\n"
         f"👤 Пользователь: @{update.effective_user.username or 'без username'}\n"
         f"🆔 ID: {user_id}\n\n"
-        f"🎫 Активных маршрутов: <b>{active_count}</b>\n\n"
+        f"🎫 Активных маршрутов: <b>{active_count}</b>"
+    )
+    footer = (
         f"⏰ <b>Автопроверка:</b>\n"
-        f"Цены проверяются каждый день в 10:00\n"
+        f"Цены проверяются хотя бы раз в день, чаще - если\n"
+        f"цена быстро меняется или вылет скоро\n"
         f"При падении цены получите уведомление!"
     )
+    blocks = [format_route_stats(item).rstrip("\n") for item in route_stats] + [footer]
     
-    await update.message.reply_html(
-        response,
-        reply_markup=get_main_keyboard()
-    )
+    # Много маршрутов не помещаются в одно сообщение Telegram: режем по маршрутам
+    messages = split_message(header, blocks)
+    for i, text in enumerate(messages):
+        await update.message.reply_html(
+            text,
+            reply_markup=get_main_keyboard() if i == len(messages) - 1 else None
+        )
 
 # Функция для получения обработчика кнопки "Статистика"
 def get_stats_button_handler():
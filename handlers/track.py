@@ -1,11 +1,96 @@
+import asyncio
+import html
+import logging
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler, MessageHandler, filters, CommandHandler
+from alerts import publish_prices
 from database import db
+from parser import MOCK_PROVIDER, find_unknown_city, get_price_quote
 from keyboards import get_main_keyboard, get_cancel_keyboard
+from utils.routes import parse_track_list, format_track_route
+
+logger = logging.getLogger(__name__)
 
 # Состояния для ConversationHandler
 WAITING_FOR_ROUTE = 1
 
+# Сколько маршрутов можно добавить одним сообщением
+MAX_TRACKS_PER_MESSAGE = 20
+
+async def fetch_first_prices(tracks: list) -> dict:
+    """
+    Первые цены для новых маршрутов: одинаковые маршруты с одинаковыми
+    датами запрашиваются один раз, разные - параллельно.
+    
+    Returns:
+        {track_id: PriceQuote}
+    """
+    keys = list({(t['route_key'], t['date_from'], t['date_to']): t for t in tracks}.items())
+    quotes = await asyncio.gather(
+        *(asyncio.to_thread(get_price_quote, t['route'], t['date_from'], t['date_to'])
+          for _, t in keys),
+        return_exceptions=True
+    )
+    by_key = {key: quote for (key, _), quote in zip(keys, quotes)
+              if not isinstance(quote, BaseException)}
+    
+    result = {}
+    for t in tracks:
+        quote = by_key.get((t['route_key'], t['date_from'], t['date_to']))
+        if quote is not None:
+            result[t['id']] = quote
+    return result
+
+async def add_tracks_from_text(user_id: int, text: str, bot):
+    """
+    Добавляет все маршруты из сообщения и возвращает одну сводку (HTML)
+    или None, если ни одного маршрута не удалось разобрать.
+    Первые цены публикуются всем подписчикам этих маршрутов (bot - для уведомлений).
+    """
+    tracks, invalid = parse_track_list(text)
+    
+    # Маршруты с городами, по которым нет ни одного источника цен, не добавляем
+    unknown = [(route, city) for route, _, _ in tracks
+               if (city := find_unknown_city(route)) is not None]
+    if unknown:
+        unknown_routes = {route for route, _ in unknown}
+        tracks = [track for track in tracks if track[0] not in unknown_routes]
+    
+    if not tracks and not unknown:
+        return None
+    
+    skipped = tracks[MAX_TRACKS_PER_MESSAGE:]
+    added, existing = db.add_tracks(user_id, tracks[:MAX_TRACKS_PER_MESSAGE])
+    
+    quotes = await fetch_first_prices(added)
+    await publish_prices(bot, db, [
+        (track['route_key'], track['date_from'], track['date_to'], quote.price, quote.provider)
+        for track in added if (quote := quotes.get(track['id'])) is not None
+    ])
+    
+    lines = []
+    if added:
+        lines.append(f"✅ <b>Добавлено маршрутов: {len(added)}</b>\n")
+        for track in added:
+            quote = quotes.get(track['id'])
+            price_info = f" - {quote.price:.2f} руб" if quote and quote.provider != MOCK_PROVIDER else ""
+            lines.append(f"🆔 {track['id']} {html.escape(format_track_route(track))}{price_info}")
+        lines.append("\nТеперь я буду следить за ценами!")
+    if existing:
+        lines.append("\n⚠️ <b>Уже отслеживаются:</b>")
+        lines.extend(f"• {html.escape(format_track_route(track))}" for track in existing)
+    if unknown:
+        lines.append("\n❓ <b>Неизвестные города:</b>")
+        lines.extend(f"• {html.escape(route)}: {html.escape(city)}" for route, city in unknown)
+    if invalid:
+        lines.append("\n❌ <b>Не удалось разобрать:</b>")
+        lines.extend(f"• <code>{html.escape(line)}</code>" for line in invalid)
+    if skipped:
+        lines.append(f"\n⏭ Не больше {MAX_TRACKS_PER_MESSAGE} маршрутов за раз, "
+                     f"пропущено: {len(skipped)}")
+    
+    return "\n".join(lines).strip()
+
 async def track_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /track"""
     try:
@@ -15,42 +100,35 @@ async def track_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(
                 "Укажите маршрут. Пример:\n"
                 "<code>/track Москва-Сочи</code>\n"
-                "<code>/track Санкт-Петербург-Казань</code>",
+                "<code>/track Санкт-Петербург-Казань</code>\n"
+                "<code>/track Москва-Сочи 20.11.2026</code>\n"
+                "<code>/track Москва-Сочи 20.11.2026-25.11.2026</code>\n"
+                "<code>/track Москва-Сочи-Москва 20.11.2026-25.11.2026</code> - туда и обратно\n\n"
+                "Можно сразу несколько - по одному в строке или через запятую:\n"
+                "<code>/track Москва-Сочи, Москва-Казань</code>",
                 parse_mode='HTML',
                 reply_markup=get_main_keyboard()
             )
             return
         
-        route = ' '.join(context.args)
-        
-        # Проверяем, есть ли уже такой маршрут у пользователя
-        existing_tracks = db.get_user_tracks(user_id)
-        existing_routes = [t['route'] for t in existing_tracks]
+        # Маршруты из текста после команды, в т.ч. по одному в строке
+        text = update.message.text.split(maxsplit=1)[1]
+        response = await add_tracks_from_text(user_id, text, context.bot)
         
-        if route in existing_routes:
-            await update.message.reply_html(
-                f"⚠️ <b>Маршрут уже отслеживается!</b>\n\n"
-                f"📍 <code>{route}</code>\n\n"
-                f"Вы можете проверить цены через кнопку 💰 Проверить цены",
+        if response is None:
+            await update.message.reply_text(
+                "❌ Неверный формат маршрута или даты!\n\n"
+                "Формат: <code>Город-Город</code>, даты - <code>20.11.2026</code> "
+                "или <code>20.11.2026-25.11.2026</code>",
+                parse_mode='HTML',
                 reply_markup=get_main_keyboard()
             )
             return
         
-        # Добавляем в базу данных
-        track_id = db.add_track(user_id=user_id, route=route)
-        
-        response = (
-            f"✅ Маршрут добавлен!\n\n"
-            f"📍 <b>{route}</b>\n"
-            f"🆔 ID: {track_id}\n\n"
-            f"Теперь я буду следить за ценами!"
-        )
-        
         await update.message.reply_html(response, reply_markup=get_main_keyboard())
         
     except Exception as e:
-        # Логируем ошибку
-        print(f"❌ Ошибка в track_command: {e}")
+        logger.error(f"❌ Ошибка в track_command: {e}")
         
         # Сообщаем пользователю
         await update.message.reply_text(
@@ -68,56 +146,38 @@ async def start_add_route(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Примеры:\n"
             "• Москва-Сочи\n"
             "• Санкт-Петербург-Казань\n"
-            "• Нижний Новгород-Москва\n\n"
+            "• Нижний Новгород-Москва\n"
+            "• Москва-Сочи 20.11.2026\n"
+            "• Москва-Сочи 20.11.2026-25.11.2026\n"
+            "• Москва-Сочи-Москва 20.11.2026-25.11.2026 (туда 20.11, обратно 25.11)\n"
+            "• Москва-Казань-Сочи (несколько перелетов)\n\n"
+            "Можно сразу несколько - по одному в строке или через запятую.\n\n"
             "Или нажмите ❌ Отмена",
             parse_mode='HTML',
             reply_markup=get_cancel_keyboard()
         )
         return WAITING_FOR_ROUTE
     except Exception as e:
-        print(f"❌ Ошибка в start_add_route: {e}")
+        logger.error(f"❌ Ошибка в start_add_route: {e}")
         return ConversationHandler.END
 
 async def process_route(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка введенного маршрута"""
     try:
         user_id = update.effective_user.id
-        route = update.message.text.strip()
+        response = await add_tracks_from_text(user_id, update.message.text, context.bot)
         
-        if not route or '-' not in route:
+        if response is None:
             await update.message.reply_text(
-                "❌ Неверный формат маршрута!\n\n"
+                "❌ Неверный формат маршрута или даты!\n\n"
                 "Правильный формат: <i>Город-Город</i>\n"
-                "Пример: <code>Москва-Сочи</code>\n\n"
+                "Пример: <code>Москва-Сочи</code> или <code>Москва-Сочи 20.11.2026</code>\n\n"
                 "Попробуйте еще раз:",
                 parse_mode='HTML',
                 reply_markup=get_cancel_keyboard()
             )
             return WAITING_FOR_ROUTE
         
-        # Проверяем, есть ли уже такой маршрут у пользователя
-        existing_tracks = db.get_user_tracks(user_id)
-        existing_routes = [t['route'] for t in existing_tracks]
-        
-        if route in existing_routes:
-            await update.message.reply_html(
-                f"⚠️ <b>Маршрут уже отслеживается!</b>\n\n"
-                f"📍 <code>{route}</code>\n\n"
-                f"Вы можете проверить цены через кнопку 💰 Проверить цены",
-                reply_markup=get_main_keyboard()
-            )
-            return ConversationHandler.END
-        
-        # Добавляем в базу данных
-        track_id = db.add_track(user_id=user_id, route=route)
-        
-        response = (
-            f"✅ <b>Маршрут добавлен!</b>\n\n"
-            f"📍 {route}\n"
-            f"🆔 ID: {track_id}\n\n"
-            f"Теперь я буду следить за цены на этот маршрут!"
-        )
-        
         await update.message.reply_html(
             response,
             reply_markup=get_main_keyboard()
@@ -125,8 +185,7 @@ async def process_route(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
         
     except Exception as e:
-        # Логируем ошибку
-        print(f"❌ Ошибка в process_route: {e}")
+        logger.error(f"❌ Ошибка в process_route: {e}")
         
         # Сообщаем пользователю
         await update.message.reply_text(
@@ -144,7 +203,7 @@ async def cancel_add_route(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=get_main_keyboard()
         )
     except Exception as e:
-        print(f"❌ Ошибка в cancel_add_route: {e}")
+        logger.error(f"❌ Ошибка в cancel_add_route: {e}")
     finally:
         return ConversationHandler.END
 
@@ -177,7 +236,7 @@ async def stop_track(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 reply_markup=get_main_keyboard()
             )
     except Exception as e:
-        print(f"❌ Ошибка в stop_track: {e}")
+        logger.error(f"❌ Ошибка в stop_track: {e}")
         await update.message.reply_text(
             "❌ Что-то пошло не так...",
             reply_markup=get_main_keyboard()
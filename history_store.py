@@ -0,0 +1,297 @@
+"""
+Колоночное хранилище истории цен (HISTORY_BACKEND=segments).
+
+История хранится по сериям - маршрут (route_key) с датами, как цену
+запрашивает и публикует бот: одна запись на наблюдение, сколько бы
+пользователей ни следило за маршрутом. История маршрута пользователя -
+его серия с момента добавления маршрута (см. Database).
+
+Серия - файлы-сегменты с записями фиксированного размера (время unix,
+цена, код источника), по SEGMENT_RECORDS записей в сегменте:
+    <база>.history/<серия>.00000.seg, <серия>.00001.seg, ...
+Имя серии - хеш ключа маршрута и дат (series_name): ключ может быть
+длиннее допустимого имени файла.
+Запись - дозапись в конец последнего сегмента. Чтение - np.memmap сегмента
+и срез по времени через бинарный поиск, без копирования данных.
+14 байт на наблюдение против ~60 байт строки price_history с индексом.
+
+Источник цены (price_history.source) хранится кодом: таблица кодов -
+<база>.history/sources.json (код 0 - источник неизвестен).
+
+Перенос уже накопленной истории из SQLite:
+    python history_store.py ticket_bot.db
+
+NumPy импортируется только при чтении.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+RECORD = struct.Struct('<IdH')  # время unix (uint32), цена (float64), источник (uint16)
+SEGMENT_RECORDS = 65536  # 896 КБ: у обычного маршрута история - один файл
+SEGMENT_SUFFIX = '.seg'
+SOURCES_FILE = 'sources.json'
+MAX_SOURCE_CODE = 0xFFFF
+
+
+def history_dir(db_name: str) -> str:
+    """Каталог сегментов рядом с файлом базы: ticket_bot.db -> ticket_bot.history"""
+    return os.path.splitext(db_name)[0] + '.history'
+
+
+def series_name(route_key: str, date_from: Optional[str], date_to: Optional[str]) -> str:
+    """Имя серии сегментов маршрута с датами"""
+    key = json.dumps([route_key, date_from, date_to], ensure_ascii=False)
+    return 'r' + hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def record_dtype():
+    import numpy as np
+    return np.dtype([('ts', '<u4'), ('price', '<f8'), ('source', '<u2')])
+
+
+def format_ts(ts: int) -> str:
+    """Время записи в формате CURRENT_TIMESTAMP SQLite"""
+    return datetime.fromtimestamp(int(ts), timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class SegmentStore:
+    """Сегменты истории цен по сериям (series_name): дозапись и чтение диапазонов"""
+
+    def __init__(self, root: str, readonly: bool = False):
+        self.root = root
+        if not readonly:
+            os.makedirs(root, exist_ok=True)
+        self._last_ts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # код -> источник (код 0 - None) и обратно
+        self._sources: List[Optional[str]] = [None]
+        self._codes: Dict[str, int] = {}
+        self._load_sources()
+
+    def _sources_path(self) -> str:
+        return os.path.join(self.root, SOURCES_FILE)
+
+    def _load_sources(self):
+        path = self._sources_path()
+        segments = []
+        if os.path.isdir(self.root):
+            segments = [name for name in os.listdir(self.root) if name.endswith(SEGMENT_SUFFIX)]
+        # Сегменты с номером маршрута пользователя в имени - старый формат
+        # (история по track_id), без таблицы источников - записи по 12 байт
+        if any(name.split('.')[0].isdigit() for name in segments) or (
+                segments and not os.path.exists(path)):
+            raise RuntimeError(
+                f"{self.root}: сегменты старого формата, "
+                f"удалите каталог и перенесите историю заново (python history_store.py)"
+            )
+        if not os.path.exists(path):
+            return
+        with open(path, encoding='utf-8') as f:
+            self._sources = [None] + json.load(f)
+        self._codes = {source: code for code, source in enumerate(self._sources) if code}
+
+    def _source_code(self, source: Optional[str]) -> int:
+        """Код источника; новый источник дописывается в таблицу (под self._lock)"""
+        if source is None:
+            return 0
+        code = self._codes.get(source)
+        if code is not None:
+            return code
+        if len(self._sources) > MAX_SOURCE_CODE:
+            return 0
+        code = self._codes[source] = len(self._sources)
+        self._sources.append(source)
+        # Таблица пишется раньше сегментов, поэтому код из файла всегда расшифровывается
+        tmp_path = self._sources_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._sources[1:], f, ensure_ascii=False)
+        os.replace(tmp_path, self._sources_path())
+        return code
+
+    def source_name(self, code: int) -> Optional[str]:
+        """Источник по коду из записи сегмента"""
+        if code >= len(self._sources):
+            # Код добавил писатель уже после открытия хранилища
+            self._load_sources()
+        return self._sources[code] if 0 <= code < len(self._sources) else None
+
+    def _segment_path(self, series: str, number: int) -> str:
+        return os.path.join(self.root, f"{series}.{number:05d}{SEGMENT_SUFFIX}")
+
+    def _segments(self, series: str) -> List[str]:
+        paths = []
+        while os.path.exists(path := self._segment_path(series, len(paths))):
+            paths.append(path)
+        return paths
+
+    def append(self, series: str, price: float, ts: Optional[int] = None,
+               source: Optional[str] = None):
+        self.append_many([(series, price, ts, source)])
+
+    def append_many(self, rows: List[tuple]):
+        """Дозаписываем наблюдения: [(серия, цена, время unix или None, источник), ...]"""
+        now = int(time.time())
+
+        with self._lock:
+            by_series: Dict[str, List[tuple]] = {}
+            for series, price, ts, source in rows:
+                by_series.setdefault(series, []).append(
+                    (now if ts is None else int(ts), price, self._source_code(source))
+                )
+            for series, records in by_series.items():
+                self._append_series(series, records)
+
+    def _append_series(self, series: str, records: List[tuple]):
+        segments = self._segments(series)
+        if segments:
+            path = segments[-1]
+            size = os.path.getsize(path)
+            if size % RECORD.size:
+                # Хвост от прерванной записи - отрезаем
+                size -= size % RECORD.size
+                os.truncate(path, size)
+            count = size // RECORD.size
+        else:
+            path, count = None, SEGMENT_RECORDS
+
+        # Время в сегменте не убывает, иначе бинарный поиск по нему не работает
+        last_ts = self._last_ts.get(series)
+        if last_ts is None:
+            last_ts = self._read_last_ts(segments[-1]) if segments else 0
+
+        pending = bytearray()
+        for ts, price, source_code in records:
+            last_ts = max(ts, last_ts)
+            if count >= SEGMENT_RECORDS:
+                if path is not None and pending:
+                    self._write(path, pending)
+                    pending = bytearray()
+                path = self._segment_path(series, len(segments))
+                segments.append(path)
+                count = 0
+            pending += RECORD.pack(last_ts, price, source_code)
+            count += 1
+        self._write(path, pending)
+        self._last_ts[series] = last_ts
+
+    @staticmethod
+    def _write(path: str, data: bytearray):
+        with open(path, 'ab') as f:
+            f.write(data)
+
+    @staticmethod
+    def _read_last_ts(path: str) -> int:
+        size = os.path.getsize(path) // RECORD.size * RECORD.size
+        if not size:
+            return 0
+        with open(path, 'rb') as f:
+            f.seek(size - RECORD.size)
+            return RECORD.unpack(f.read(RECORD.size))[0]
+
+    def read_range(self, series: str, start_ts: Optional[int] = None,
+                   end_ts: Optional[int] = None) -> Iterator:
+        """
+        Наблюдения серии с start_ts (включительно) по end_ts (не включительно)
+        как срезы np.memmap по сегментам - без копирования.
+        """
+        import numpy as np
+
+        dtype = record_dtype()
+        for path in self._segments(series):
+            count = os.path.getsize(path) // dtype.itemsize
+            if not count:
+                continue
+            records = np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+            ts = records['ts']
+            if end_ts is not None and ts[0] >= end_ts:
+                break
+            if start_ts is not None and ts[-1] < start_ts:
+                continue
+            lo = 0 if start_ts is None else int(np.searchsorted(ts, start_ts, 'left'))
+            hi = count if end_ts is None else int(np.searchsorted(ts, end_ts, 'left'))
+            if hi > lo:
+                yield records[lo:hi]
+
+    def read(self, series: str, start_ts: Optional[int] = None,
+             end_ts: Optional[int] = None):
+        """Наблюдения одним массивом (копия - только если диапазон в нескольких сегментах)"""
+        import numpy as np
+
+        parts = list(self.read_range(series, start_ts, end_ts))
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return np.empty(0, dtype=record_dtype())
+        return np.concatenate(parts)
+
+    def daily_min(self, series_names: List[str]) -> List[tuple]:
+        """Минимальная цена по дням (UTC) по нескольким сериям: [(день, цена), ...]"""
+        import numpy as np
+
+        parts = [part for series in series_names for part in self.read_range(series)]
+        if not parts:
+            return []
+        records = np.concatenate(parts)
+        days = records['ts'] // 86400
+        order = np.argsort(days, kind='stable')
+        days, prices = days[order], records['price'][order]
+        unique_days, starts = np.unique(days, return_index=True)
+        mins = np.minimum.reduceat(prices, starts)
+        return [(format_ts(day * 86400)[:10], float(price))
+                for day, price in zip(unique_days, mins)]
+
+    def disk_usage(self) -> int:
+        """Место на диске в байтах (с учетом блоков файловой системы)"""
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                total += os.stat(os.path.join(dirpath, name)).st_blocks * 512
+        return total
+
+
+def import_from_sqlite(db_name: str, chunk_size: int = 10000) -> int:
+    """
+    Переносит price_history из SQLite в сегменты (для перехода на HISTORY_BACKEND=segments).
+    Одна и та же цена у подписчиков одного маршрута переносится в серию один раз.
+    """
+    from database import Database
+
+    store = Database(db_name, readonly=True)
+    segments = SegmentStore(history_dir(db_name))
+    imported = 0
+    try:
+        for rows in store.iter_history_rows(chunk_size):
+            segments.append_many([(series_name(route_key, date_from, date_to), price, ts, source)
+                                  for route_key, date_from, date_to, price, ts, source in rows])
+            imported += len(rows)
+    finally:
+        store.close()
+    return imported
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Перенос истории цен из SQLite в сегменты")
+    parser.add_argument("db", help="файл базы данных")
+    args = parser.parse_args(argv)
+
+    target = history_dir(args.db)
+    if os.path.exists(target) and os.listdir(target):
+        print(f"❌ {target} уже не пуст, перенос повторно не выполняется", file=sys.stderr)
+        return 1
+
+    imported = import_from_sqlite(args.db)
+    print(f"✅ Перенесено наблюдений: {imported} -> {target}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
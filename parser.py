@@ -1,82 +1,300 @@
 """
-Parser module for getting flight prices.
-Uses real Aviasales API with fallback to mock data.
+Parser module for getting flight and train prices.
+Queries all configured providers in parallel with fallback to mock data.
+The API transport (live, record, replay) and the mock-only mode
+are selected with PRICE_PROVIDER_MODE, see providers/__init__.py.
 """
 
 import logging
-from typing import Optional
-from real_parser import AviasalesParser  # Импортируем из отдельного файла
+import os
+import threading
+import time
+from typing import Dict, Optional
+from real_parser import AviasalesParser, CITY_TO_IATA  # Импортируем из отдельного файла
+from connections import PRICE_CONNECTIONS, price_graph
+from providers import NoPriceData, PriceQuote, build_fanout, build_transport, get_mock_price, get_provider_mode
+from providers.trains import TRAIN_STUB_FARES
+from utils.lazy import LazyProxy
+from utils.routes import canonical_route, leg_dates, route_legs, split_legs, split_route
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Создаем экземпляр парсера
-real_parser = AviasalesParser()
+# Экземпляры создаются при первом запросе цены, а не при импорте
+transport = LazyProxy(lambda: build_transport(get_provider_mode()))
+real_parser = LazyProxy(lambda: AviasalesParser(transport=transport))
 
-def get_price(route: str) -> Optional[float]:
+# Параллельный опрос всех источников (авиа, ж/д) с дедлайном
+price_fanout = LazyProxy(lambda: build_fanout(real_parser, transport))
+
+# Заглушка вместо цены, когда данных нет: пользователю не показывается,
+# в историю не пишется (см. Database.update_prices)
+MOCK_PROVIDER = "mock"
+# Цены режима PRICE_PROVIDER_MODE=mock (локальный запуск) - пишутся как обычные
+STUB_PROVIDER = "stub"
+CONNECTION_PROVIDER = "connection"
+
+# Маршруты без данных у всех провайдеров не запрашиваются повторно:
+# с датами - NEGATIVE_TTL_SECONDS, без дат (пара городов) - NEGATIVE_PAIR_TTL_SECONDS
+NEGATIVE_TTL_SECONDS = float(os.getenv("NEGATIVE_TTL_SECONDS", str(6 * 60 * 60)))
+NEGATIVE_PAIR_TTL_SECONDS = float(os.getenv("NEGATIVE_PAIR_TTL_SECONDS", str(24 * 60 * 60)))
+
+# Города, известные кроме авиа справочника: ж/д и KNOWN_CITIES через запятую
+_EXTRA_CITIES = {city for key in TRAIN_STUB_FARES for city in key.split("-")}
+_EXTRA_CITIES.update(city.strip().lower() for city in os.getenv("KNOWN_CITIES", "").split(",")
+                     if city.strip())
+
+def find_unknown_city(route: str) -> Optional[str]:
     """
-    Main function to get price for a route.
-    Uses real Aviasales API with fallback to mock data.
+    Первый город маршрута, для которого ни один источник не знает цен,
+    или None, если все города известны.
+    """
+    for city in split_legs(route) or split_route(route) or [route]:
+        normalized = " ".join(city.lower().replace("ё", "е").split())
+        if normalized not in CITY_TO_IATA and normalized not in _EXTRA_CITIES:
+            return city
+    return None
+
+# Перелеты маршрута "Москва-Сочи-Москва" запрашиваются параллельно
+LEG_WORKERS = int(os.getenv("LEG_WORKERS", "8"))
+
+def _create_leg_pool():
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=LEG_WORKERS, thread_name_prefix="leg")
+
+leg_pool = LazyProxy(_create_leg_pool)
+
+# Сколько секунд цена от провайдера считается свежей для повторных запросов
+QUOTE_TTL_SECONDS = float(os.getenv("QUOTE_TTL_SECONDS", "1800"))
+
+
+class QuoteCache:
+    """
+    Последние цены провайдеров по маршрутам (заглушки не кэшируются).
+    Ключ - канонический маршрут и даты, поэтому "Москва - Сочи" и
+    "москва-сочи" обслуживаются одной записью.
+    """
+    
+    def __init__(self, ttl: float = QUOTE_TTL_SECONDS):
+        self.ttl = ttl
+        self._quotes: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key(route: str, date_from: Optional[str], date_to: Optional[str]) -> tuple:
+        return canonical_route(route), date_from, date_to
+    
+    def get(self, route: str, date_from: Optional[str] = None,
+            date_to: Optional[str] = None) -> Optional[PriceQuote]:
+        key = self.key(route, date_from, date_to)
+        with self._lock:
+            cached = self._quotes.get(key)
+            if cached is not None and time.monotonic() - cached[1] < self.ttl:
+                self.hits += 1
+                return cached[0]
+            if cached is not None:
+                del self._quotes[key]
+            self.misses += 1
+            return None
+    
+    def put(self, route: str, date_from: Optional[str], date_to: Optional[str],
+            quote: PriceQuote):
+        with self._lock:
+            self._quotes[self.key(route, date_from, date_to)] = (quote, time.monotonic())
+    
+    def age(self, route: str, date_from: Optional[str] = None,
+            date_to: Optional[str] = None) -> Optional[float]:
+        """Сколько секунд назад получена цена (None - нет свежей)"""
+        with self._lock:
+            cached = self._quotes.get(self.key(route, date_from, date_to))
+        if cached is None:
+            return None
+        age = time.monotonic() - cached[1]
+        return age if age < self.ttl else None
+    
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+quote_cache = QuoteCache()
+
+
+class NegativeCache:
+    """
+    Маршруты, по которым все источники недавно ответили, что цен нет
+    (NoPriceData, а не ошибка сети): ключ -> когда истекает.
+    """
+    
+    def __init__(self, ttl: float = NEGATIVE_TTL_SECONDS,
+                 pair_ttl: float = NEGATIVE_PAIR_TTL_SECONDS):
+        self.ttl = ttl
+        self.pair_ttl = pair_ttl
+        self._expires: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+    
+    def add(self, route: str, date_from: Optional[str], date_to: Optional[str]):
+        # Нет данных без дат - нет и на конкретные даты: запоминаем всю пару городов
+        key, ttl = ((canonical_route(route),), self.pair_ttl) if not date_from else \
+            (quote_cache.key(route, date_from, date_to), self.ttl)
+        with self._lock:
+            self._expires[key] = time.monotonic() + ttl
+    
+    def __contains__(self, item: tuple) -> bool:
+        route, date_from, date_to = item
+        now = time.monotonic()
+        with self._lock:
+            for key in ((canonical_route(route),), quote_cache.key(route, date_from, date_to)):
+                expires = self._expires.get(key)
+                if expires is None:
+                    continue
+                if expires > now:
+                    self.hits += 1
+                    return True
+                del self._expires[key]
+        return False
+    
+    def __len__(self) -> int:
+        return len(self._expires)
+
+
+negative_cache = NegativeCache()
+
+# Запросы к провайдерам, которые выполняются прямо сейчас: ключ -> Future
+_inflight: Dict[tuple, object] = {}
+_inflight_lock = threading.Lock()
+
+def _fetch_shared(route: str, date_from: Optional[str],
+                  date_to: Optional[str]) -> Optional[PriceQuote]:
+    """
+    Запрос цены у провайдеров, один на маршрут и даты: если такой же запрос
+    уже выполняется (другой пользователь или общий перелет другого маршрута),
+    ждем его результата вместо второго обращения к API.
+    """
+    from concurrent.futures import Future
+    
+    key = quote_cache.key(route, date_from, date_to)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+    if not owner:
+        return future.result()
+    
+    try:
+        logger.info("🔄 Запрос цены для маршрута: %s", route)
+        try:
+            quote = price_fanout.get_best_price(route, date_from, date_to)
+        except NoPriceData:
+            # Все источники ответили, что цен нет - не спрашиваем до истечения срока
+            negative_cache.add(route, date_from, date_to)
+            quote = None
+        if quote is not None:
+            quote_cache.put(route, date_from, date_to, quote)
+            price_graph.observe(route, date_from, date_to, quote.price, quote.provider)
+        future.set_result(quote)
+        return quote
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+def get_itinerary_quote(legs: list, date_from: Optional[str] = None,
+                        date_to: Optional[str] = None, use_cache: bool = True) -> PriceQuote:
+    """
+    Total price of a multi-leg route (see utils.routes.route_legs, leg_dates).
+    Legs are fetched in parallel, so the call takes about as long as the slowest leg;
+    each leg goes through the quote cache and is shared with other routes.
+    """
+    futures = [leg_pool.submit(get_price_quote, leg, leg_from, leg_to, use_cache)
+               for leg, (leg_from, leg_to) in zip(legs, leg_dates(len(legs), date_from, date_to))]
+    quotes = [future.result() for future in futures]
+    
+    providers = sorted({quote.provider for quote in quotes})
+    provider = MOCK_PROVIDER if MOCK_PROVIDER in providers else "+".join(providers)
+    return PriceQuote(sum(quote.price for quote in quotes), provider)
+
+def get_price_quote(route: str, date_from: Optional[str] = None,
+                    date_to: Optional[str] = None, use_cache: bool = True) -> PriceQuote:
+    """
+    Best price for a route among all providers that answered before the deadline.
+    When no provider has a price, tries the cheapest connection over cached
+    prices (see connections.py) and then falls back to mock data.
+    Routes with an unknown city or without data recently (negative_cache)
+    are not sent to the providers at all.
+    A provider price younger than QUOTE_TTL_SECONDS is served from quote_cache.
+    For a multi-leg route ("Москва-Сочи-Москва") returns the sum of its legs.
     
     Args:
         route: string in format "Москва-Сочи" or "Москва - Сочи"
+        date_from: departure date YYYY-MM-DD (optional)
+        date_to: last departure date of the range, YYYY-MM-DD (optional)
+        use_cache: False - always ask the providers (prefetch refresh)
     
     Returns:
-        Price in rubles or None
+        PriceQuote(price in rubles, provider name)
     """
     try:
-        logger.info(f"🔄 Запрос цены для маршрута: {route}")
+        legs = route_legs(route)
+        if len(legs) > 1:
+            return get_itinerary_quote(legs, date_from, date_to, use_cache)
+        
+        if get_provider_mode() == "mock":
+            return PriceQuote(get_mock_price(route), STUB_PROVIDER)
         
-        # Try to get real price
-        real_price = real_parser.get_simple_price(route)
+        if use_cache:
+            quote = quote_cache.get(route, date_from, date_to)
+            if quote is not None:
+                return quote
         
-        if real_price is not None:
-            logger.info(f"✅ Получена реальная цена: {real_price} руб.")
-            return real_price
-        else:
-            # Fallback: return mock price
-            logger.warning(f"⚠️ Не удалось получить реальную цену для {route}, использую заглушку")
-            return get_mock_price(route)
+        # Неизвестный город или недавно не было данных - к API не обращаемся
+        known_bad = find_unknown_city(route) is not None or (route, date_from, date_to) in negative_cache
+        quote = None if known_bad else _fetch_shared(route, date_from, date_to)
+        
+        if quote is not None:
+            logger.info("✅ Получена реальная цена: %s руб. (%s)", quote.price, quote.provider)
+            return quote
+        
+        if PRICE_CONNECTIONS:
+            connection = price_graph.cheapest(route, date_from, date_to)
+            if connection is not None:
+                logger.info("🔀 Нет прямой цены для %s, стыковка %s: %s руб.",
+                            route, "-".join(connection.path), connection.price)
+                return PriceQuote(connection.price,
+                                  f"{CONNECTION_PROVIDER} {'-'.join(connection.path)}")
+        
+        # Fallback: return mock price (not stored, see MOCK_PROVIDER)
+        if not known_bad:
+            logger.warning("⚠️ Не удалось получить реальную цену для %s, использую заглушку", route)
+        return PriceQuote(get_mock_price(route), MOCK_PROVIDER)
             
     except Exception as e:
         logger.error(f"💥 Критическая ошибка в get_price: {e}")
         # Always return mock price on error
-        return get_mock_price(route)
-
-
-def get_mock_price(route: str) -> float:
-    """
-    Mock function returning fake prices.
-    Used when API fails.
-    """
-    route_lower = route.lower()
-    
-    # Simple logic for demonstration
-    if "пекин" in route_lower or "beijing" in route_lower:
-        return 45000.0
-    elif "сочи" in route_lower:
-        return 12000.0
-    elif "казань" in route_lower:
-        return 8000.0
-    elif "париж" in route_lower or "paris" in route_lower:
-        return 25000.0
-    elif "лондон" in route_lower or "london" in route_lower:
-        return 30000.0
-    elif "дубай" in route_lower or "dubai" in route_lower:
-        return 35000.0
-    elif "токио" in route_lower or "tokyo" in route_lower:
-        return 50000.0
-    elif "санкт-петербург" in route_lower or "питер" in route_lower:
-        return 7000.0
-    elif "краснодар" in route_lower:
-        return 9000.0
-    elif "екатеринбург" in route_lower:
-        return 10000.0
-    elif "новосибирск" in route_lower:
-        return 15000.0
-    else:
-        return 15000.0  # Default price
+        return PriceQuote(get_mock_price(route), MOCK_PROVIDER)
+
+
+def get_price(route: str, date_from: Optional[str] = None,
+              date_to: Optional[str] = None) -> Optional[float]:
+    """
+    Main function to get price for a route.
+    Uses real providers with fallback to mock data.
+    
+    Args:
+        route: string in format "Москва-Сочи" or "Москва - Сочи"
+        date_from: departure date YYYY-MM-DD (optional)
+        date_to: last departure date of the range, YYYY-MM-DD (optional)
+    
+    Returns:
+        Price in rubles or None
+    """
+    return get_price_quote(route, date_from, date_to).price
 
 
 def get_available_routes() -> list:
@@ -103,12 +321,13 @@ def format_price_message(route: str, price: float) -> str:
 # === Обертка для совместимости со старым кодом ===
 class ParserWrapper:
     """Обертка для совместимости со старым кодом бота"""
-    def check_route(self, route):
+    def check_route(self, route, date_from=None, date_to=None):
         """Совместимость со старым кодом"""
-        price = get_price(route)
+        quote = get_price_quote(route, date_from, date_to)
         return {
-            'success': True if price else False, 
-            'price': price,
+            'success': bool(quote.price) and quote.provider != MOCK_PROVIDER,
+            'price': quote.price,
+            'provider': quote.provider,
             'route': route
         }
 
@@ -117,6 +336,9 @@ parser = ParserWrapper()
 
 # Test function
 if __name__ == "__main__":
+    from utils.logger import setup_logger
+    setup_logger()
+    
     test_routes = [
         "Москва-Сочи",
         "Санкт-Петербург - Пекин",
@@ -129,7 +351,7 @@ if __name__ == "__main__":
     
     for route in test_routes:
         print(f"🔍 Маршрут: {route}")
-        price = get_price(route)
-        source = "РЕАЛЬНЫЙ API" if price != get_mock_price(route) else "ЗАГЛУШКА (fallback)"
-        print(f"   💰 Цена: {price:,.0f} руб. ({source})")
+        quote = get_price_quote(route)
+        source = "ЗАГЛУШКА (fallback)" if quote.provider == MOCK_PROVIDER else quote.provider
+        print(f"   💰 Цена: {quote.price:,.0f} руб. ({source})")
         print()
\ No newline at end of file
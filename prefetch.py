@@ -0,0 +1,178 @@
+"""
+Предзагрузка цен популярных маршрутов.
+
+Ручные проверки приходят волнами (утром, после уведомлений), и первый
+запрос по маршруту ждет ответа API. Поэтому незадолго до известных пиков
+(PREFETCH_PEAKS, минус PREFETCH_LEAD_MINUTES) и сразу после запуска бота
+цены самых популярных маршрутов запрашиваются заранее и попадают в кэш
+цен parser.quote_cache - проверки в пик обслуживаются из него.
+
+Полученные цены публикуются всем подписчикам (alerts.publish_prices).
+
+Популярность маршрута = число подписчиков + частота недавних /check
+(счетчик с полураспадом PREFETCH_HALF_LIFE_HOURS). За проход обновляется
+не больше PREFETCH_TOP_N маршрутов, за сутки - не больше
+PREFETCH_BUDGET_PER_DAY запросов к источникам цен: маршрут из нескольких
+перелетов стоит запрос на каждый перелет у каждого источника.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Dict, List, Optional
+
+from parser import MOCK_PROVIDER, get_price_quote, price_fanout, quote_cache
+from providers import get_provider_mode
+from utils.routes import route_legs
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", "20"))
+PREFETCH_BUDGET_PER_DAY = int(os.getenv("PREFETCH_BUDGET_PER_DAY", "200"))
+PREFETCH_PEAKS = os.getenv("PREFETCH_PEAKS", "09:00,19:00")
+PREFETCH_LEAD_MINUTES = int(os.getenv("PREFETCH_LEAD_MINUTES", "10"))
+PREFETCH_HALF_LIFE_HOURS = float(os.getenv("PREFETCH_HALF_LIFE_HOURS", "24"))
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "4"))
+PREFETCH_STARTUP_DELAY = 15  # секунд после запуска - сначала поднимается бот
+
+
+def prefetch_times(peaks: str = PREFETCH_PEAKS,
+                   lead_minutes: int = PREFETCH_LEAD_MINUTES) -> List[dt_time]:
+    """Время запуска предзагрузки: за lead_minutes до каждого пика "ЧЧ:ММ" """
+    times = []
+    for peak in filter(None, (part.strip() for part in peaks.split(","))):
+        start = datetime.combine(date.today(), datetime.strptime(peak, "%H:%M").time())
+        times.append((start - timedelta(minutes=lead_minutes)).time())
+    return times
+
+
+class RoutePrefetcher:
+    """Рейтинг популярности маршрутов и обновление цен лучших из них"""
+
+    def __init__(self, top_n: int = PREFETCH_TOP_N,
+                 budget_per_day: int = PREFETCH_BUDGET_PER_DAY,
+                 half_life_hours: float = PREFETCH_HALF_LIFE_HOURS):
+        self.top_n = top_n
+        self.budget_per_day = budget_per_day
+        self.decay = math.log(2) / (half_life_hours * 3600)
+        # ключ маршрута -> [маршрут, счетчик проверок, время последнего обновления счетчика]
+        self._checks: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        self._budget_day: Optional[date] = None
+        self._spent = 0
+
+    def record_check(self, route: str, date_from: Optional[str] = None,
+                     date_to: Optional[str] = None, now: Optional[float] = None):
+        """Учитывает ручную проверку маршрута"""
+        now = time.time() if now is None else now
+        key = quote_cache.key(route, date_from, date_to)
+        with self._lock:
+            entry = self._checks.get(key)
+            if entry is None:
+                self._checks[key] = [route, 1.0, now]
+            else:
+                entry[1] = entry[1] * math.exp(-self.decay * (now - entry[2])) + 1
+                entry[2] = now
+
+    def rank(self, subscribers: List[tuple], now: Optional[float] = None) -> List[tuple]:
+        """
+        Маршруты по убыванию популярности: [(score, route, date_from, date_to), ...]
+        subscribers - строки db.get_route_subscribers()
+        """
+        now = time.time() if now is None else now
+        scores: Dict[tuple, list] = {}
+        for route_key, date_from, date_to, route, count in subscribers:
+            scores[(route_key, date_from, date_to)] = [float(count), route]
+
+        with self._lock:
+            for key, (route, checks, updated_at) in list(self._checks.items()):
+                recent = checks * math.exp(-self.decay * (now - updated_at))
+                if recent < 0.01:
+                    # Маршрут давно не проверяли - забываем
+                    del self._checks[key]
+                    continue
+                scores.setdefault(key, [0.0, route])[0] += recent
+
+        ranked = [(score, route, key[1], key[2]) for key, (score, route) in scores.items()]
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return ranked
+
+    def remaining_budget(self) -> int:
+        today = date.today()
+        if self._budget_day != today:
+            self._budget_day, self._spent = today, 0
+        return max(self.budget_per_day - self._spent, 0)
+
+    async def refresh(self, store, limit: Optional[int] = None) -> List[tuple]:
+        """
+        Обновляет в кэше цены самых популярных маршрутов.
+        Returns: полученные цены [(route_key, date_from, date_to, цена, источник), ...]
+        """
+        if get_provider_mode() == "mock":
+            return []
+
+        limit = self.top_n if limit is None else limit
+        budget = self.remaining_budget()
+        providers = max(len(price_fanout.providers), 1)
+        top = []
+        for item in self.rank(store.get_route_subscribers()):
+            # Оценка стоимости: запрос на каждый перелет у каждого источника
+            cost = len(route_legs(item[1])) * providers
+            if len(top) >= limit or cost > budget:
+                break
+            budget -= cost
+            top.append(item)
+        if not top:
+            return []
+
+        semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+
+        async def fetch(route: str, date_from: Optional[str], date_to: Optional[str]):
+            async with semaphore:
+                return await asyncio.to_thread(get_price_quote, route, date_from, date_to, False)
+
+        calls_before = price_fanout.calls
+        results = await asyncio.gather(
+            *(fetch(route, date_from, date_to) for _, route, date_from, date_to in top),
+            return_exceptions=True
+        )
+        # Фактически отправленные запросы. Ручные проверки, совпавшие с проходом,
+        # тоже попадают в счетчик: бюджет расходуется с запасом, но не занижается
+        self._spent += price_fanout.calls - calls_before
+
+        observations = []
+        for (_, route, date_from, date_to), quote in zip(top, results):
+            if isinstance(quote, Exception):
+                logger.error("Ошибка предзагрузки цены %s: %s", route, quote)
+            elif quote.price and quote.provider != MOCK_PROVIDER:
+                observations.append(quote_cache.key(route, date_from, date_to)
+                                    + (quote.price, quote.provider))
+        return observations
+
+
+prefetcher = RoutePrefetcher()
+
+
+async def prefetch_job(context):
+    """Задача JobQueue: предзагрузка цен популярных маршрутов"""
+    from alerts import publish_prices
+    from database import db
+
+    try:
+        started = time.perf_counter()
+        observations = await prefetcher.refresh(db)
+        # Свежие цены сразу записываются подписчикам - запрос к API не пропадает
+        updated = await publish_prices(context.bot, db, observations)
+        if observations:
+            logger.info(
+                "🔥 Предзагружено маршрутов: %s, обновлено подписок: %s за %.1f с "
+                "(осталось запросов на сегодня: %s)",
+                len(observations), len(updated), time.perf_counter() - started,
+                prefetcher.remaining_budget()
+            )
+    except Exception as e:
+        logger.error(f"Ошибка в prefetch_job: {e}")
@@ -0,0 +1,85 @@
+"""
+Источники цен.
+
+Режим выбирается переменной окружения PRICE_PROVIDER_MODE:
+    live   - реальные запросы к API (по умолчанию)
+    record - реальные запросы с записью ответов в кассету
+    replay - ответы только из кассеты, без сети
+    mock   - без API, только заглушки
+
+Кассета: PRICE_CASSETTE (по умолчанию cassettes/prices.jsonl.gz).
+Для replay: PRICE_REPLAY_TIMING=1 включает имитацию задержек,
+PRICE_REPLAY_SPEED ускоряет их (2 = вдвое быстрее записи).
+
+Опрашиваемые источники - PRICE_PROVIDERS через запятую:
+    aviasales, aviasales_stub, trains, trains_stub
+Дедлайн на один запрос цены - PRICE_DEADLINE_SECONDS.
+"""
+
+import logging
+import os
+
+from providers.base import NoPriceData, PriceProvider, PriceQuote, StubProvider
+from providers.cassette import Cassette, CassetteMiss, RecordingTransport, ReplayTransport
+from providers.fanout import PriceFanout
+from providers.mock import get_mock_price
+from utils.env import load_env
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CASSETTE = "cassettes/prices.jsonl.gz"
+
+
+def get_provider_mode() -> str:
+    load_env()
+    return os.getenv("PRICE_PROVIDER_MODE", "live").lower()
+
+
+def build_transport(mode: str = None):
+    """Создает транспорт для AviasalesParser по режиму работы"""
+    mode = mode or get_provider_mode()
+    cassette_path = os.getenv("PRICE_CASSETTE", DEFAULT_CASSETTE)
+    
+    if mode == "replay":
+        return ReplayTransport(
+            Cassette(cassette_path).load(),
+            simulate_timing=os.getenv("PRICE_REPLAY_TIMING", "0") == "1",
+            speed=float(os.getenv("PRICE_REPLAY_SPEED", "1"))
+        )
+    
+    from providers.transport import HttpTransport
+    if mode == "record":
+        return RecordingTransport(HttpTransport(), Cassette(cassette_path))
+    return HttpTransport()
+
+
+def build_providers(parser, transport, names: str = None):
+    """Создает источники цен по списку имен из PRICE_PROVIDERS"""
+    from providers.aviasales import AviasalesProvider
+    from providers.trains import TrainFareProvider, get_stub_train_fare
+    
+    load_env()
+    names = names or os.getenv("PRICE_PROVIDERS", "aviasales,trains")
+    providers = []
+    for name in (n.strip().lower() for n in names.split(",")):
+        if name == "aviasales":
+            providers.append(AviasalesProvider(parser))
+        elif name == "aviasales_stub":
+            providers.append(StubProvider("aviasales", get_mock_price))
+        elif name == "trains":
+            if os.getenv("TRAIN_API_URL"):
+                providers.append(TrainFareProvider(transport))
+            else:
+                logger.warning("TRAIN_API_URL не задан, источник trains отключен")
+        elif name == "trains_stub":
+            providers.append(StubProvider("trains", get_stub_train_fare))
+        elif name:
+            logger.warning(f"Неизвестный источник цен: {name}")
+    return providers
+
+
+def build_fanout(parser, transport) -> PriceFanout:
+    return PriceFanout(
+        build_providers(parser, transport),
+        deadline=float(os.getenv("PRICE_DEADLINE_SECONDS", "10"))
+    )
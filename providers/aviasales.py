@@ -0,0 +1,13 @@
+from providers.base import PriceProvider
+
+
+class AviasalesProvider(PriceProvider):
+    """Авиабилеты через API Aviasales/Travelpayouts"""
+    
+    name = "aviasales"
+    
+    def __init__(self, parser):
+        self.parser = parser
+    
+    def get_price(self, route, date_from=None, date_to=None):
+        return self.parser.get_simple_price(route, date_from, date_to)
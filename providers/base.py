@@ -0,0 +1,44 @@
+import time
+from abc import ABC, abstractmethod
+from typing import NamedTuple, Optional
+
+
+class PriceQuote(NamedTuple):
+    """Цена и источник, который ее дал"""
+    price: float
+    provider: str
+
+
+class NoPriceData(Exception):
+    """
+    Источник ответил, что цен на маршрут нет (или не знает город).
+    В отличие от None (ошибка сети, таймаут) - повторять запрос сейчас бессмысленно.
+    """
+
+
+class PriceProvider(ABC):
+    """Источник цен на маршрут. Наследники реализуют get_price."""
+    
+    name = "base"
+    
+    @abstractmethod
+    def get_price(self, route: str, date_from: Optional[str] = None,
+                  date_to: Optional[str] = None) -> Optional[float]:
+        """Цена маршрута; None - ошибка источника, NoPriceData - цен нет"""
+
+
+class StubProvider(PriceProvider):
+    """Локальная заглушка источника: цена из функции, опционально с задержкой"""
+    
+    def __init__(self, name: str, price_fn, delay: float = 0.0):
+        self.name = name
+        self.price_fn = price_fn
+        self.delay = delay
+    
+    def get_price(self, route, date_from=None, date_to=None):
+        if self.delay:
+            time.sleep(self.delay)
+        price = self.price_fn(route)
+        if price is None:
+            raise NoPriceData(route)
+        return price
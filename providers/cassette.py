@@ -0,0 +1,133 @@
+"""
+Запись и воспроизведение ответов API.
+
+Кассета - gzip-файл в формате JSON Lines: одна строка на запрос
+({"key": ..., "elapsed": ..., "response": ...}). Токен в кассету не пишется.
+
+Транспорты вызываются одновременно из нескольких потоков (PriceFanout,
+asyncio.to_thread, parser.leg_pool), поэтому запись в кассету и счетчики
+воспроизведения защищены блокировкой.
+"""
+
+import atexit
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Параметры, которые не входят в ключ и не сохраняются
+SECRET_PARAMS = {"token"}
+
+
+class CassetteMiss(LookupError):
+    """В кассете нет ответа на такой запрос"""
+
+
+def request_key(url: str, params: dict) -> str:
+    """Ключ запроса: URL и отсортированные параметры без секретов"""
+    items = sorted((k, str(v)) for k, v in params.items() if k not in SECRET_PARAMS)
+    return url + "?" + "&".join(f"{k}={v}" for k, v in items)
+
+
+class Cassette:
+    """Хранилище записанных ответов"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, List[dict]] = defaultdict(list)
+        self._writer = None
+        self._lock = threading.Lock()
+    
+    def load(self) -> "Cassette":
+        if not os.path.exists(self.path):
+            return self
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["key"]].append(entry)
+            except EOFError:
+                # Запись прервалась до закрытия потока: строки до обрыва целые
+                logger.warning(f"Кассета {self.path} не закрыта, прочитано записей: {len(self)}")
+        return self
+    
+    def append(self, key: str, response: dict, elapsed: float):
+        entry = {"key": key, "elapsed": round(elapsed, 4), "response": response}
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        
+        with self._lock:
+            self.entries[key].append(entry)
+            if self._writer is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                # Один поток gzip на сеанс записи, дописывается в конец файла:
+                # gzip допускает несколько склеенных потоков в одном файле
+                self._writer = gzip.open(self.path, "at", encoding="utf-8")
+                atexit.register(self.close)
+            self._writer.write(line)
+            # Сброс после каждой записи - ответы не теряются при падении процесса
+            self._writer.flush()
+    
+    def close(self):
+        """Закрывает поток записи (дописывает конец gzip-потока)"""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+    
+    def __len__(self):
+        return sum(len(entries) for entries in self.entries.values())
+
+
+class RecordingTransport:
+    """Выполняет реальные запросы и записывает ответы в кассету"""
+    
+    def __init__(self, inner, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+    
+    def get_json(self, url: str, params: dict, timeout: float = 15) -> dict:
+        started = time.perf_counter()
+        response = self.inner.get_json(url, params, timeout=timeout)
+        self.cassette.append(request_key(url, params), response, time.perf_counter() - started)
+        return response
+
+
+class ReplayTransport:
+    """
+    Отдает ответы из кассеты без обращения к сети.
+    
+    Повторные запросы с одним ключом получают записанные ответы по очереди
+    (последний повторяется). При simulate_timing запрос "длится" столько же,
+    сколько при записи, деленное на speed.
+    """
+    
+    def __init__(self, cassette: Cassette, simulate_timing: bool = False, speed: float = 1.0):
+        self.cassette = cassette
+        self.simulate_timing = simulate_timing
+        self.speed = speed
+        self._positions: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+    
+    def get_json(self, url: str, params: dict, timeout: float = 15) -> dict:
+        key = request_key(url, params)
+        entries = self.cassette.entries.get(key)
+        if not entries:
+            raise CassetteMiss(f"Нет записи в кассете для {key}")
+        
+        with self._lock:
+            position = self._positions[key]
+            self._positions[key] = position + 1
+        entry = entries[min(position, len(entries) - 1)]
+        
+        if self.simulate_timing and self.speed > 0:
+            time.sleep(min(entry["elapsed"] / self.speed, timeout))
+        return entry["response"]
@@ -0,0 +1,101 @@
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import monotonic
+from typing import List, Optional
+
+from providers.base import NoPriceData, PriceProvider, PriceQuote
+
+logger = logging.getLogger(__name__)
+
+_NO_DATA = object()
+
+
+class PriceFanout:
+    """
+    Опрашивает несколько источников параллельно и возвращает лучшую цену
+    среди ответивших до дедлайна. Медленный источник не задерживает ответ:
+    его запрос дорабатывает в фоне, а результат отбрасывается.
+    
+    У каждого источника свой пул на max_workers потоков. Зависшие запросы
+    медленного источника занимают только его потоки: когда все они заняты,
+    источник пропускается сразу, а не ставится в очередь, и не мешает
+    остальным источникам.
+    """
+    
+    def __init__(self, providers: List[PriceProvider], deadline: float = 10.0,
+                 max_workers: int = 4):
+        self.providers = providers
+        self.deadline = deadline
+        # Сколько запросов отправлено источникам (для бюджета предзагрузки)
+        self.calls = 0
+        self._calls_lock = threading.Lock()
+        self._executors = [
+            ThreadPoolExecutor(max_workers=max_workers,
+                               thread_name_prefix=f"price-{provider.name}")
+            for provider in providers
+        ]
+        self._slots = [threading.BoundedSemaphore(max_workers) for _ in providers]
+    
+    def _safe_get_price(self, provider, slot, route, date_from, date_to):
+        with self._calls_lock:
+            self.calls += 1
+        try:
+            return provider.get_price(route, date_from, date_to)
+        except NoPriceData:
+            return _NO_DATA
+        except Exception as e:
+            logger.error(f"Ошибка источника {provider.name} для {route}: {e}")
+            return None
+        finally:
+            slot.release()
+    
+    def get_best_price(self, route: str, date_from: Optional[str] = None,
+                       date_to: Optional[str] = None,
+                       deadline: Optional[float] = None) -> Optional[PriceQuote]:
+        """
+        Минимальная цена среди источников, успевших ответить.
+        None - цены нет; NoPriceData - все источники ответили, что данных нет.
+        """
+        if not self.providers:
+            return None
+        
+        futures = {}
+        busy = []
+        for provider, executor, slot in zip(self.providers, self._executors, self._slots):
+            if not slot.acquire(blocking=False):
+                busy.append(provider.name)
+                continue
+            future = executor.submit(self._safe_get_price, provider, slot, route, date_from, date_to)
+            futures[future] = provider
+        if busy:
+            logger.warning(f"⏳ Источники заняты зависшими запросами, пропущены для {route}: "
+                           f"{', '.join(busy)}")
+        
+        expires_at = monotonic() + (self.deadline if deadline is None else deadline)
+        pending = set(futures)
+        best = None
+        no_data = 0
+        while pending:
+            remaining = expires_at - monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                price = future.result()
+                if price is _NO_DATA:
+                    no_data += 1
+                elif price is not None and (best is None or price < best.price):
+                    best = PriceQuote(price, futures[future].name)
+        
+        if pending:
+            late = ", ".join(futures[future].name for future in pending)
+            logger.warning(f"⏰ Источники не успели ответить для {route}: {late}")
+        
+        if best is None and no_data == len(self.providers):
+            raise NoPriceData(route)
+        return best
+    
+    def shutdown(self):
+        for executor in self._executors:
+            executor.shutdown(wait=False)
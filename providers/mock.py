@@ -0,0 +1,30 @@
+"""Заглушки цен на случай, когда API недоступен"""
+
+DEFAULT_MOCK_PRICE = 15000.0
+
+# Подстрока маршрута -> цена. Проверяются по порядку, первое совпадение побеждает.
+MOCK_PRICES = [
+    (("пекин", "beijing"), 45000.0),
+    (("сочи",), 12000.0),
+    (("казань",), 8000.0),
+    (("париж", "paris"), 25000.0),
+    (("лондон", "london"), 30000.0),
+    (("дубай", "dubai"), 35000.0),
+    (("токио", "tokyo"), 50000.0),
+    (("санкт-петербург", "питер"), 7000.0),
+    (("краснодар",), 9000.0),
+    (("екатеринбург",), 10000.0),
+    (("новосибирск",), 15000.0),
+]
+
+
+def get_mock_price(route: str) -> float:
+    """
+    Mock function returning fake prices.
+    Used when API fails.
+    """
+    route_lower = route.lower()
+    for names, price in MOCK_PRICES:
+        if any(name in route_lower for name in names):
+            return price
+    return DEFAULT_MOCK_PRICE
@@ -0,0 +1,68 @@
+import logging
+import os
+from typing import Optional
+
+from providers.base import NoPriceData, PriceProvider
+from utils.routes import canonical_route, split_route
+
+logger = logging.getLogger(__name__)
+
+# Заглушка ж/д тарифов (плацкарт, руб) для локального запуска
+TRAIN_STUB_FARES = {
+    "москва-санкт-петербург": 3500.0,
+    "москва-казань": 2800.0,
+    "москва-нижний новгород": 1500.0,
+    "москва-сочи": 6500.0,
+    "москва-краснодар": 5200.0,
+    "москва-екатеринбург": 5900.0,
+    "санкт-петербург-казань": 4700.0,
+}
+
+
+def get_stub_train_fare(route: str) -> Optional[float]:
+    """Тариф из заглушки в обе стороны маршрута"""
+    parts = split_route(route)
+    if not parts:
+        return None
+    key = canonical_route(route)
+    reverse_key = canonical_route(f"{parts[1]}-{parts[0]}")
+    return TRAIN_STUB_FARES.get(key) or TRAIN_STUB_FARES.get(reverse_key)
+
+
+class TrainFareProvider(PriceProvider):
+    """
+    Ж/д билеты через HTTP API тарифов (TRAIN_API_URL).
+    
+    Ожидается JSON вида {"price": 3500} на запрос
+    ?from=Москва&to=Казань[&date_from=YYYY-MM-DD&date_to=YYYY-MM-DD].
+    """
+    
+    name = "trains"
+    
+    def __init__(self, transport, base_url: str = None, api_key: str = None):
+        self.transport = transport
+        self.base_url = base_url or os.getenv("TRAIN_API_URL")
+        self.api_key = api_key or os.getenv("TRAIN_API_KEY")
+    
+    def get_price(self, route, date_from=None, date_to=None):
+        parts = split_route(route)
+        if not parts:
+            return None
+        
+        params = {"from": parts[0], "to": parts[1]}
+        if date_from:
+            params["date_from"] = date_from
+            params["date_to"] = date_to or date_from
+        if self.api_key:
+            params["token"] = self.api_key
+        
+        try:
+            data = self.transport.get_json(self.base_url, params, timeout=15)
+        except Exception as e:
+            logger.error(f"Ошибка запроса ж/д тарифа для {route}: {e}")
+            return None
+        
+        price = data.get("price")
+        if price is None:
+            raise NoPriceData(route)
+        return float(price)
@@ -0,0 +1,9 @@
+class HttpTransport:
+    """Обычные HTTP-запросы к API"""
+    
+    def get_json(self, url: str, params: dict, timeout: float = 15) -> dict:
+        import requests  # тяжелый импорт - только при первом запросе
+        
+        response = requests.get(url, params=params, timeout=timeout)
+        response.raise_for_status()  # Проверка на HTTP ошибки
+        return response.json()
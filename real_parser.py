@@ -1,40 +1,68 @@
 import os
-import requests
 import logging
-from typing import Optional
-from datetime import datetime, timedelta
-from dotenv import load_dotenv
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from datetime import date, datetime, timedelta
+from utils.env import load_env
+from utils.routes import split_route
+from providers.base import NoPriceData
+from providers.cassette import CassetteMiss
 
-# Загружаем переменные окружения
-load_dotenv()
-
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Города -> IATA коды (используется и графом цен, см. connections.py)
+CITY_TO_IATA = {
+    "москва": "MOW",
+    "сочи": "AER", 
+    "санкт-петербург": "LED",
+    "питер": "LED",
+    "казань": "KZN",
+    "екатеринбург": "SVX",
+    "новосибирск": "OVB",
+    "краснодар": "KRR",
+    "пекин": "PEK",
+    "париж": "CDG",
+    "лондон": "LHR",
+    "токио": "NRT",
+    "дубай": "DXB"
+}
+
+def get_iata_code(city_name: str) -> Optional[str]:
+    """IATA код города или None, если город неизвестен"""
+    return CITY_TO_IATA.get(city_name.strip().lower())
+
 class AviasalesParser:
     """Парсер для работы с API Aviasales/Travelpayouts"""
     
-    def __init__(self):
+    def __init__(self, transport=None):
+        """
+        Args:
+            transport: объект с методом get_json(url, params, timeout).
+                По умолчанию - обычные HTTP-запросы; для записи и
+                воспроизведения ответов см. providers.build_transport
+        """
+        # Загружаем переменные окружения
+        load_env()
+        
+        if transport is None:
+            from providers.transport import HttpTransport
+            transport = HttpTransport()
+        self.transport = transport
         self.api_key = os.getenv("AVIASALES_API_KEY")
         self.base_url = "https://api.travelpayouts.com/v2/prices/latest"
+        self.calendar_url = "https://api.travelpayouts.com/v1/prices/calendar"
+        
+        # Кеш календарей цен: (origin, destination, "YYYY-MM") -> (время, {дата: цена}),
+        # не больше calendar_cache_size записей, давно не нужные вытесняются первыми
+        self.calendar_ttl = int(os.getenv("CALENDAR_TTL_SECONDS", "3600"))
+        self.calendar_cache_size = int(os.getenv("CALENDAR_CACHE_SIZE", "1000"))
+        self._calendar_cache: OrderedDict = OrderedDict()
+        self._calendar_lock = threading.Lock()
         
         # Словарь для конвертации городов в IATA коды
-        self.city_to_iata = {
-            "москва": "MOW",
-            "сочи": "AER", 
-            "санкт-петербург": "LED",
-            "питер": "LED",
-            "казань": "KZN",
-            "екатеринбург": "SVX",
-            "новосибирск": "OVB",
-            "краснодар": "KRR",
-            "пекин": "PEK",
-            "париж": "CDG",
-            "лондон": "LHR",
-            "токио": "NRT",
-            "дубай": "DXB"
-        }
+        self.city_to_iata = CITY_TO_IATA
     
     def _get_iata_code(self, city_name: str) -> Optional[str]:
         """Конвертирует название города в IATA код"""
@@ -61,6 +89,9 @@ class AviasalesParser:
         
         Returns:
             Минимальная цена в рублях или None при ошибке
+        
+        Raises:
+            NoPriceData: город неизвестен или API ответил, что билетов нет
         """
         try:
             # Конвертируем города в IATA коды
@@ -68,11 +99,9 @@ class AviasalesParser:
             dest_iata = self._get_iata_code(destination_city)
             
             if not origin_iata:
-                logger.error(f"Не найден IATA код для города: {origin_city}")
-                return None
+                raise NoPriceData(f"Не найден IATA код для города: {origin_city}")
             if not dest_iata:
-                logger.error(f"Не найден IATA код для города: {destination_city}")
-                return None
+                raise NoPriceData(f"Не найден IATA код для города: {destination_city}")
             
             # Параметры запроса
             params = {
@@ -83,13 +112,10 @@ class AviasalesParser:
                 "limit": 10  # Берем до 10 результатов
             }
             
-            logger.info(f"Запрос к API: {origin_iata} → {dest_iata}")
+            logger.info("Запрос к API: %s → %s", origin_iata, dest_iata)
             
             # Отправляем запрос
-            response = requests.get(self.base_url, params=params, timeout=15)
-            response.raise_for_status()  # Проверка на HTTP ошибки
-            
-            data = response.json()
+            data = self.transport.get_json(self.base_url, params, timeout=15)
             
             if not data.get("success"):
                 logger.error(f"API вернул ошибку: {data}")
@@ -98,22 +124,109 @@ class AviasalesParser:
             # Ищем минимальную цену среди всех билетов
             tickets = data.get("data", [])
             if not tickets:
-                logger.info(f"Нет данных по маршруту {origin_iata} → {dest_iata}")
-                return None
+                logger.info("Нет данных по маршруту %s → %s", origin_iata, dest_iata)
+                raise NoPriceData(f"{origin_iata} → {dest_iata}")
             
             # Фильтруем только билеты с ценой
             prices = [t.get("value") for t in tickets if t.get("value") is not None]
             if not prices:
-                return None
+                raise NoPriceData(f"{origin_iata} → {dest_iata}")
             
             min_price = min(prices)
-            logger.info(f"Найдена минимальная цена: {min_price} руб.")
+            logger.info("Найдена минимальная цена: %s руб.", min_price)
             
             return min_price
             
-        except requests.exceptions.RequestException as e:
+        except NoPriceData:
+            raise
+        except OSError as e:  # requests.RequestException наследуется от OSError
+            logger.error(f"Ошибка сети: {e}")
+            return None
+        except CassetteMiss as e:
+            logger.warning(str(e))
+            return None
+        except ValueError as e:
+            logger.error(f"Ошибка парсинга JSON: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка: {e}")
+            return None
+    
+    def _get_cached_calendar(self, key: Tuple[str, str, str]) -> Optional[Dict[str, float]]:
+        with self._calendar_lock:
+            cached = self._calendar_cache.get(key)
+            if cached is None:
+                return None
+            if time.monotonic() - cached[0] >= self.calendar_ttl:
+                del self._calendar_cache[key]
+                return None
+            self._calendar_cache.move_to_end(key)
+            return cached[1]
+    
+    def _cache_calendar(self, key: Tuple[str, str, str], calendar: Dict[str, float]):
+        now = time.monotonic()
+        with self._calendar_lock:
+            self._calendar_cache[key] = (now, calendar)
+            self._calendar_cache.move_to_end(key)
+            if len(self._calendar_cache) <= self.calendar_cache_size:
+                return
+            # Сначала убираем устаревшие, затем самые давно не нужные
+            for stale in [k for k, (at, _) in self._calendar_cache.items()
+                          if now - at >= self.calendar_ttl]:
+                del self._calendar_cache[stale]
+            while len(self._calendar_cache) > self.calendar_cache_size:
+                self._calendar_cache.popitem(last=False)
+    
+    def get_month_calendar(self, origin_iata: str, dest_iata: str, month: str) -> Optional[Dict[str, float]]:
+        """
+        Календарь минимальных цен на месяц одним запросом
+        
+        Args:
+            origin_iata: IATA код отправления
+            dest_iata: IATA код назначения
+            month: месяц в формате YYYY-MM
+        
+        Returns:
+            Словарь {дата вылета YYYY-MM-DD: цена} или None при ошибке
+        """
+        key = (origin_iata, dest_iata, month)
+        cached = self._get_cached_calendar(key)
+        if cached is not None:
+            return cached
+        
+        try:
+            params = {
+                "currency": "rub",
+                "origin": origin_iata,
+                "destination": dest_iata,
+                "depart_date": month,
+                "calendar_type": "departure_date",
+                "token": self.api_key
+            }
+            
+            logger.info("Запрос календаря к API: %s → %s (%s)", origin_iata, dest_iata, month)
+            
+            data = self.transport.get_json(self.calendar_url, params, timeout=15)
+            
+            if not data.get("success"):
+                logger.error(f"API вернул ошибку: {data}")
+                return None
+            
+            calendar = {}
+            for day, ticket in (data.get("data") or {}).items():
+                price = ticket.get("price")
+                if price is not None:
+                    calendar[day[:10]] = float(price)
+            
+            self._cache_calendar(key, calendar)
+            return calendar
+            
+        except OSError as e:  # requests.RequestException наследуется от OSError
             logger.error(f"Ошибка сети: {e}")
             return None
+        except CassetteMiss as e:
+            logger.warning(str(e))
+            return None
         except ValueError as e:
             logger.error(f"Ошибка парсинга JSON: {e}")
             return None
@@ -121,55 +234,76 @@ class AviasalesParser:
             logger.error(f"Неожиданная ошибка: {e}")
             return None
     
-    def get_simple_price(self, route: str) -> Optional[float]:
+    def get_price_for_dates(self, origin_city: str, destination_city: str,
+                            date_from: str, date_to: Optional[str] = None) -> Optional[float]:
+        """
+        Минимальная цена на даты вылета из диапазона.
+        На каждый месяц диапазона делается не больше одного запроса календаря,
+        остальные маршруты на этот месяц отвечаются из кеша.
+        NoPriceData - если все календари получены, а цен на эти даты нет.
+        """
+        origin_iata = self._get_iata_code(origin_city)
+        dest_iata = self._get_iata_code(destination_city)
+        
+        if not origin_iata:
+            raise NoPriceData(f"Не найден IATA код для города: {origin_city}")
+        if not dest_iata:
+            raise NoPriceData(f"Не найден IATA код для города: {destination_city}")
+        
+        failed = False
+        start = date.fromisoformat(date_from)
+        end = date.fromisoformat(date_to or date_from)
+        
+        prices = []
+        month_start = start.replace(day=1)
+        while month_start <= end:
+            calendar = self.get_month_calendar(origin_iata, dest_iata, month_start.strftime("%Y-%m"))
+            failed = failed or calendar is None
+            if calendar:
+                prices.extend(
+                    price for day, price in calendar.items()
+                    if date_from <= day <= (date_to or date_from)
+                )
+            # Переходим к первому числу следующего месяца
+            month_start = (month_start + timedelta(days=32)).replace(day=1)
+        
+        if not prices:
+            if failed:
+                return None
+            logger.info("Нет данных по маршруту %s → %s на %s..%s", origin_iata, dest_iata, date_from, date_to or date_from)
+            raise NoPriceData(f"{origin_iata} → {dest_iata} на {date_from}..{date_to or date_from}")
+        
+        min_price = min(prices)
+        logger.info("Найдена минимальная цена на даты: %s руб.", min_price)
+        return min_price
+    
+    def get_simple_price(self, route: str, date_from: Optional[str] = None,
+                         date_to: Optional[str] = None) -> Optional[float]:
         """
         Упрощенный интерфейс: принимает строку "Москва-Сочи" или "Москва – Сочи"
-        Обрабатывает разные форматы тире для совместимости с ботом
+        Обрабатывает разные форматы тире для совместимости с ботом.
+        Если заданы даты (YYYY-MM-DD), цена берется из календаря на эти даты.
         """
         try:
             # Очищаем строку
             route = route.strip()
             
             # Логируем что получили
-            logger.debug(f"Обрабатываем маршрут: '{route}'")
-            
-            # Список разделителей в порядке приоритета
-            separators = [" – ", " — ", " - ", "–", "—", "-"]
-            
-            # Пробуем каждый разделитель
-            for sep in separators:
-                if sep in route:
-                    parts = route.split(sep)
-                    if len(parts) == 2:
-                        origin = parts[0].strip()
-                        destination = parts[1].strip()
-                        logger.debug(f"Разделитель '{sep}': '{origin}' -> '{destination}'")
-                        return self.get_price(origin, destination)
-            
-            # Если не нашли стандартные разделители, ищем последний дефис
-            # (для случаев типа "Санкт-Петербург-Пекин")
-            if "-" in route:
-                # Проверяем, есть ли город с дефисом
-                if "санкт-петербург" in route.lower():
-                    # Берем "Санкт-Петербург" как город отправления
-                    origin = "Санкт-Петербург"
-                    # Все что после "Санкт-Петербург-" — город назначения
-                    start_idx = route.lower().find("санкт-петербург") + len("Санкт-Петербург")
-                    destination = route[start_idx:].strip("- ")
-                    logger.debug(f"Город с дефисом: '{origin}' -> '{destination}'")
-                    return self.get_price(origin, destination)
-                else:
-                    # Разделяем по последнему дефису
-                    last_dash = route.rfind("-")
-                    if last_dash > 0:
-                        origin = route[:last_dash].strip()
-                        destination = route[last_dash + 1:].strip()
-                        logger.debug(f"Последний дефис: '{origin}' -> '{destination}'")
-                        return self.get_price(origin, destination)
+            logger.debug("Обрабатываем маршрут: '%s'", route)
+            
+            parts = split_route(route)
+            if parts:
+                origin, destination = parts
+                logger.debug("Маршрут разобран: '%s' -> '%s'", origin, destination)
+                if date_from:
+                    return self.get_price_for_dates(origin, destination, date_from, date_to)
+                return self.get_price(origin, destination)
             
             logger.error(f"Не удалось распарсить маршрут: '{route}'")
             return None
             
+        except NoPriceData:
+            raise
         except Exception as e:
             logger.error(f"Ошибка в get_simple_price: {e}")
             return None
@@ -192,7 +326,10 @@ def test_parser():
     
     for route in test_routes:
         print(f"🔍 Маршрут: '{route}'")
-        price = parser.get_simple_price(route)
+        try:
+            price = parser.get_simple_price(route)
+        except NoPriceData:
+            price = None
         if price:
             print(f"   ✅ Цена: {price} руб.")
         else:
@@ -201,4 +338,6 @@ def test_parser():
 
 
 if __name__ == "__main__":
+    from utils.logger import setup_logger
+    setup_logger()
     test_parser()
\ No newline at end of file
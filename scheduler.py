@@ -0,0 +1,118 @@
+"""
+Адаптивное расписание проверки цен.
+
+Вместо одной проверки в день каждому маршруту назначается время следующей
+проверки (tracks.next_check_at). Интервал тем короче, чем:
+    - сильнее колеблется цена за последние дни (коэффициент вариации)
+    - больше пользователей следят за маршрутом
+    - ближе дата вылета
+Суммарное число запросов к API укладывается в дневной бюджет: если желаемые
+интервалы его превышают, все они пропорционально растягиваются, а за один
+проход проверяется не больше маршрутов, чем приходится на него из бюджета.
+"""
+
+import math
+import os
+import time
+from datetime import date
+from typing import Dict, List, Optional
+
+CHECK_BUDGET_PER_DAY = int(os.getenv("CHECK_BUDGET_PER_DAY", "2000"))
+CHECK_TICK_SECONDS = int(os.getenv("CHECK_TICK_SECONDS", "900"))
+
+DAY_SECONDS = 24 * 60 * 60
+MIN_INTERVAL = 60 * 60       # чаще раза в час не проверяем
+MAX_INTERVAL = DAY_SECONDS   # и не реже раза в день, как раньше
+VOLATILITY_WINDOW_DAYS = 14
+VOLATILITY_STEP = 0.05       # каждые 5% разброса цены - проверка на раз чаще
+SCALE_REFRESH_SECONDS = 6 * 60 * 60  # как часто пересчитывать растяжение под бюджет
+
+
+def days_until(date_from: Optional[str], today: Optional[date] = None) -> Optional[int]:
+    if not date_from:
+        return None
+    return (date.fromisoformat(date_from) - (today or date.today())).days
+
+
+def route_weight(subscribers: int, samples: int, mean: Optional[float],
+                 mean_sq: Optional[float], days_to_departure: Optional[int]) -> float:
+    """Во сколько раз маршрут стоит проверять чаще, чем раз в день"""
+    cv = 0.0
+    if samples >= 2 and mean:
+        cv = math.sqrt(max(mean_sq - mean * mean, 0.0)) / mean
+    volatility_factor = 1 + min(cv / VOLATILITY_STEP, 4)
+
+    subscriber_factor = 1 + math.log2(max(subscribers, 1))
+
+    if days_to_departure is None or days_to_departure < 0:
+        date_factor = 1
+    elif days_to_departure <= 7:
+        date_factor = 3
+    elif days_to_departure <= 30:
+        date_factor = 2
+    else:
+        date_factor = 1
+
+    return volatility_factor * subscriber_factor * date_factor
+
+
+def desired_intervals(inputs: List[tuple], today: Optional[date] = None) -> Dict[tuple, float]:
+    """Желаемые интервалы проверки в секундах без учета бюджета"""
+    desired = {}
+    for route_key, date_from, date_to, subscribers, samples, mean, mean_sq in inputs:
+        weight = route_weight(subscribers, samples, mean, mean_sq, days_until(date_from, today))
+        desired[(route_key, date_from, date_to)] = min(max(DAY_SECONDS / weight, MIN_INTERVAL), MAX_INTERVAL)
+    return desired
+
+
+def budget_scale(desired: Dict[tuple, float], budget: int = CHECK_BUDGET_PER_DAY) -> float:
+    """Во сколько раз растянуть интервалы всех маршрутов, чтобы уложиться в бюджет"""
+    calls_per_day = sum(DAY_SECONDS / interval for interval in desired.values())
+    return max(calls_per_day / budget, 1.0) if budget > 0 else 1.0
+
+
+def plan_intervals(inputs: List[tuple], budget: int = CHECK_BUDGET_PER_DAY,
+                   today: Optional[date] = None, scale: Optional[float] = None) -> Dict[tuple, float]:
+    """
+    Интервалы проверки в секундах для маршрутов из inputs.
+    inputs - строки Database.get_schedule_inputs().
+    scale - растяжение под бюджет (BudgetScale); без него считается по самим inputs,
+    поэтому тогда в inputs должны быть все маршруты.
+
+    Returns:
+        {(route_key, date_from, date_to): секунд до следующей проверки}
+    """
+    desired = desired_intervals(inputs, today)
+    if scale is None:
+        scale = budget_scale(desired, budget)
+    return {key: min(interval * scale, MAX_INTERVAL) for key, interval in desired.items()}
+
+
+class BudgetScale:
+    """
+    Растяжение интервалов под бюджет по всем маршрутам.
+
+    Для него нужна история всех маршрутов, а за проход проверяются
+    только те, кому пора: поэтому оно пересчитывается не чаще
+    раза в refresh_seconds, а между пересчетами берется запомненное.
+    """
+
+    def __init__(self, refresh_seconds: float = SCALE_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.value: Optional[float] = None
+        self.updated_at = 0.0
+
+    def is_stale(self) -> bool:
+        return self.value is None or time.monotonic() - self.updated_at >= self.refresh_seconds
+
+    def update(self, inputs: List[tuple], budget: int = CHECK_BUDGET_PER_DAY,
+               today: Optional[date] = None) -> float:
+        """inputs - строки Database.get_schedule_inputs() по всем маршрутам"""
+        self.value = budget_scale(desired_intervals(inputs, today), budget)
+        self.updated_at = time.monotonic()
+        return self.value
+
+
+def tick_limit(budget: int = CHECK_BUDGET_PER_DAY, tick_seconds: int = CHECK_TICK_SECONDS) -> int:
+    """Сколько маршрутов можно проверить за один проход, не выходя из бюджета"""
+    return max(math.ceil(budget * tick_seconds / DAY_SECONDS), 1)
@@ -0,0 +1,78 @@
+import asyncio
+from typing import Dict, Hashable, List, Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+# Лимит семафора базового класса: реальный общий лимит PerUserUpdateProcessor
+# занимает сам, после очереди пользователя
+UNBOUNDED_UPDATES = 1 << 20
+
+
+def update_key(update: object) -> Optional[Hashable]:
+    """Ключ последовательной обработки: пользователь, а если его нет - чат"""
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return ("user", user.id)
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return ("chat", chat.id)
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка апдейтов разных пользователей.
+    
+    Апдейты одного пользователя выполняются строго по очереди
+    (asyncio.Lock выдает доступ в порядке ожидания), поэтому состояние
+    ConversationHandler и записи в базу пользователя не перемешиваются.
+    Блокировки создаются по требованию и удаляются, когда очередь пуста.
+    
+    Общий лимит max_concurrent_updates (limit) занимается только после очереди
+    пользователя: апдейты, ждущие предыдущих апдейтов того же пользователя,
+    места не держат, и частые нажатия одного пользователя не тормозят остальных.
+    Поэтому лимит свой, а семафор базового класса (его process_update
+    помечен @final и берет семафор до do_process_update) практически не ограничен.
+    """
+    
+    def __init__(self, max_concurrent_updates: int = 256):
+        super().__init__(UNBOUNDED_UPDATES)
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates должен быть положительным")
+        self.limit = max_concurrent_updates
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # ключ -> [блокировка, число апдейтов, ждущих или выполняющихся]
+        self._locks: Dict[Hashable, List] = {}
+    
+    @property
+    def active_keys(self) -> int:
+        return len(self._locks)
+    
+    async def do_process_update(self, update: object, coroutine) -> None:
+        key = update_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+        
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                # Место в общем лимите - только когда подошла очередь пользователя
+                await self._run(coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+    
+    async def _run(self, coroutine) -> None:
+        async with self._slots:
+            await coroutine
+    
+    async def initialize(self) -> None:
+        pass
+    
+    async def shutdown(self) -> None:
+        pass
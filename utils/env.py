@@ -0,0 +1,10 @@
+_loaded = False
+
+
+def load_env():
+    """Загружает .env один раз, при первой необходимости"""
+    global _loaded
+    if not _loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _loaded = True
@@ -0,0 +1,46 @@
+import threading
+
+
+class LazyProxy:
+    """
+    Объект, который создается при первом обращении к атрибуту.
+    
+    Позволяет держать глобальные экземпляры (db, парсер) в модулях,
+    не открывая базу и не загружая тяжелые зависимости при импорте.
+    """
+    
+    __slots__ = ("_lazy_factory", "_lazy_value", "_lazy_lock")
+    
+    def __init__(self, factory):
+        object.__setattr__(self, "_lazy_factory", factory)
+        object.__setattr__(self, "_lazy_value", None)
+        object.__setattr__(self, "_lazy_lock", threading.Lock())
+    
+    def _lazy_get(self):
+        value = object.__getattribute__(self, "_lazy_value")
+        if value is None:
+            with object.__getattribute__(self, "_lazy_lock"):
+                value = object.__getattribute__(self, "_lazy_value")
+                if value is None:
+                    value = object.__getattribute__(self, "_lazy_factory")()
+                    object.__setattr__(self, "_lazy_value", value)
+        return value
+    
+    def __getattr__(self, name):
+        return getattr(self._lazy_get(), name)
+    
+    def __setattr__(self, name, value):
+        setattr(self._lazy_get(), name, value)
+    
+    def __repr__(self):
+        value = object.__getattribute__(self, "_lazy_value")
+        if value is None:
+            return "<LazyProxy (не создан)>"
+        return f"<LazyProxy {value!r}>"
+
+
+def is_initialized(obj) -> bool:
+    """Создан ли уже объект за прокси (для обычных объектов всегда True)"""
+    if isinstance(obj, LazyProxy):
+        return object.__getattribute__(obj, "_lazy_value") is not None
+    return True
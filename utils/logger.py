@@ -1,21 +1,165 @@
-import logging
 import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+from utils.lazy import is_initialized
+from utils.rate_limit import TokenBucket
+
+# Сколько одинаковых сообщений (по шаблону) пропускать за окно, остальные - в счетчик
+LOG_SAMPLE_LIMIT = int(os.getenv("LOG_SAMPLE_LIMIT", "20"))
+LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "60"))
+
+_listener: Optional[QueueListener] = None
+_sampler: Optional["SamplingFilter"] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created))
+                  + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        dropped = getattr(record, 'sampled_dropped', 0)
+        if dropped:
+            entry['dropped'] = dropped
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Ограничивает частоту повторяющихся сообщений уровня INFO и ниже.
+
+    Сообщения группируются по шаблону (logger.info("Запрос к API: %s → %s", ...)),
+    поэтому одно и то же сообщение по разным маршрутам - одна группа.
+    На группу - ведро токенов: LOG_SAMPLE_LIMIT сообщений за LOG_SAMPLE_WINDOW секунд.
+    Отброшенные считаются; первое пропущенное после паузы сообщение
+    несет число отброшенных перед ним (поле dropped).
+    """
+
+    def __init__(self, limit: int = LOG_SAMPLE_LIMIT, window: float = LOG_SAMPLE_WINDOW):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._buckets: Dict[tuple, TokenBucket] = {}
+        self._pending: Dict[tuple, int] = {}
+        self.dropped: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or self.limit <= 0:
+            return True
+
+        key = (record.name, record.msg)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.limit, self.window / self.limit)
+            if not bucket.try_consume():
+                self._pending[key] = self._pending.get(key, 0) + 1
+                template = str(record.msg)
+                self.dropped[template] = self.dropped.get(template, 0) + 1
+                return False
+            record.sampled_dropped = self._pending.pop(key, 0)
+        return True
+
+    @property
+    def total_dropped(self) -> int:
+        return sum(self.dropped.values())
+
 
 def setup_logger():
-    """Настройка логирования"""
-    logging.basicConfig(
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        level=logging.INFO
-    )
+    """
+    Настройка логирования (один раз на процесс).
+
+    Записи кладутся в очередь и пишутся фоновым потоком, поэтому вызов
+    logger.info() не ждет вывода. Формат - JSON (LOG_FORMAT=text - обычный текст),
+    уровень - LOG_LEVEL (INFO по умолчанию).
+    """
+    global _listener, _sampler
+
+    root = logging.getLogger()
+    if _listener is not None:
+        return logging.getLogger(__name__)
+
+    output = logging.StreamHandler()
+    if os.getenv("LOG_FORMAT", "json") == "text":
+        output.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    else:
+        output.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _RecordQueueHandler(log_queue)
+    _sampler = SamplingFilter()
+    queue_handler.addFilter(_sampler)
+
+    root.handlers = [queue_handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    # Болтливые библиотеки - только предупреждения
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logger)
     return logging.getLogger(__name__)
 
+
+def shutdown_logger():
+    """Пишем итог по отброшенным сообщениям и дожидаемся вывода очереди"""
+    global _listener
+    if _listener is None:
+        return
+    if _sampler is not None and _sampler.total_dropped:
+        logging.getLogger(__name__).warning(
+            "Отброшено повторяющихся сообщений: %s", _sampler.total_dropped
+        )
+    _listener.stop()
+    _listener = None
+
+
+def get_dropped_counts() -> Dict[str, int]:
+    """Сколько сообщений каждого шаблона отброшено с начала работы"""
+    return dict(_sampler.dropped) if _sampler is not None else {}
+
+
+class _RecordQueueHandler(QueueHandler):
+    """
+    Кладет в очередь саму запись: сообщение форматируется уже в фоновом
+    потоке, а не в вызывающем коде.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # Трассировку снимаем сейчас, чтобы не держать в очереди кадры стека
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
 def setup_cleanup(db):
     """Настройка очистки при выходе"""
     def cleanup():
+        # Не открываем базу только ради того, чтобы ее закрыть
+        if not is_initialized(db):
+            return
         try:
-            db.conn.close()
+            db.close()
             print("✅ База данных закрыта корректно")
         except:
             pass
-    
-    atexit.register(cleanup)
\ No newline at end of file
+
+    atexit.register(cleanup)
@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+DEFAULT_CHECK_CAPACITY = int(os.getenv("CHECK_QUOTA_CAPACITY", "3"))
+DEFAULT_CHECK_REFILL_SECONDS = float(os.getenv("CHECK_QUOTA_REFILL_SECONDS", "600"))
+MIN_REFILL_SECONDS = 60  # персональный лимит: не меньше одной проверки в минуту
+QUOTA_SWEEP_SECONDS = 600  # как часто убирать из памяти полные ведра
+
+
+class TokenBucket:
+    """Ведро токенов: capacity проверок подряд, один токен за refill_seconds"""
+    
+    __slots__ = ("capacity", "refill_seconds", "tokens", "updated_at")
+    
+    def __init__(self, capacity: int, refill_seconds: float,
+                 tokens: Optional[float] = None, updated_at: Optional[float] = None):
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self.tokens = float(capacity) if tokens is None else tokens
+        self.updated_at = time.time() if updated_at is None else updated_at
+    
+    def _refill(self, now: float):
+        if self.refill_seconds > 0 and now > self.updated_at:
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated_at) / self.refill_seconds)
+        self.updated_at = now
+    
+    def try_consume(self, now: Optional[float] = None) -> bool:
+        self._refill(time.time() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+    
+    def retry_after(self, now: Optional[float] = None) -> float:
+        """Через сколько секунд появится следующий токен"""
+        self._refill(time.time() if now is None else now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.refill_seconds
+    
+    def is_full(self, now: Optional[float] = None) -> bool:
+        self._refill(time.time() if now is None else now)
+        return self.tokens >= self.capacity
+
+
+class QuotaManager:
+    """
+    Квоты пользователей на ручную проверку цен.
+    
+    Ведра хранятся в памяти. Если передан store (Database), персональные
+    лимиты от админов сохраняются в базе, а уровни ведер можно сохранить
+    при остановке (save_state) и восстановить при следующем обращении.
+    
+    Полные ведра раз в QUOTA_SWEEP_SECONDS удаляются из памяти: при
+    следующей проверке они создаются заново по умолчанию или из store.
+    """
+    
+    def __init__(self, capacity: int = DEFAULT_CHECK_CAPACITY,
+                 refill_seconds: float = DEFAULT_CHECK_REFILL_SECONDS, store=None):
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self.store = store
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._swept_at = time.time()
+    
+    def _bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is not None:
+            return bucket
+        
+        capacity, refill_seconds = self.capacity, self.refill_seconds
+        tokens = updated_at = None
+        saved = self.store.get_user_quota(user_id) if self.store is not None else None
+        if saved:
+            capacity = saved['capacity'] or capacity
+            refill_seconds = saved['refill_seconds'] or refill_seconds
+            tokens, updated_at = saved['tokens'], saved['updated_at']
+        
+        bucket = self._buckets[user_id] = TokenBucket(capacity, refill_seconds, tokens, updated_at)
+        return bucket
+    
+    def try_acquire(self, user_id: int) -> Tuple[bool, float]:
+        """Списывает одну проверку. Возвращает (разрешено, секунд до следующей)"""
+        with self._lock:
+            now = time.time()
+            if now - self._swept_at >= QUOTA_SWEEP_SECONDS:
+                self._evict_full(now)
+            bucket = self._bucket(user_id)
+            if bucket.try_consume(now):
+                return True, 0.0
+            return False, bucket.retry_after(now)
+    
+    def _evict_full(self, now: float) -> int:
+        """Удаляет полные ведра - их состояние совпадает с новым ведром"""
+        self._swept_at = now
+        evicted = [
+            user_id for user_id, bucket in self._buckets.items()
+            if bucket.is_full(now) and (
+                # Без store персональный лимит есть только в ведре - его не трогаем
+                self.store is not None
+                or (bucket.capacity, bucket.refill_seconds) == (self.capacity, self.refill_seconds)
+            )
+        ]
+        for user_id in evicted:
+            del self._buckets[user_id]
+        return len(evicted)
+    
+    @property
+    def active_buckets(self) -> int:
+        return len(self._buckets)
+    
+    def set_limit(self, user_id: int, capacity: int, refill_seconds: float):
+        """Персональный лимит пользователя (ведро сразу заполняется)"""
+        if capacity < 1 or refill_seconds < MIN_REFILL_SECONDS:
+            raise ValueError(
+                f"Лимит: не меньше 1 проверки и {MIN_REFILL_SECONDS} с на новую проверку"
+            )
+        with self._lock:
+            self._buckets[user_id] = TokenBucket(capacity, refill_seconds)
+            if self.store is not None:
+                self.store.set_user_quota(user_id, capacity, refill_seconds)
+    
+    def reset_limit(self, user_id: int):
+        """Возвращает пользователю лимит по умолчанию"""
+        with self._lock:
+            self._buckets.pop(user_id, None)
+            if self.store is not None:
+                self.store.delete_user_quota(user_id)
+    
+    def save_state(self):
+        """Сохраняет уровни ведер в store"""
+        if self.store is None:
+            return
+        with self._lock:
+            self.store.save_quota_states([
+                (user_id, bucket.tokens, bucket.updated_at)
+                for user_id, bucket in self._buckets.items()
+            ])
@@ -0,0 +1,231 @@
+import re
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+# Разделители в порядке приоритета: сначала тире с пробелами,
+# чтобы не разрезать города с дефисом ("Санкт-Петербург - Пекин")
+ROUTE_SEPARATORS = [" – ", " — ", " - ", "–", "—", "-"]
+
+def split_route(route: str) -> Optional[Tuple[str, str]]:
+    """Разбивает строку "Москва-Сочи" на (город отправления, город назначения)"""
+    route = route.strip()
+    
+    cities = split_legs(route)
+    if cities and len(cities) == 2:
+        return cities[0], cities[1]
+    
+    for sep in ROUTE_SEPARATORS:
+        if sep in route:
+            parts = route.split(sep)
+            if len(parts) == 2:
+                return parts[0].strip(), parts[1].strip()
+    
+    # Если не нашли стандартные разделители, ищем последний дефис
+    # (для случаев типа "Санкт-Петербург-Пекин")
+    if "-" in route:
+        route_lower = route.lower()
+        if route_lower.startswith("санкт-петербург"):
+            return "Санкт-Петербург", route[len("Санкт-Петербург"):].strip("- ")
+        if route_lower.endswith("санкт-петербург"):
+            return route[:-len("Санкт-Петербург")].strip("- "), "Санкт-Петербург"
+        
+        last_dash = route.rfind("-")
+        if last_dash > 0:
+            return route[:last_dash].strip(), route[last_dash + 1:].strip()
+    
+    return None
+
+# Города с дефисом в названии: в "Сочи-Ростов-на-Дону" дефис внутри города - не разделитель
+HYPHENATED_CITIES = (
+    "санкт-петербург", "ростов-на-дону", "улан-удэ", "ханты-мансийск",
+    "южно-сахалинск", "петропавловск-камчатский", "нарьян-мар",
+)
+
+# Сколько перелетов может быть в одном маршруте (Москва-Сочи-Казань-Москва - 3)
+MAX_LEGS = 4
+
+def split_legs(route: str) -> Optional[List[str]]:
+    """
+    Разбивает маршрут на города: "Москва-Сочи-Москва" -> ["Москва", "Сочи", "Москва"].
+    Для обычного маршрута - два города, как split_route.
+    """
+    route = route.strip()
+    
+    for sep in ROUTE_SEPARATORS[:-1]:
+        if sep in route:
+            cities = [city.strip() for city in route.split(sep)]
+            return cities if len(cities) >= 2 and all(cities) else None
+    
+    tokens = route.split("-")
+    if len(tokens) < 2:
+        return None
+    
+    # Склеиваем обратно части городов с дефисом (самое длинное совпадение)
+    cities = []
+    i = 0
+    while i < len(tokens):
+        for j in range(len(tokens), i + 1, -1):
+            if "-".join(tokens[i:j]).strip().lower() in HYPHENATED_CITIES:
+                cities.append("-".join(tokens[i:j]).strip())
+                i = j
+                break
+        else:
+            cities.append(tokens[i].strip())
+            i += 1
+    
+    return cities if len(cities) >= 2 and all(cities) else None
+
+def route_legs(route: str) -> List[str]:
+    """Перелеты маршрута: "Москва-Сочи-Москва" -> ["Москва - Сочи", "Сочи - Москва"]"""
+    cities = split_legs(route)
+    if not cities or len(cities) <= 2:
+        return [route]
+    return [f"{origin} - {destination}" for origin, destination in zip(cities, cities[1:])]
+
+def leg_dates(legs: int, date_from: Optional[str],
+              date_to: Optional[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Даты вылета каждого перелета. У маршрута из нескольких перелетов
+    date_from - вылет первого, date_to - вылет последнего (обратно),
+    промежуточные - в любой день между ними. Если задана одна дата -
+    по ней ищется только первый перелет, остальные - без дат.
+    """
+    if legs == 1:
+        return [(date_from, date_to)]
+    if not date_from:
+        return [(None, None)] * legs
+    if not date_to:
+        return [(date_from, None)] + [(None, None)] * (legs - 1)
+    return ([(date_from, None)] + [(date_from, date_to)] * (legs - 2)
+            + [(date_to, None)])
+
+def route_kind(route: str) -> str:
+    """'oneway', 'roundtrip' (A-B-A) или 'multi' (A-B-C...)"""
+    cities = split_legs(route)
+    if not cities or len(cities) <= 2:
+        return "oneway"
+    if len(cities) == 3 and _normalize_city(cities[0]) == _normalize_city(cities[2]):
+        return "roundtrip"
+    return "multi"
+
+def _normalize_city(city: str) -> str:
+    return " ".join(city.lower().replace("ё", "е").split())
+
+def canonical_route(route: str) -> str:
+    """Ключ маршрута: одинаковый для "Москва - Сочи", "москва–сочи" и т.п."""
+    cities = split_legs(route)
+    if not cities:
+        return _normalize_city(route)
+    return "-".join(_normalize_city(city) for city in cities)
+
+_DATE = r"\d{4}-\d{2}-\d{2}|\d{1,2}\.\d{1,2}\.\d{4}"
+_MONTH = r"\d{4}-\d{2}|\d{1,2}\.\d{4}"
+_DATES_SUFFIX = re.compile(
+    rf"\s+(?P<start>{_DATE})(?:\s*(?:\.\.|–|—|-)\s*(?P<end>{_DATE}))?$"
+    rf"|\s+(?P<month>{_MONTH})$"
+)
+
+def _parse_date(text: str) -> date:
+    if "." in text:
+        return datetime.strptime(text, "%d.%m.%Y").date()
+    return date.fromisoformat(text)
+
+def parse_track_input(text: str) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    Отделяет даты вылета от маршрута.
+    
+    Поддерживаемые форматы:
+        "Москва-Сочи"                          - без даты
+        "Москва-Сочи 2026-11-20" / "20.11.2026"  - конкретная дата
+        "Москва-Сочи 20.11.2026-25.11.2026"    - диапазон дат
+        "Москва-Сочи 2026-11" / "11.2026"        - весь месяц
+    
+    Returns:
+        (маршрут, дата с YYYY-MM-DD или None, дата по YYYY-MM-DD или None)
+    
+    Raises:
+        ValueError: если дата некорректна или диапазон перевернут
+    """
+    text = text.strip()
+    match = _DATES_SUFFIX.search(text)
+    if not match:
+        return text, None, None
+    
+    route = text[:match.start()].strip()
+    if match.group("month"):
+        month = match.group("month")
+        if "." in month:
+            start = datetime.strptime(month, "%m.%Y").date()
+        else:
+            start = datetime.strptime(month, "%Y-%m").date()
+        end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    else:
+        start = _parse_date(match.group("start"))
+        end = _parse_date(match.group("end")) if match.group("end") else None
+    
+    if end is not None and end < start:
+        raise ValueError("Дата окончания раньше даты начала")
+    if end == start:
+        end = None
+    
+    return route, start.isoformat(), end.isoformat() if end else None
+
+# Маршруты в одном сообщении: по одному в строке, через запятую или ";"
+_TRACK_LIST_SEPARATORS = re.compile(r"[\n,;]+")
+
+def parse_track_list(text: str) -> Tuple[List[Tuple[str, Optional[str], Optional[str]]], List[str]]:
+    """
+    Разбирает список маршрутов из одного сообщения за один проход.
+    Повторы (с учетом написания маршрута, см. canonical_route) отбрасываются.
+    
+    Returns:
+        ([(маршрут, дата с, дата по), ...], [нераспознанные строки])
+    """
+    tracks = []
+    invalid = []
+    seen = set()
+    
+    for line in _TRACK_LIST_SEPARATORS.split(text):
+        line = line.strip()
+        if not line:
+            continue
+        
+        try:
+            route, date_from, date_to = parse_track_input(line)
+        except ValueError:
+            invalid.append(line)
+            continue
+        
+        cities = split_legs(route)
+        if not cities or len(cities) > MAX_LEGS + 1 or any(
+                _normalize_city(a) == _normalize_city(b) for a, b in zip(cities, cities[1:])):
+            invalid.append(line)
+            continue
+        
+        key = (canonical_route(route), date_from, date_to)
+        if key not in seen:
+            seen.add(key)
+            tracks.append((route, date_from, date_to))
+    
+    return tracks, invalid
+
+def format_dates(date_from: Optional[str], date_to: Optional[str]) -> str:
+    """Даты вылета для сообщений: "20.11.2026" или "20.11.2026–25.11.2026" """
+    if not date_from:
+        return ""
+    
+    start = date.fromisoformat(date_from).strftime("%d.%m.%Y")
+    if not date_to:
+        return start
+    return f"{start}–{date.fromisoformat(date_to).strftime('%d.%m.%Y')}"
+
+ROUTE_KIND_LABELS = {"roundtrip": "🔁 туда-обратно", "multi": "🧭 несколько перелетов"}
+
+def format_track_route(track: dict) -> str:
+    """Маршрут с датами вылета, если они заданы"""
+    route = track['route']
+    label = ROUTE_KIND_LABELS.get(route_kind(route))
+    if label:
+        route = f"{route} ({label})"
+    dates = format_dates(track.get('date_from'), track.get('date_to'))
+    return f"{route} 📅 {dates}" if dates else route
@@ -0,0 +1,112 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+TRACK_CACHE_USERS = int(os.getenv("TRACK_CACHE_USERS", "10000"))
+
+
+class TrackRecord:
+    """
+    Активный маршрут пользователя в кэше.
+
+    Поддерживает обращение как к словарю (track['route'], track.get(...)),
+    чтобы обработчики работали с ним так же, как раньше с dict из базы.
+    """
+
+    __slots__ = ("id", "route", "route_key", "min_price", "last_check",
+                 "created_at", "date_from", "date_to")
+
+    def __init__(self, id, route, route_key, min_price, last_check,
+                 created_at, date_from, date_to):
+        self.id = id
+        self.route = route
+        self.route_key = route_key
+        self.min_price = min_price
+        self.last_check = last_check
+        self.created_at = created_at
+        self.date_from = date_from
+        self.date_to = date_to
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __repr__(self):
+        return f"<TrackRecord #{self.id} {self.route}>"
+
+
+class TrackCache:
+    """
+    Ограниченный LRU-кэш активных маршрутов пользователей.
+
+    Сквозная запись: методы базы, меняющие маршруты, сразу обновляют
+    или сбрасывают кэш, поэтому повторные нажатия кнопок меню
+    обходятся без запросов к SQLite.
+    """
+
+    def __init__(self, max_users: int = TRACK_CACHE_USERS):
+        self.max_users = max_users
+        self._users: "OrderedDict[int, List[TrackRecord]]" = OrderedDict()
+        self._owners: Dict[int, int] = {}  # track_id -> user_id для закэшированных
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, user_id: int) -> Optional[List[TrackRecord]]:
+        """Копия списка маршрутов пользователя или None, если его нет в кэше"""
+        with self._lock:
+            records = self._users.get(user_id)
+            if records is None:
+                self.misses += 1
+                return None
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return list(records)
+
+    def put(self, user_id: int, records: List[TrackRecord]):
+        with self._lock:
+            self._drop(user_id)
+            self._users[user_id] = list(records)
+            for record in records:
+                self._owners[record.id] = user_id
+            while len(self._users) > self.max_users:
+                self._drop(next(iter(self._users)))
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._drop(user_id)
+
+    def remove_track(self, track_id: int):
+        """Маршрут деактивирован - убираем его из списка владельца"""
+        with self._lock:
+            user_id = self._owners.pop(track_id, None)
+            if user_id is not None:
+                self._users[user_id] = [r for r in self._users[user_id] if r.id != track_id]
+
+    def update_price(self, track_id: int, price: float, checked_at: str):
+        """Новая цена маршрута - обновляем запись на месте"""
+        with self._lock:
+            user_id = self._owners.get(track_id)
+            if user_id is None:
+                return
+            for record in self._users[user_id]:
+                if record.id == track_id:
+                    if record.min_price is None or price < record.min_price:
+                        record.min_price = price
+                    record.last_check = checked_at
+                    break
+
+    def _drop(self, user_id: int):
+        for record in self._users.pop(user_id, ()):
+            self._owners.pop(record.id, None)